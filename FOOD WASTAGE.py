@@ -1,15 +1,177 @@
+import logging
+
 import streamlit as st
-import psycopg2
 import pandas as pd
+from datetime import date, datetime
+
+import perf
+
+logger = logging.getLogger(__name__)
+
+# A single rerun can be profiled from the hidden performance page (see perf.py)
+profiler = perf.start_profile() if st.session_state.pop("profile_next_run", False) else None
 
 # ------------------------ DB Connection ------------------------
-def get_connection():
-    return psycopg2.connect(
-        host='localhost',
-        database='food_waste',
-        user='postgres',
-        password='POSTGRESQL'  # 🔁 Change this if your password is different
-    )
+# Connections come from one pool shared by every session in this process (see db.py),
+# so a rerun checks out an already-open connection instead of reconnecting.
+from db import pool_stats
+from queries import REGISTRY
+from query_cache import invalidate_table, cache_stats
+from parallel_queries import PREWARM, QueryBatch, start_prewarm
+from columnar import ANALYTICS_BACKEND, BACKENDS, get_backend
+from query_runner import new_run, guarded_connection, run_query
+from replicas import WritePosition, router_stats, set_position, write_connection
+from expiry_sweeper import SWEEPER_IN_APP, start_background, get_sweeper
+from timeseries import FREQUENCIES, get_store, trends
+from live_updates import LIVE_UPDATES, LIVE_POLL, start_listener, patch_rows
+from listing_search import SEARCH_LIMIT, search_listings, listing_details, remember
+from bulk_listings import FOOD_TYPES, MEAL_TYPES, REQUIRED_COLUMNS, apply_batch
+from summaries import (ensure_summaries, returned_listing, lock_listing, listing_added,
+                       listing_changed, listing_removed)
+from table_browser import (BROWSABLE_TABLES, table_columns, column_bounds, distinct_values,
+                           count_rows, fetch_page)
+from table_frames import date_only
+
+# Every read is bounded by query_runner (statement timeout, row budget). A new run of this
+# session's script (the user clicked elsewhere) cancels whatever the previous run still has running.
+st.session_state.query_run = new_run(st.session_state.get("query_run"))
+
+# Writes go to the primary and reads to a read replica where configured; once this session
+# has written, its reads wait for a replica that has replayed its writes (see replicas.py).
+set_position(st.session_state.setdefault("write_position", WritePosition()))
+
+# Analytics summary tables are created and populated once per process (see summaries.py);
+# if the database is unreachable here, each page reports the error itself. A failure is
+# logged on every rerun that retries it, and shown to a session once.
+try:
+    ensure_summaries()
+except Exception as e:
+    logger.exception("Could not set up the analytics summary tables")
+    if not st.session_state.get("summaries_warned"):
+        st.session_state.summaries_warned = True
+        st.warning(f"⚠️ Analytics summaries are not available yet: {e}")
+
+# Optional background thread expiring listings past their Expiry_Date (see expiry_sweeper.py)
+if SWEEPER_IN_APP:
+    start_background()
+
+# Optional background run of every canned query at startup, so first page views hit the cache
+if PREWARM:
+    start_prewarm(REGISTRY)
+
+# Row changes from every process arrive through one listener thread, which invalidates the
+# result cache and fills each session's mailbox (see live_updates.py)
+if LIVE_UPDATES:
+    listener = start_listener()
+    if "changes" not in st.session_state:
+        st.session_state.changes = listener.subscribe()
+
+
+@st.fragment(run_every=LIVE_POLL)
+def watch_changes(table):
+    """Rerun the page once changes to ``table`` reach this session; only the mailbox is checked."""
+    if st.session_state.changes.pending(table):
+        st.rerun()
+
+# ------------------------ Result rendering ------------------------
+def show_truncation(df):
+    """Note results cut short by the query_runner row/byte budget."""
+    if df.attrs.get("truncated"):
+        st.warning(f"⚠️ Showing only the first {len(df):,} rows; the full result is larger than the configured limit.")
+
+
+def show_custom_result(df, plot):
+    """Table plus the chart configured for a Custom SQL query (``plot`` is its PlotSpec)."""
+    if df.empty:
+        st.info("No results found for this query.")
+        return
+    st.dataframe(df)
+    show_truncation(df)
+
+    # Generate Visualization
+    if plot is None:
+        return
+    if plot.kind == "bar" and plot.x and plot.y:
+        # For st.bar_chart, set the x column as index
+        st.bar_chart(df.set_index(plot.x)[[plot.y]])
+        st.caption(plot.title) # Using caption for title
+    elif plot.kind == "metric":
+        st.metric(label=plot.title, value=df.iloc[0, 0])
+
+
+def query_inputs(query, key):
+    """One input per declared parameter of ``query``; returns ``{name: value}``."""
+    values = {}
+    for param in query.params:
+        widget_key = f"{key}_{param.name}"
+        if param.kind is date:
+            values[param.name] = st.date_input(param.label, value=param.default, key=widget_key)
+        elif param.kind in (int, float):
+            values[param.name] = st.number_input(param.label, value=param.default, key=widget_key)
+        else:
+            values[param.name] = st.text_input(param.label, value=param.default or "", key=widget_key)
+    return values
+
+
+def pick_backend(key, backends=tuple(BACKENDS)):
+    """Where an analytics query runs: the live database or the columnar snapshot (see columnar.py)."""
+    backends = list(backends)
+    default = backends.index(ANALYTICS_BACKEND) if ANALYTICS_BACKEND in backends else 0
+    backend = st.radio("Run on", backends, index=default, format_func=BACKENDS.get, horizontal=True, key=key)
+    if backend == "duckdb":
+        st.caption("Results come from an offline copy of the data, not the live database.")
+    return backend
+
+
+def show_backend_source(backend):
+    if backend == "duckdb" and get_backend().description:
+        st.caption(f"🦆 Read from the {get_backend().description}")
+
+
+# ------------------------ Listing picker ------------------------
+def pick_listing(key):
+    """Food ID picker: a search box and at most SEARCH_LIMIT matches per page; returns the chosen food_id or None.
+
+    The search runs when the box is submitted (Enter or leaving the field), not on every character.
+    With an empty box the session's recently viewed listings are offered instead.
+    """
+    recent = st.session_state.setdefault("recent_listings", [])
+    labels = st.session_state.setdefault("listing_labels", {})
+    term = st.text_input("Search by Food ID, food name, provider or location", key=f"{key}_search",
+                         placeholder="e.g. 1042, Bread, Port Carl")
+    if st.session_state.get(f"{key}_term") != term:
+        st.session_state[f"{key}_term"] = term
+        st.session_state[f"{key}_page"] = 1
+    page = st.session_state.get(f"{key}_page", 1)
+
+    if not term.strip():
+        if not recent:
+            st.caption("Type at least part of a name, provider or location to find a listing.")
+            return None
+        options = list(recent)
+        st.caption("Recently viewed listings")
+    else:
+        results = search_listings(term, page=page - 1)
+        if results is None:
+            st.caption("Type at least two characters (or a Food ID).")
+            return None
+        if results.empty and page == 1:
+            st.info("No listings match that search.")
+            return None
+        for row in results.itertuples():
+            labels[row.food_id] = f"{row.food_id} — {row.food_name}, {row.provider} ({row.location}), expires {row.expiry_date}"
+        options = results["food_id"].tolist()
+        if results.attrs["more"] or page > 1:
+            st.number_input(f"Results page ({SEARCH_LIMIT} per page)", min_value=1,
+                            max_value=page + int(results.attrs["more"]), key=f"{key}_page")
+        if not options:
+            return None
+
+    food_id = st.selectbox("Listing", options, key=f"{key}_choice",
+                           format_func=lambda food_id: labels.get(food_id, str(food_id)))
+    remember(recent, food_id)
+    return food_id
+
 
 # ------------------------ Sidebar ------------------------
 st.sidebar.title("🧭 Navigation")
@@ -19,8 +181,51 @@ page = st.sidebar.radio("Go to:", [
     "🛠️ CRUD Operations",
     "📊 SQL Analysis",
     "🧠 Custom SQL",
+    "🗂️ Insights Overview",
+    "📈 Trends",
     "👤 About Creator"
-])
+] + (["⏱️ Performance"] if st.query_params.get("perf") == "1" else []))  # hidden unless ?perf=1 is in the URL
+perf.begin_page(page)
+
+# ------------------------ Diagnostics ------------------------
+with st.sidebar.expander("🩺 Diagnostics"):
+    stats = pool_stats()
+    st.caption("Connection pool")
+    st.write(f"In use: {stats['in_use']} / {stats['max_size']} (idle: {stats['idle']})")
+    st.write(f"Checkouts: {stats['checkouts']}")
+    st.write(f"Avg wait: {stats['wait_time_avg'] * 1000:.1f} ms (max: {stats['wait_time_max'] * 1000:.1f} ms)")
+    st.write(f"Pool exhausted: {stats['exhausted']} times")
+    st.write(f"Recycled connections: {stats['discarded']}")
+
+    stats = cache_stats()
+    st.caption("Query result cache")
+    st.write(f"Hits: {stats['hits']} / Misses: {stats['misses']} ({stats['hit_rate']:.0%} hit rate)")
+    st.write(f"Entries: {stats['entries']} ({stats['bytes'] / 1024 / 1024:.1f} of {stats['max_bytes'] / 1024 / 1024:.0f} MB)")
+    st.write(f"Evictions: {stats['evictions']} / Invalidations: {stats['invalidations']}")
+
+    if LIVE_UPDATES:
+        stats = listener.stats()
+        st.caption("Live updates")
+        st.write(f"Listening: {'yes' if stats['connected'] else stats['error'] or 'no'} ({stats['sessions']} sessions)")
+        st.write(f"Changes received: {stats['notifications']} / Reconnects: {stats['reconnects']}")
+
+    stats = router_stats()
+    if stats is not None:
+        st.caption("Read replicas")
+        st.write(f"Reads on replicas: {stats['replica_reads']} / on the primary: {stats['primary_reads']}")
+        st.write(f"Skipped: {stats['behind']} behind a write, {stats['lagging']} lagging, "
+                 f"{stats['unavailable']} unavailable")
+        for replica in stats["replicas"]:
+            state = replica["error"] or (f"lag {replica['lag']:.1f}s" if replica["lag"] is not None else "lag unknown")
+            st.write(f"{replica['address']}: {state}")
+
+    if SWEEPER_IN_APP:
+        stats = get_sweeper().stats()
+        st.caption("Expiry sweeper")
+        st.write(f"Swept through: {stats['swept_through']} (next due: {stats['next_due']})")
+        st.write(f"Expired: {stats['listings_expired']} / Wasted: {stats['quantity_wasted']} units")
+        st.write(f"Pending claims cancelled: {stats['claims_cancelled']}")
+        st.write(f"Last tick: {stats['last_tick_ms']:.0f} ms")
 
 # ------------------------ Page 1: Introduction ------------------------
 if page == "🏠 Project Introduction":
@@ -43,34 +248,34 @@ if page == "🏠 Project Introduction":
 # ------------------------ Page 2: View Tables ------------------------
 elif page == "📄 View Tables":
     st.title("📄 View Data Tables")
-    table = st.selectbox("Choose a table to view", ["providers", "receivers", "food_listings", "claims"])
-    
+    table = st.selectbox("Choose a table to view", list(BROWSABLE_TABLES))
+    perf.set_key(f"View Tables: {table}")
+
     try:
-        conn = get_connection()
-        df = pd.read_sql(f"SELECT * FROM {table}", conn)
-        conn.close()
+        with guarded_connection(tables=[table]) as conn:
+            # Filters become a parameterized WHERE clause; only the visible page is fetched.
+            column_kinds = dict(table_columns(conn, table))
 
-        if not df.empty:
             st.subheader(f"Data from '{table}' table")
-            
+
             # --- Column Filters ---
             st.subheader("📊 Filter Data")
-            
-            # Get list of all columns
-            all_columns = df.columns.tolist()
-            
+
             # Allow user to select columns to filter
-            columns_to_filter = st.multiselect("Select columns to apply filters", all_columns)
-            
-            filtered_df = df.copy() # Start with a copy to apply filters
+            columns_to_filter = st.multiselect("Select columns to apply filters", list(column_kinds))
+
+            filters = []
 
             for col in columns_to_filter:
-                col_type = filtered_df[col].dtype
+                kind = column_kinds[col]
+
+                if kind == "numeric":
+                    min_val, max_val = column_bounds(conn, table, col)
+                    if min_val is None:
+                        st.info(f"Column '{col}' has no values for filtering.")
+                        continue
+                    min_val, max_val = float(min_val), float(max_val)
 
-                if pd.api.types.is_numeric_dtype(col_type):
-                    min_val = float(filtered_df[col].min())
-                    max_val = float(filtered_df[col].max())
-                    
                     # Ensure min_val and max_val are distinct for slider to work correctly
                     if min_val == max_val:
                         st.info(f"Column '{col}' has only one unique numeric value: {min_val}. No range filter needed.")
@@ -83,16 +288,14 @@ elif page == "📄 View Tables":
                         value=(min_val, max_val),
                         step=(max_val - min_val) / 100 if (max_val - min_val) > 0 else 0.1
                     )
-                    filtered_df = filtered_df[
-                        (filtered_df[col] >= value_range[0]) & 
-                        (filtered_df[col] <= value_range[1])
-                    ]
-                
-                elif pd.api.types.is_datetime64_any_dtype(col_type):
-                    # Convert to datetime if not already
-                    filtered_df[col] = pd.to_datetime(filtered_df[col], errors='coerce')
-                    min_date = filtered_df[col].min().date() if not filtered_df[col].min() is pd.NaT else None
-                    max_date = filtered_df[col].max().date() if not filtered_df[col].max() is pd.NaT else None
+                    if value_range != (min_val, max_val):
+                        filters.append(("range", col, value_range[0], value_range[1]))
+
+                elif kind == "date":
+                    min_date, max_date = column_bounds(conn, table, col)
+                    # Timestamp columns are filtered by whole days
+                    min_date = min_date.date() if isinstance(min_date, datetime) else min_date
+                    max_date = max_date.date() if isinstance(max_date, datetime) else max_date
 
                     if min_date and max_date and min_date != max_date:
                         date_range = st.date_input(
@@ -101,27 +304,79 @@ elif page == "📄 View Tables":
                             min_value=min_date,
                             max_value=max_date
                         )
-                        if len(date_range) == 2:
-                            filtered_df = filtered_df[
-                                (filtered_df[col].dt.date >= date_range[0]) & 
-                                (filtered_df[col].dt.date <= date_range[1])
-                            ]
+                        if len(date_range) == 2 and tuple(date_range) != (min_date, max_date):
+                            filters.append(("date_range", col, date_range[0], date_range[1]))
                     elif min_date:
                         st.info(f"Column '{col}' has only one unique date value: {min_date}. No date range filter needed.")
                     else:
                         st.info(f"Column '{col}' has no valid date values for filtering.")
 
-                else: # Treat as categorical (object, string)
-                    unique_values = filtered_df[col].unique().tolist()
-                    if len(unique_values) > 0:
+                else: # Treat as categorical (text)
+                    unique_values = distinct_values(conn, table, col)
+                    if unique_values is None:
+                        # Too many distinct values for a multiselect (names, addresses, contacts)
+                        search_text = st.text_input(f"Filter '{col}' (contains text)")
+                        if search_text:
+                            filters.append(("contains", col, search_text))
+                    elif len(unique_values) > 0:
                         selected_values = st.multiselect(f"Filter '{col}' (select values)", unique_values, default=unique_values)
-                        filtered_df = filtered_df[filtered_df[col].isin(selected_values)]
+                        if len(selected_values) < len(unique_values):
+                            filters.append(("in", col, selected_values))
                     else:
                         st.info(f"Column '{col}' has no unique values for filtering.")
 
-            st.dataframe(filtered_df)
-        else:
+            # --- Pagination ---
+            page_size = st.selectbox("Rows per page", [25, 50, 100, 500], index=2)
+
+            # Keyset pagination: remember the first key of every page visited; reset when
+            # the table, filters or page size change. One extra row tells whether a next page exists.
+            view_state = repr((table, filters, page_size))
+            if st.session_state.get("view_tables_state") != view_state:
+                st.session_state.view_tables_state = view_state
+                st.session_state.view_tables_cursors = [None]
+            cursors = st.session_state.view_tables_cursors
+
+            # With live updates the page and its row count are kept between reruns and patched
+            # with the reported changes; filtered pages are re-read when anything changed.
+            page_key = (view_state, cursors[-1])
+            held = st.session_state.get("view_tables_page")
+            changes = st.session_state.changes.drain(table) if LIVE_UPDATES else None
+            page_df = None
+            if held and held[0] == page_key and changes is not None and not (filters and changes):
+                page_df = patch_rows(held[2], BROWSABLE_TABLES[table], changes,
+                                     dates=[col for col, kind in column_kinds.items() if kind == "date"],
+                                     after=cursors[-1], last=len(held[2]) <= page_size)
+                if page_df is not None:
+                    total_rows = held[1] + sum(change["count"] if change["op"] == "I" else -change["count"]
+                                               for change in changes if change["op"] in ("I", "D"))
+            if page_df is None:
+                total_rows = count_rows(conn, table, filters)
+                page_df = fetch_page(conn, table, filters, page_size + 1, after_key=cursors[-1])
+            st.session_state.view_tables_page = (page_key, total_rows, page_df)
+
+        if total_rows == 0 and not filters:
             st.info(f"No data available in the '{table}' table.")
+        else:
+            has_next = len(page_df) > page_size
+            page_df = page_df.iloc[:page_size]
+            next_key = page_df[BROWSABLE_TABLES[table]].iloc[-1].item() if has_next else None
+
+            prev_col, info_col, next_col = st.columns([1, 3, 1])
+            prev_col.button("⬅️ Previous", disabled=len(cursors) == 1, on_click=cursors.pop)
+            next_col.button("Next ➡️", disabled=not has_next, on_click=cursors.append, args=(next_key,))
+
+            first_row = (len(cursors) - 1) * page_size + 1
+            if len(page_df):
+                info_col.caption(f"Rows {first_row}–{first_row + len(page_df) - 1} of {total_rows}")
+            else:
+                info_col.caption("No rows match the selected filters.")
+            with perf.timer("render"):
+                # DATE columns are held as datetime64; show them without a time of day
+                st.dataframe(page_df, column_config={col: st.column_config.DateColumn()
+                                                     for col in date_only(page_df, table)})
+
+        if LIVE_UPDATES:
+            watch_changes(table)
 
     except Exception as e:
         st.error(f"Failed to load table or apply filters: {e}")
@@ -131,7 +386,9 @@ elif page == "📄 View Tables":
 elif page == "🛠️ CRUD Operations":
     st.title("🛠️ Perform CRUD Operations on Food Listings")
 
-    crud_operation = st.selectbox("Choose a CRUD Operation", ["Add New Listing", "Update Existing Listing", "Delete Listing"])
+    crud_operation = st.selectbox("Choose a CRUD Operation", ["Add New Listing", "Update Existing Listing", "Delete Listing",
+                                                              "Bulk Add / Update / Delete"])
+    perf.set_key(f"CRUD: {crud_operation}")
 
     # ------------------------ Add New Listing ------------------------
     if crud_operation == "Add New Listing":
@@ -149,14 +406,16 @@ elif page == "🛠️ CRUD Operations":
 
             if submit:
                 try:
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        INSERT INTO food_listings (Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                    """, (name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type))
-                    conn.commit()
-                    conn.close()
+                    with perf.timer("write"), write_connection(["food_listings"]) as conn:
+                        cursor = conn.cursor()
+                        cursor.execute("""
+                            INSERT INTO food_listings (Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                            RETURNING *
+                        """, (name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type))
+                        listing_added(cursor, returned_listing(cursor))  # keep analytics summaries current
+                        conn.commit()
+                    invalidate_table("food_listings")
                     st.success("✅ Food listing added successfully!")
                 except Exception as e:
                     st.error(f"❌ Error adding listing: {e}")
@@ -166,19 +425,11 @@ elif page == "🛠️ CRUD Operations":
         st.subheader("✏️ Update Food Listing")
         
         try:
-            conn = get_connection()
-            food_listings_df = pd.read_sql("SELECT food_id, food_name FROM food_listings ORDER BY food_id", conn)
-            conn.close()
-
-            if not food_listings_df.empty:
-                food_id_options = food_listings_df['food_id'].tolist()
-                selected_food_id = st.selectbox("Select Food ID to Update", food_id_options)
-
-                # Fetch details of the selected listing
-                conn = get_connection()
-                selected_listing_df = pd.read_sql(f"SELECT * FROM food_listings WHERE food_id = {selected_food_id}", conn)
-                conn.close()
+            selected_food_id = pick_listing("update")
 
+            if selected_food_id is not None:
+                # Cached until a write to food_listings, so going back to a recent listing is free
+                selected_listing_df = listing_details(selected_food_id)
                 if not selected_listing_df.empty:
                     listing_data = selected_listing_df.iloc[0]
                     
@@ -194,27 +445,44 @@ elif page == "🛠️ CRUD Operations":
                         
                         update_submit = st.form_submit_button("Update Listing")
 
-                        if update_submit:
+                        if not update_submit:
+                            # Version the user is looking at; the save only wins if nobody saved in between
+                            st.session_state.update_form_version = (int(selected_food_id), int(listing_data["row_version"]))
+                        else:
                             try:
-                                conn = get_connection()
-                                cursor = conn.cursor()
-                                cursor.execute("""
-                                    UPDATE food_listings
-                                    SET Food_Name = %s, Quantity = %s, Expiry_Date = %s, Provider_ID = %s, 
-                                        Provider_Type = %s, Location = %s, Food_Type = %s, Meal_Type = %s
-                                    WHERE Food_ID = %s
-                                """, (new_name, new_quantity, new_expiry_date, new_provider_id, 
-                                      new_provider_type, new_location, new_food_type, new_meal_type, 
-                                      selected_food_id))
-                                conn.commit()
-                                conn.close()
+                                seen_id, seen_version = st.session_state.get("update_form_version", (None, None))
+                                if seen_id != int(selected_food_id):
+                                    seen_version = int(listing_data["row_version"])
+                                with perf.timer("write"), write_connection(["food_listings"]) as conn:
+                                    cursor = conn.cursor()
+                                    old_listing = lock_listing(cursor, int(selected_food_id))
+                                    if old_listing is None:
+                                        raise ValueError(f"Food listing with ID {selected_food_id} no longer exists.")
+                                    if old_listing["row_version"] != seen_version:
+                                        invalidate_table("food_listings")  # so the reload shows their values
+                                        raise ValueError(f"Food listing with ID {selected_food_id} was changed by someone else "
+                                                         "while you were editing. Reload the page to see the latest values.")
+                                    cursor.execute("""
+                                        UPDATE food_listings
+                                        SET Food_Name = %s, Quantity = %s, Expiry_Date = %s, Provider_ID = %s, 
+                                            Provider_Type = %s, Location = %s, Food_Type = %s, Meal_Type = %s,
+                                            row_version = row_version + 1
+                                        WHERE Food_ID = %s
+                                        RETURNING *
+                                    """, (new_name, new_quantity, new_expiry_date, new_provider_id, 
+                                          new_provider_type, new_location, new_food_type, new_meal_type, 
+                                          int(selected_food_id)))
+                                    new_listing = returned_listing(cursor)
+                                    listing_changed(cursor, old_listing, new_listing)
+                                    conn.commit()
+                                # The next save of this listing checks against the version just written
+                                st.session_state.update_form_version = (int(selected_food_id), int(new_listing["row_version"]))
+                                invalidate_table("food_listings")
                                 st.success(f"✅ Food listing with ID {selected_food_id} updated successfully!")
                             except Exception as e:
                                 st.error(f"❌ Error updating listing: {e}")
                 else:
                     st.info("No data found for the selected Food ID.")
-            else:
-                st.info("No food listings available to update.")
         except Exception as e:
             st.error(f"❌ Error loading food listings for update: {e}")
 
@@ -223,31 +491,93 @@ elif page == "🛠️ CRUD Operations":
         st.subheader("🗑️ Delete Food Listing")
         
         try:
-            conn = get_connection()
-            food_listings_df = pd.read_sql("SELECT food_id, food_name FROM food_listings ORDER BY food_id", conn)
-            conn.close()
-
-            if not food_listings_df.empty:
-                food_id_options = food_listings_df['food_id'].tolist()
-                selected_food_id_delete = st.selectbox("Select Food ID to Delete", food_id_options)
+            selected_food_id_delete = pick_listing("delete")
 
+            if selected_food_id_delete is not None:
                 delete_submit = st.button(f"Delete Listing with ID {selected_food_id_delete}")
 
                 if delete_submit:
                     try:
-                        conn = get_connection()
-                        cursor = conn.cursor()
-                        cursor.execute("DELETE FROM food_listings WHERE Food_ID = %s", (selected_food_id_delete,))
-                        conn.commit()
-                        conn.close()
+                        with perf.timer("write"), write_connection(["food_listings", "claims"]) as conn:
+                            cursor = conn.cursor()
+                            old_listing = lock_listing(cursor, int(selected_food_id_delete))
+                            cursor.execute("DELETE FROM food_listings WHERE Food_ID = %s", (int(selected_food_id_delete),))
+                            if old_listing is not None:
+                                listing_removed(cursor, old_listing)
+                            conn.commit()
+                        invalidate_table("food_listings")
+                        st.session_state.recent_listings.remove(selected_food_id_delete)
                         st.success(f"✅ Food listing with ID {selected_food_id_delete} deleted successfully!")
                     except Exception as e:
                         st.error(f"❌ Error deleting listing: {e}")
-            else:
-                st.info("No food listings available to delete.")
         except Exception as e:
             st.error(f"❌ Error loading food listings for deletion: {e}")
 
+    # ------------------------ Bulk Add / Update / Delete ------------------------
+    elif crud_operation == "Bulk Add / Update / Delete":
+        st.subheader("📦 Bulk Changes")
+        bulk_mode = st.radio("Operation", ["add", "update", "delete"], horizontal=True,
+                             format_func={"add": "➕ Add", "update": "✏️ Update", "delete": "🗑️ Delete"}.get)
+        source = st.radio("Rows from", ["Edit in a grid", "Upload a CSV"], horizontal=True)
+        st.caption(f"Required columns: {', '.join(REQUIRED_COLUMNS[bulk_mode])}. "
+                   "Blank provider_type / location are taken from the provider. "
+                   "Updates and deletes carry the row_version they were read with, so rows someone else "
+                   "saved in the meantime are rejected instead of overwritten.")
+
+        batch_df = None
+        try:
+            if source == "Upload a CSV":
+                uploaded = st.file_uploader("CSV file", type="csv")
+                if uploaded is not None:
+                    batch_df = pd.read_csv(uploaded, dtype=str, keep_default_na=False)
+                    st.write(f"{len(batch_df):,} rows read")
+            elif bulk_mode == "add":
+                template = pd.DataFrame({col: pd.Series(dtype="object") for col in REQUIRED_COLUMNS["add"]})
+                batch_df = st.data_editor(template, num_rows="dynamic", key="bulk_add_grid", column_config={
+                    "food_type": st.column_config.SelectboxColumn(options=FOOD_TYPES),
+                    "meal_type": st.column_config.SelectboxColumn(options=MEAL_TYPES),
+                    "quantity": st.column_config.NumberColumn(min_value=1, step=1),
+                    "provider_id": st.column_config.NumberColumn(min_value=1, step=1),
+                    "expiry_date": st.column_config.DateColumn(),
+                })
+            else:
+                bulk_provider_id = st.number_input("Provider ID whose listings to edit", min_value=1, format="%d")
+                listings_df = run_query("SELECT * FROM food_listings WHERE provider_id = %s ORDER BY food_id",
+                                        params=(int(bulk_provider_id),))
+                show_truncation(listings_df)
+                if listings_df.empty:
+                    st.info("This provider has no listings.")
+                elif bulk_mode == "update":
+                    edited = st.data_editor(listings_df, key=f"bulk_update_grid_{bulk_provider_id}",
+                                            disabled=["food_id", "row_version", "expired_at"], column_config={
+                        "food_type": st.column_config.SelectboxColumn(options=FOOD_TYPES),
+                        "meal_type": st.column_config.SelectboxColumn(options=MEAL_TYPES),
+                    })
+                    # Only rows that were actually edited are sent (and version-checked)
+                    fields = REQUIRED_COLUMNS["update"]
+                    batch_df = edited[edited[fields].astype(str).ne(listings_df[fields].astype(str)).any(axis=1)]
+                else:
+                    marked = listings_df.assign(delete=False)
+                    edited = st.data_editor(marked, key=f"bulk_delete_grid_{bulk_provider_id}",
+                                            disabled=[col for col in marked.columns if col != "delete"])
+                    batch_df = edited[edited["delete"]]
+        except Exception as e:
+            st.error(f"❌ Error loading rows: {e}")
+
+        skip_invalid = st.checkbox("Apply the valid rows even if some rows have errors")
+        if batch_df is not None and st.button(f"Apply {bulk_mode} to {len(batch_df):,} rows", disabled=batch_df.empty):
+            try:
+                with perf.timer("write"), write_connection(["food_listings"]) as conn:
+                    written, errors = apply_batch(conn, batch_df, bulk_mode, skip_invalid=skip_invalid)
+                if written:
+                    invalidate_table("food_listings")
+                    st.success(f"✅ {written:,} listings written in one transaction.")
+                if errors:
+                    st.error(f"❌ {len(errors):,} rows have problems" + ("" if written else "; nothing was written") + ":")
+                    st.dataframe(pd.DataFrame(errors, columns=["row", "error"]), hide_index=True)
+            except Exception as e:
+                st.error(f"❌ Error applying changes: {e}")
+
 # ------------------------ Page 3: CRUD Operations (Add Only) ------------------------
 elif page == "🛠️ CRUD Operations":
     st.title("➕ Add New Food Listing")
@@ -265,14 +595,16 @@ elif page == "🛠️ CRUD Operations":
 
         if submit:
             try:
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO food_listings (Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """, (name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type))
-                conn.commit()
-                conn.close()
+                with write_connection(["food_listings"]) as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("""
+                        INSERT INTO food_listings (Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                        RETURNING *
+                    """, (name, quantity, expiry_date, provider_id, provider_type, location, food_type, meal_type))
+                    listing_added(cursor, returned_listing(cursor))  # keep analytics summaries current
+                    conn.commit()
+                invalidate_table("food_listings")
                 st.success("✅ Food listing added successfully!")
             except Exception as e:
                 st.error(f"❌ Error: {e}")
@@ -281,340 +613,133 @@ elif page == "🛠️ CRUD Operations":
 elif page == "📊 SQL Analysis":
     st.title("📈 SQL Insights") # Changed title slightly as no graphs are present
 
-    # Define SQL queries based on the user's specific questions
-    sql_queries = {
-        "1. How many food providers and receivers are there in each city?": """
-            SELECT
-                COALESCE(p.city, r.city) AS city,
-                COALESCE(p.num_providers, 0) AS num_providers,
-                COALESCE(r.num_receivers, 0) AS num_receivers
-            FROM
-                (SELECT city, COUNT(*) AS num_providers FROM providers GROUP BY city) p
-            FULL OUTER JOIN
-                (SELECT city, COUNT(*) AS num_receivers FROM receivers GROUP BY city) r
-            ON p.city = r.city
-            ORDER BY city;
-        """,
-        "2. Which type of food provider (restaurant, grocery store, etc.) contributes the most food?": """
-            SELECT
-                provider_type,
-                SUM(quantity) AS total_quantity
-            FROM food_listings
-            GROUP BY provider_type
-            ORDER BY total_quantity DESC
-            LIMIT 3;
-        """,
-        "3. What is the contact information of food providers in a specific city?": """
-            SELECT
-                name,
-                type,
-                contact
-            FROM providers
-            WHERE city = 'New Jessica';
-        """,
-        "4. Which receivers have claimed the most food?": """
-            SELECT
-                r.name AS receiver_name,
-                COUNT(c.claim_id) AS total_claims
-            FROM claims c
-            JOIN receivers r ON c.receiver_id = r.receiver_id
-            GROUP BY r.name
-            ORDER BY total_claims DESC LIMIT 5;
-        """,
-        "5. What is the total quantity of food available from all providers?": """
-            SELECT
-                    SUM(quantity) AS total_food_quantity
-            FROM food_listings;
-            """,
-        "6. Which city has the highest number of food listings?": """
-            SELECT Location AS City, COUNT(*) AS Number_of_Listings
-            FROM food_listings
-            GROUP BY Location
-            ORDER BY Number_of_Listings DESC
-            LIMIT 1;
-        """,
-        "7. What are the most commonly available food types?": """
-            SELECT Food_Type, COUNT(*) AS Count
-            FROM food_listings
-            GROUP BY Food_Type
-            ORDER BY Count DESC
-            LIMIT 3;
-        """,
-        "8. How many food claims have been made for each food item?": """
-            SELECT f.Food_Name, COUNT(c.claim_id) AS Number_of_Claims
-            FROM claims c
-            JOIN food_listings f ON c.food_id = f.food_id
-            GROUP BY f.Food_Name
-            ORDER BY Number_of_Claims DESC;
-        """,
-        "9. Which provider has had the highest number of successful food claims?": """
-            SELECT p.Name AS Provider_Name, COUNT(c.claim_id) AS Successful_Claims
-            FROM claims c
-            JOIN food_listings f ON c.food_id = f.food_id
-            JOIN providers p ON f.provider_id = p.provider_id
-            WHERE c.status = 'Completed'
-            GROUP BY p.Name
-            ORDER BY Successful_Claims DESC
-            LIMIT 1;
-        """,
-        "10. What percentage of food claims are completed vs. pending vs. canceled?": """
-            SELECT
-                status,
-                COUNT(*) * 100.0 / (SELECT COUNT(*) FROM claims) AS percentage
-            FROM claims
-            GROUP BY status;
-        """,
-        "11. What is the average quantity of food claimed per receiver?": """
-            SELECT
-                r.name AS receiver_name,
-                AVG(f.quantity) AS average_quantity_claimed
-            FROM claims c
-            JOIN food_listings f ON c.food_id = f.food_id
-            JOIN receivers r ON c.receiver_id = r.receiver_id
-            WHERE c.status = 'Completed'
-            GROUP BY r.name
-            ORDER BY average_quantity_claimed DESC;
-        """,
-        "12. Which meal type (breakfast, lunch, dinner, snacks) is claimed the most?": """
-            SELECT f.Meal_Type, COUNT(c.claim_id) AS Claim_Count
-            FROM claims c
-            JOIN food_listings f ON c.food_id = f.food_id
-            GROUP BY f.Meal_Type
-            ORDER BY Claim_Count DESC
-            LIMIT 1;
-        """,
-        "13. What is the total quantity of food donated by each provider?": """
-            SELECT p.Name AS Provider_Name, SUM(f.Quantity) AS Total_Donated_Quantity
-            FROM food_listings f
-            JOIN providers p ON f.Provider_ID = p.Provider_ID
-            GROUP BY p.Name
-            ORDER BY Total_Donated_Quantity DESC;
-        """
-    }
-
+    # Query definitions live in queries.py
+    sql_queries = REGISTRY.page("sql")
     selected_query_question = st.selectbox("Select a SQL Analysis Query", list(sql_queries.keys()))
+    perf.set_key(f"SQL Analysis: {selected_query_question}")
 
     if selected_query_question:
         query_to_execute = sql_queries[selected_query_question]
         # Remove number prefix for subheader display
         subheader_text = selected_query_question.split('. ', 1)[1] if '. ' in selected_query_question else selected_query_question
         st.subheader(f"Results for: {subheader_text}")
+        values = query_inputs(query_to_execute, f"params_{query_to_execute.key}")
+        backend = pick_backend(f"backend_sql_{selected_query_question}", query_to_execute.backends)
         try:
-            conn = get_connection()
-            df_result = pd.read_sql(query_to_execute, conn)
+            # Served from the backend's result cache; CRUD writes invalidate the entries of the tables it declares
+            df_result = query_to_execute.run(values, backend)
+            show_backend_source(backend)
             if not df_result.empty:
-                st.dataframe(df_result)
+                with perf.timer("render"):
+                    st.dataframe(df_result)
+                show_truncation(df_result)
                 # All chart generation code has been removed from this page.
             else:
                 st.info("No results found for this query.")
-            conn.close()
         except Exception as e:
             st.error(f"❌ Error executing query: {e}")
 # ------------------------ Page 5: Custom SQL ------------------------
 elif page == "🧠 Custom SQL":
     st.title("Custom SQL Queries with Visualizations")
 
-    custom_sql_queries_with_visuals = {
-        "1. Which food types are listed the most but rarely claimed?": {
-            "query": """
-                SELECT
-                    f.Food_Type,
-                    COUNT(DISTINCT f.Food_ID) AS total_listings,
-                    COUNT(DISTINCT c.Claim_ID) AS total_claims,
-                    ROUND(100.0 * COUNT(DISTINCT c.Claim_ID) / COUNT(DISTINCT f.Food_ID), 2) AS claim_rate
-                FROM food_listings f
-                LEFT JOIN claims c ON f.Food_ID = c.Food_ID
-                GROUP BY f.Food_Type
-                ORDER BY claim_rate ASC;
-            """,
-            "plot_type": "bar",
-            "x_col": "food_type",
-            "y_col": "claim_rate",
-            "title": "Claim Rate by Food Type"
-        },
-        "2. Which providers have the most unclaimed food (by quantity)?": {
-            "query": """
-                SELECT
-                    p.Name AS Provider_Name,
-                    SUM(fl.Quantity) AS Total_Unclaimed_Quantity
-                FROM food_listings fl
-                JOIN providers p ON fl.Provider_ID = p.Provider_ID
-                WHERE fl.Food_ID NOT IN (SELECT food_id FROM claims WHERE status = 'Completed')
-                GROUP BY p.Name
-                ORDER BY Total_Unclaimed_Quantity DESC;
-            """,
-            "plot_type": "bar",
-            "x_col": "provider_name",
-            "y_col": "total_unclaimed_quantity",
-            "title": "Unclaimed Food Quantity by Provider"
-        },
-        "3. Which day of the week has the most unclaimed food (by quantity)?": {
-            "query": """
-                SELECT
-                    TO_CHAR(f.Expiry_Date, 'Day') AS Day_Of_Week,
-                    SUM(f.Quantity) AS Unclaimed_Quantity
-                FROM food_listings f
-                LEFT JOIN claims c ON f.Food_ID = c.Food_ID
-                WHERE c.Claim_ID IS NULL OR c.Status != 'Completed'
-                GROUP BY Day_Of_Week
-                ORDER BY Unclaimed_Quantity DESC;
-            """,
-            "plot_type": "bar",
-            "x_col": "day_of_week",
-            "y_col": "unclaimed_quantity",
-            "title": "Unclaimed Food Quantity by Day of Week"
-        },
-        "4. Which cities have the most unclaimed food listings?": {
-            "query": """
-                SELECT
-                    fl.Location AS City,
-                    COUNT(DISTINCT fl.Food_ID) AS Total_Listings,
-                    COUNT(DISTINCT c.Claim_ID) AS Claimed_Listings,
-                    COUNT(DISTINCT fl.Food_ID) - COUNT(DISTINCT c.Claim_ID) AS Unclaimed_Listings
-                FROM food_listings fl
-                LEFT JOIN claims c ON fl.Food_ID = c.Food_ID
-                GROUP BY fl.Location
-                ORDER BY Unclaimed_Listings DESC
-                LIMIT 5;
-            """,
-            "plot_type": "bar",
-            "x_col": "city",
-            "y_col": "unclaimed_listings",
-            "title": "Top 5 Cities by Unclaimed Food Listings"
-        },
-        "5. How many claims were made for food items after their expiry date?": {
-            "query": """
-                SELECT
-                    COUNT(c.Claim_ID) AS Late_Claims
-                FROM claims c
-                JOIN food_listings f ON c.Food_ID = f.Food_ID
-                WHERE c.Timestamp > f.Expiry_Date;
-            """,
-            "plot_type": "metric",
-            "title": "Number of Late Claims (After Expiry)"
-        },
-        "6. Which provider type lists the most food overall (by quantity)?": {
-            "query": """
-                SELECT
-                    provider_type,
-                    SUM(quantity) AS total_quantity
-                FROM food_listings
-                GROUP BY provider_type
-                ORDER BY total_quantity DESC
-                LIMIT 3;
-            """,
-            "plot_type": "bar",
-            "x_col": "provider_type",
-            "y_col": "total_quantity",
-            "title": "Top 3 Provider Types by Total Food Quantity Listed"
-        },
-        "7. Which receiver city receives the most total claimed quantity?": {
-            "query": """
-                SELECT
-                    r.City,
-                    SUM(f.Quantity) AS Total_Claimed_Quantity
-                FROM claims c
-                JOIN food_listings f ON c.Food_ID = f.Food_ID
-                JOIN receivers r ON c.Receiver_ID = r.Receiver_ID
-                WHERE c.Status = 'Completed'
-                GROUP BY r.City
-                ORDER BY Total_Claimed_Quantity DESC
-                LIMIT 10;
-            """,
-            "plot_type": "bar",
-            "x_col": "city",
-            "y_col": "total_claimed_quantity",
-            "title": "Top 10 Receiver Cities by Total Claimed Quantity"
-        },
-        "8. Which meal type has the most unclaimed food (by quantity)?": {
-            "query": """
-                SELECT
-                    f.Meal_Type,
-                    SUM(f.Quantity) - COALESCE(SUM(CASE WHEN c.Status = 'Completed' THEN f.Quantity ELSE 0 END), 0) AS Unclaimed_Quantity
-                FROM food_listings f
-                LEFT JOIN claims c ON f.Food_ID = c.Food_ID
-                GROUP BY f.Meal_Type
-                ORDER BY Unclaimed_Quantity DESC;
-            """,
-            "plot_type": "bar",
-            "x_col": "meal_type",
-            "y_col": "unclaimed_quantity",
-            "title": "Unclaimed Food Quantity by Meal Type"
-        },
-        "9. Which specific food items are most frequently unclaimed?": {
-            "query": """
-                SELECT
-                    f.Food_Name,
-                    COUNT(DISTINCT f.Food_ID) AS Unclaimed_Listings
-                FROM food_listings f
-                LEFT JOIN claims c ON f.Food_ID = c.Food_ID
-                WHERE c.Claim_ID IS NULL OR c.Status != 'Completed'
-                GROUP BY f.Food_Name
-                ORDER BY Unclaimed_Listings DESC
-                LIMIT 10;
-            """,
-            "plot_type": "bar",
-            "x_col": "food_name",
-            "y_col": "unclaimed_listings",
-            "title": "Top 10 Most Frequently Unclaimed Food Items"
-        },
-        "10. Which providers list the most food items that end up unclaimed?": {
-            "query": """
-                SELECT
-                    p.Name AS Provider_Name,
-                    COUNT(DISTINCT f.Food_ID) AS total_listings,
-                    COUNT(DISTINCT c.Claim_ID) AS total_claims,
-                    COUNT(DISTINCT f.Food_ID) - COUNT(DISTINCT c.Claim_ID) AS unclaimed_listings
-                FROM providers p
-                JOIN food_listings f ON p.Provider_ID = f.Provider_ID
-                LEFT JOIN claims c ON f.Food_ID = c.Food_ID
-                GROUP BY p.Name
-                ORDER BY unclaimed_listings DESC
-                LIMIT 5;
-            """,
-            "plot_type": "bar",
-            "x_col": "provider_name",
-            "y_col": "unclaimed_listings",
-            "title": "Top 5 Providers by Unclaimed Food Listings"
-        }
-    }
-
-    selected_custom_query_question = st.selectbox("Select a Custom SQL Query", list(custom_sql_queries_with_visuals.keys()))
+    custom_queries = REGISTRY.page("custom")
+    selected_custom_query_question = st.selectbox("Select a Custom SQL Query", list(custom_queries.keys()))
+    perf.set_key(f"Custom SQL: {selected_custom_query_question}")
 
     if selected_custom_query_question:
-        query_info = custom_sql_queries_with_visuals[selected_custom_query_question]
-        query_to_execute_custom = query_info["query"]
-        plot_type = query_info["plot_type"]
-        x_col = query_info.get("x_col")
-        y_col = query_info.get("y_col")
-        plot_title = query_info["title"]
+        query_to_execute_custom = custom_queries[selected_custom_query_question]
 
         st.subheader(f"Results for: {selected_custom_query_question}")
+        values = query_inputs(query_to_execute_custom, f"params_{query_to_execute_custom.key}")
+        backend = pick_backend(f"backend_custom_{selected_custom_query_question}", query_to_execute_custom.backends)
         try:
-            conn = get_connection()
-            df_custom_result = pd.read_sql(query_to_execute_custom, conn)
-            if not df_custom_result.empty:
-                st.dataframe(df_custom_result)
-
-                # Generate Visualization
-                if plot_type == "bar" and x_col and y_col:
-                    # For st.bar_chart, set the x_col as index
-                    plot_df = df_custom_result.set_index(x_col)
-                    st.bar_chart(plot_df[[y_col]])
-                    st.caption(plot_title) # Using caption for title
-                elif plot_type == "metric":
-                    if not df_custom_result.empty:
-                        value = df_custom_result.iloc[0, 0]
-                        st.metric(label=plot_title, value=value)
-                    else:
-                        st.info("No data for this metric.")
-
-            else:
-                st.info("No results found for this query.")
-            conn.close()
+            df_custom_result = query_to_execute_custom.run(values, backend)
+            show_backend_source(backend)
+            with perf.timer("render"):
+                show_custom_result(df_custom_result, query_to_execute_custom.plot)
         except Exception as e:
             st.error(f"❌ Error executing custom query: {e}")
-# ------------------------ Page 6: Creator ------------------------
+# ------------------------ Page 6: Insights Overview ------------------------
+elif page == "🗂️ Insights Overview":
+    st.title("🗂️ All Insights at a Glance")
+    st.caption("Every SQL Analysis and Custom SQL query, run in parallel; each result appears as soon as it is ready.")
+    backend = pick_backend("backend_overview")
+
+    # Queries with parameters run with their defaults
+    overview_queries = {(query.page, query.title): query for query in REGISTRY}
+
+    # One placeholder per query, laid out in the usual order and filled in completion order
+    placeholders = {}
+    for section, title in (("sql", "📊 SQL Analysis"), ("custom", "🧠 Custom SQL")):
+        st.header(title)
+        for key in overview_queries:
+            if key[0] == section:
+                with st.expander(key[1], expanded=True):
+                    placeholders[key] = st.empty()
+                    placeholders[key].info("⏳ Running...")
+
+    progress = st.progress(0.0, text="Running queries...")
+    batch = QueryBatch(overview_queries, backend=backend)
+    try:
+        for done, (key, df, error, seconds) in enumerate(batch.results(), start=1):
+            with placeholders[key].container(), perf.timer("render", key=f"{page}: {key[1]}"):
+                if error is not None:
+                    st.error(f"❌ Error executing query: {error}")
+                elif key[0] == "custom":
+                    show_custom_result(df, overview_queries[key].plot)
+                elif df.empty:
+                    st.info("No results found for this query.")
+                else:
+                    st.dataframe(df)
+                    show_truncation(df)
+                st.caption(f"⏱️ {seconds * 1000:.0f} ms")
+            progress.progress(done / len(overview_queries), text=f"{done} of {len(overview_queries)} queries done")
+    finally:
+        # A rerun or navigation interrupts this loop; don't leave queries running on the server
+        batch.cancel()
+    show_backend_source(backend)
+# ------------------------ Page 7: Trends ------------------------
+elif page == "📈 Trends":
+    st.title("📈 Claims and Waste Trends")
+    st.caption("Claims are bucketed by their Timestamp, wasted food by its Expiry_Date (see timeseries.py).")
+
+    col1, col2, col3 = st.columns(3)
+    unit = col1.radio("Buckets", list(FREQUENCIES), format_func={"day": "Daily", "hour": "Hourly"}.get,
+                      horizontal=True, key="trend_unit")
+    by = col2.radio("Break down by", [None, "provider_type", "city"], horizontal=True, key="trend_by",
+                    format_func={None: "Total", "provider_type": "Provider type", "city": "City"}.get)
+    window = col3.number_input(f"Rolling window ({unit}s)", min_value=1, value=FREQUENCIES[unit][2],
+                               key=f"trend_window_{unit}")
+    perf.set_key(f"Trends: {unit} by {by or 'total'}")
+
+    try:
+        store = get_store(unit).refresh()
+        series = trends(store, by=by, window=int(window))
+    except Exception as e:
+        st.error(f"❌ Error loading trends: {e}")
+    else:
+        if not series:
+            st.info("No claims or listings to chart yet.")
+        with perf.timer("render"):
+            if "claims" in series:
+                st.subheader("Claims per " + unit)
+                st.line_chart(series["claims"])
+                st.subheader(f"Completion rate (rolling {window} {unit}s)")
+                st.line_chart(series["completion_rate"])
+                st.subheader("Hours from listing to Completed claim")
+                if series["latency_hours"].notna().any().any():
+                    st.line_chart(series["latency_hours"])
+                else:
+                    st.info("No Completed claims on listings with a recorded listing time yet "
+                            "(listings added before migration 8 have none).")
+                st.subheader("Hours left before expiry when claimed")
+                st.line_chart(series["lead_hours"])
+            if "wasted_quantity" in series:
+                st.subheader("Expired unclaimed quantity per day")
+                st.bar_chart(series["wasted_quantity"])
+        refresh = store.last_refresh
+        st.caption(f"🔄 Last refresh: {refresh['mode']}, {refresh['rows']:,} bucket rows read in {refresh['ms']:.0f} ms")
+# ------------------------ Page 8: Creator ------------------------
 elif page == "👤 About Creator":
     st.title("👤 Project Created By")
     st.markdown("""
@@ -631,3 +756,46 @@ elif page == "👤 About Creator":
 
 
 
+
+# ------------------------ Hidden page: Performance ------------------------
+elif page == "⏱️ Performance":
+    st.title("⏱️ Performance")
+    st.caption(f"Latency per page/query key and phase; percentiles over the last {perf.PERF_SAMPLES} timings "
+               "of each, counts and totals since the app started.")
+
+    stats_df = pd.DataFrame(perf.latency_stats())
+    if stats_df.empty:
+        st.info("Nothing measured yet; open the other pages first.")
+    else:
+        phases = sorted(stats_df["phase"].unique())
+        selected_phases = st.multiselect("Phases", phases, default=phases)
+        stats_df = stats_df[stats_df["phase"].isin(selected_phases)].sort_values("p95_ms", ascending=False)
+        st.dataframe(stats_df.round(1), hide_index=True)
+
+    metrics_text = perf.prometheus_text()
+    st.download_button("⬇️ Download Prometheus metrics", metrics_text, file_name="food_waste_metrics.prom",
+                       mime="text/plain")
+    with st.expander("Prometheus text"):
+        st.code(metrics_text, language=None)
+
+    reset_col, profile_col = st.columns(2)
+    if reset_col.button("Reset timings"):
+        perf.get_recorder().clear()
+        st.rerun()
+    if profile_col.button("🔬 Profile the next rerun"):
+        st.session_state.profile_next_run = True
+        st.info("The next page you open (or the next click) is run under cProfile.")
+
+    last_profile = st.session_state.get("last_profile")
+    if last_profile:
+        profiled_page, path, summary = last_profile
+        st.subheader(f"Last profile: {profiled_page}")
+        st.caption(f"Saved to {path} (open with `python -m pstats` or snakeviz)")
+        st.code(summary, language=None)
+
+# ------------------------ End of run: timing and profiling ------------------------
+perf.end_page()
+if profiler is not None:
+    path, summary = perf.finish_profile(profiler, page)
+    st.session_state.last_profile = (page, path, summary)
+    st.sidebar.info(f"🔬 This run was profiled: {path}")
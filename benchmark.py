@@ -0,0 +1,222 @@
+"""Benchmark harness for the app's database workload.
+
+Times every canned analytics query, the View Tables page loads (count + first
+page, a deep keyset page and a filtered page per table) and the CRUD page's
+INSERT/UPDATE/DELETE (including summary maintenance, rolled back after each
+run) against the configured database. Results go to a JSON report that can be
+compared across runs.
+
+Usage:
+    python datagen.py --scale 100 --out data/sf100 && python ingest.py --dir data/sf100
+    python benchmark.py run sf100 [--repeat 5]     # writes bench_reports/sf100.json
+    python benchmark.py compare before after
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+from db import connection
+from explain_queries import canned_queries
+from table_browser import BROWSABLE_TABLES, count_rows, fetch_page
+import summaries
+
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_reports")
+
+
+def _summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": ordered[0],
+        "median_ms": statistics.median(ordered),
+        "p95_ms": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "mean_ms": statistics.fmean(ordered),
+    }
+
+
+def _time(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return _summarize(samples)
+
+
+# ------------------------ Workloads ------------------------
+def bench_queries(conn, repeat):
+    results = {}
+    for key, query, params in canned_queries():
+        def run(query=query, params=params):
+            with conn.cursor() as cursor:
+                cursor.execute(query, params)
+                columns = [desc[0] for desc in cursor.description]
+                pd.DataFrame(cursor.fetchall(), columns=columns)
+            conn.rollback()
+        results[key] = _time(run, repeat)
+    return results
+
+
+VIEW_FILTERS = {
+    "providers": [("contains", "city", "Port")],
+    "receivers": [("in", "type", ["NGO", "Shelter"])],
+    "food_listings": [("in", "food_type", ["Vegan"]), ("range", "quantity", 10, 30)],
+    "claims": [("in", "status", ["Completed"])],
+}
+
+
+def bench_view_tables(conn, repeat, page_size=100):
+    results = {}
+    for table, key in BROWSABLE_TABLES.items():
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT MAX({key}) FROM {table}")
+            middle_key = (cursor.fetchone()[0] or 0) // 2
+        conn.rollback()
+
+        def first_page(table=table):
+            count_rows(conn, table, [])
+            fetch_page(conn, table, [], page_size)
+            conn.rollback()
+
+        def deep_page(table=table, middle_key=middle_key):
+            fetch_page(conn, table, [], page_size, after_key=middle_key)
+            conn.rollback()
+
+        def filtered_page(table=table):
+            count_rows(conn, table, VIEW_FILTERS[table])
+            fetch_page(conn, table, VIEW_FILTERS[table], page_size)
+            conn.rollback()
+
+        results[f"{table}: first page"] = _time(first_page, repeat)
+        results[f"{table}: deep keyset page"] = _time(deep_page, repeat)
+        results[f"{table}: filtered page"] = _time(filtered_page, repeat)
+    return results
+
+
+def bench_crud(conn, repeat):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT provider_id, type, city FROM providers LIMIT 1")
+        provider_id, provider_type, city = cursor.fetchone()
+        cursor.execute("SELECT food_id FROM food_listings ORDER BY food_id LIMIT 1")
+        food_id = cursor.fetchone()[0]
+    conn.rollback()
+    values = ("Bread", 10, date.today(), provider_id, provider_type, city, "Vegan", "Lunch")
+
+    def insert():
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO food_listings (Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING *
+            """, values)
+            summaries.listing_added(cursor, summaries.returned_listing(cursor))
+        conn.rollback()
+
+    def update():
+        with conn.cursor() as cursor:
+            old = summaries.lock_listing(cursor, food_id)
+            cursor.execute("""
+                UPDATE food_listings
+                SET Food_Name = %s, Quantity = %s, Expiry_Date = %s, Provider_ID = %s,
+                    Provider_Type = %s, Location = %s, Food_Type = %s, Meal_Type = %s
+                WHERE Food_ID = %s
+                RETURNING *
+            """, values + (food_id,))
+            summaries.listing_changed(cursor, old, summaries.returned_listing(cursor))
+        conn.rollback()
+
+    def delete():
+        with conn.cursor() as cursor:
+            old = summaries.lock_listing(cursor, food_id)
+            cursor.execute("DELETE FROM food_listings WHERE Food_ID = %s", (food_id,))
+            summaries.listing_removed(cursor, old)
+        conn.rollback()
+
+    return {
+        "add listing": _time(insert, repeat),
+        "update listing": _time(update, repeat),
+        "delete listing": _time(delete, repeat),
+    }
+
+
+# ------------------------ Reports ------------------------
+def _metadata(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        server_version = cursor.fetchone()[0]
+        row_counts = {}
+        for table in BROWSABLE_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            row_counts[table] = cursor.fetchone()[0]
+    conn.rollback()
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "postgres": server_version,
+        "row_counts": row_counts,
+    }
+
+
+def run(label, repeat):
+    with connection() as conn:
+        report = {"label": label, "metadata": _metadata(conn), "repeat": repeat, "results": {}}
+        for section, bench in (("queries", bench_queries), ("view_tables", bench_view_tables), ("crud", bench_crud)):
+            print(f"Running {section} ...", flush=True)
+            report["results"][section] = bench(conn, repeat)
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = os.path.join(REPORT_DIR, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {path}")
+    return report
+
+
+def compare(before, after):
+    print(f"{'Benchmark':<80} {'before':>10} {'after':>10} {'change':>8}")
+    for section, results in before["results"].items():
+        for key, old in results.items():
+            new = after["results"].get(section, {}).get(key)
+            if new is None:
+                continue
+            change = (new["median_ms"] - old["median_ms"]) / old["median_ms"] if old["median_ms"] else 0.0
+            print(f"{(section + ' / ' + key)[:80]:<80} {old['median_ms']:>9.2f}ms {new['median_ms']:>9.2f}ms {change:>+7.0%}")
+
+
+def _load(label):
+    with open(os.path.join(REPORT_DIR, f"{label}.json")) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark queries, table browsing and CRUD statements.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("label")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.label, args.repeat)
+    else:
+        compare(_load(args.before), _load(args.after))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Multi-row add / update / delete of food listings for the CRUD page's bulk mode.
+
+A batch (uploaded CSV or edited grid) is validated column-wise with pandas:
+enums, quantities, dates and known Provider_IDs. Each bad row gets its own
+error message. The valid rows are then written in one transaction with
+``execute_values``, and the analytics summaries are updated in bulk.
+
+Updates and deletes use optimistic concurrency. Each row carries the
+``row_version`` it was read with, and a row whose version has moved since then
+(someone else saved it) is reported as a conflict. A conflict rolls back the
+whole batch, so nothing is half-applied over another editor's changes.
+"""
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from schema import FOOD_TYPES, MEAL_TYPES
+import summaries
+
+LISTING_FIELDS = ["food_name", "quantity", "expiry_date", "provider_id", "provider_type", "location",
+                  "food_type", "meal_type"]
+REQUIRED_COLUMNS = {
+    "add": ["food_name", "quantity", "expiry_date", "provider_id", "food_type", "meal_type"],
+    "update": ["food_id", "row_version"] + LISTING_FIELDS,
+    "delete": ["food_id", "row_version"],
+}
+
+
+class BatchConflict(Exception):
+    """Rows changed or deleted by someone else since they were read; nothing was written."""
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} row(s) were changed by someone else")
+        self.errors = errors
+
+
+# ------------------------ Validation ------------------------
+def _known_providers(cursor, provider_ids):
+    cursor.execute("SELECT provider_id, type, city FROM providers WHERE provider_id = ANY(%s)",
+                   (sorted(provider_ids),))
+    return pd.DataFrame(cursor.fetchall(), columns=["provider_id", "type", "city"]).set_index("provider_id")
+
+
+def validate(cursor, df, mode):
+    """Check a batch; returns ``(clean_df, errors)`` where errors is ``[(row_number, message), ...]``.
+
+    Row numbers count from 1 in the order given. Column names are matched case-insensitively
+    (the CSV headers are ``Food_Name``, ...). Blank Provider_Type / Location are filled in from the provider.
+    """
+    df = df.rename(columns=str.lower).reset_index(drop=True)
+    missing = [col for col in REQUIRED_COLUMNS[mode] if col not in df.columns]
+    if missing:
+        return df.iloc[0:0], [(0, f"missing column(s): {', '.join(missing)}")]
+    for col in LISTING_FIELDS + ["food_id", "row_version"]:
+        if col not in df.columns:
+            df[col] = None
+
+    problems = pd.Series([[] for _ in range(len(df))], index=df.index)
+
+    def flag(mask, message):
+        for i in df.index[mask.fillna(True).astype(bool)]:
+            problems[i].append(message)
+
+    if mode in ("update", "delete"):
+        df["food_id"] = pd.to_numeric(df["food_id"], errors="coerce")
+        df["row_version"] = pd.to_numeric(df["row_version"], errors="coerce")
+        flag(df["food_id"].isna() | (df["food_id"] % 1 != 0), "Food_ID must be a whole number")
+        flag(df["row_version"].isna(), "row_version is required (re-download the rows to edit)")
+        flag(df["food_id"].duplicated(keep=False) & df["food_id"].notna(), "Food_ID appears more than once")
+
+    if mode in ("add", "update"):
+        df["food_name"] = df["food_name"].astype("string").str.strip()
+        flag(df["food_name"].isna() | (df["food_name"] == ""), "Food_Name is required")
+        df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce")
+        flag(df["quantity"].isna() | (df["quantity"] <= 0) | (df["quantity"] % 1 != 0),
+             "Quantity must be a whole number above 0")
+        df["expiry_date"] = pd.to_datetime(df["expiry_date"], errors="coerce", format="mixed").dt.date
+        flag(df["expiry_date"].isna(), "Expiry_Date is not a valid date")
+        flag(~df["food_type"].isin(FOOD_TYPES), f"Food_Type must be one of {', '.join(FOOD_TYPES)}")
+        flag(~df["meal_type"].isin(MEAL_TYPES), f"Meal_Type must be one of {', '.join(MEAL_TYPES)}")
+
+        df["provider_id"] = pd.to_numeric(df["provider_id"], errors="coerce")
+        providers = _known_providers(cursor, set(df["provider_id"].dropna().astype(int)))
+        known = df["provider_id"].isin(providers.index)
+        flag(~known, "unknown Provider_ID")
+        # Listings carry their provider's type and city unless given explicitly
+        for col, source in (("provider_type", "type"), ("location", "city")):
+            blank = df[col].isna() | (df[col].astype("string").str.strip() == "")
+            df.loc[blank & known, col] = df.loc[blank & known, "provider_id"].map(providers[source])
+
+    errors = [(i + 1, "; ".join(messages)) for i, messages in problems.items() if messages]
+    clean = df[problems.map(len) == 0].copy()
+    for col in ("food_id", "row_version", "quantity", "provider_id"):
+        if col in clean and clean[col].notna().all():
+            clean[col] = clean[col].astype(int)
+    clean["row_number"] = clean.index + 1
+    return clean, errors
+
+
+# ------------------------ Writes ------------------------
+def _rows(clean, columns):
+    """Plain Python tuples (psycopg2 cannot adapt numpy scalars)."""
+    return list(clean[columns].astype(object).itertuples(index=False, name=None))
+
+
+def _no_claims(listing):
+    return dict(listing, claim_count=0, completed=False)
+
+
+def _fetch_dicts(cursor, rows):
+    columns = [desc[0] for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def _conflicts(clean, applied_ids, current):
+    errors = []
+    for row in clean.itertuples():
+        if row.food_id not in applied_ids:
+            if row.food_id in current:
+                errors.append((row.row_number, f"Food_ID {row.food_id} was changed by someone else "
+                                               f"(version {current[row.food_id]['row_version']}, "
+                                               f"you edited version {row.row_version})"))
+            else:
+                errors.append((row.row_number, f"Food_ID {row.food_id} no longer exists"))
+    return errors
+
+
+def add(cursor, clean):
+    values = _rows(clean, LISTING_FIELDS)
+    inserted = execute_values(cursor, f"""
+        INSERT INTO food_listings ({", ".join(LISTING_FIELDS)}) VALUES %s RETURNING *
+    """, values, page_size=1000, fetch=True)
+    added = _fetch_dicts(cursor, inserted)
+    summaries.listings_changed_bulk(cursor, added=[_no_claims(listing) for listing in added])
+    return len(added)
+
+
+def update(cursor, clean):
+    current = summaries.lock_listings(cursor, clean["food_id"].tolist())
+    values = _rows(clean, ["food_id", "row_version"] + LISTING_FIELDS)
+    updated = execute_values(cursor, f"""
+        UPDATE food_listings f SET
+            {", ".join(f"{col} = v.{col}" for col in LISTING_FIELDS)},
+            row_version = f.row_version + 1
+        FROM (VALUES %s) AS v(food_id, row_version, {", ".join(LISTING_FIELDS)})
+        WHERE f.food_id = v.food_id AND f.row_version = v.row_version
+        RETURNING f.*
+    """, values, template="(%s, %s, %s, %s, %s::date, %s, %s, %s, %s, %s)", page_size=1000, fetch=True)
+    new = _fetch_dicts(cursor, updated)
+    errors = _conflicts(clean, {listing["food_id"] for listing in new}, current)
+    if errors:
+        raise BatchConflict(errors)
+    old = [current[listing["food_id"]] for listing in new]
+    summaries.listings_changed_bulk(cursor, removed=old, added=[
+        dict(listing, claim_count=before["claim_count"], completed=before["completed"])
+        for listing, before in zip(new, old)])
+    return len(new)
+
+
+def delete(cursor, clean):
+    current = summaries.lock_listings(cursor, clean["food_id"].tolist())
+    deleted = execute_values(cursor, """
+        DELETE FROM food_listings f
+        USING (VALUES %s) AS v(food_id, row_version)
+        WHERE f.food_id = v.food_id AND f.row_version = v.row_version
+        RETURNING f.food_id
+    """, _rows(clean, ["food_id", "row_version"]), page_size=1000, fetch=True)
+    deleted_ids = {row[0] for row in deleted}
+    errors = _conflicts(clean, deleted_ids, current)
+    if errors:
+        raise BatchConflict(errors)
+    summaries.listings_changed_bulk(cursor, removed=[current[food_id] for food_id in deleted_ids])
+    return len(deleted_ids)
+
+
+OPERATIONS = {"add": add, "update": update, "delete": delete}
+
+
+def apply_batch(conn, df, mode, skip_invalid=False):
+    """Validate and write a batch in one transaction; returns ``(rows_written, errors)``.
+
+    With validation errors nothing is written unless ``skip_invalid`` is set. A concurrency
+    conflict always rolls the whole batch back.
+    """
+    with conn.cursor() as cursor:
+        clean, errors = validate(cursor, df, mode)
+        if (errors and not skip_invalid) or clean.empty:
+            conn.rollback()
+            return 0, errors
+        try:
+            written = OPERATIONS[mode](cursor, clean)
+        except BatchConflict as conflict:
+            conn.rollback()
+            return 0, errors + conflict.errors
+    conn.commit()
+    return written, errors
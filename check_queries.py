@@ -0,0 +1,156 @@
+"""Cross-check the unclaimed / claim-rate analytics against a pandas reference.
+
+Loads the shipped CSVs, computes each Custom SQL insight that depends on claim
+state with plain pandas, and compares the result with what the database
+returns for the canned query. Run it against a database loaded from the same
+CSVs (``python ingest.py``); exits non-zero when any query disagrees.
+
+Usage:
+    python check_queries.py [--dir DIR]
+"""
+import argparse
+import os
+import sys
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from db import connection
+from queries import REGISTRY
+from schema import TABLES
+from table_frames import load_csv
+
+
+def load_csvs(directory):
+    return {table: load_csv(table, directory) for table in TABLES}
+
+
+def listing_state(data):
+    """Listings with claim_count and completed flag, the pandas twin of listing_claim_state."""
+    claims = data["claims"]
+    state = claims.groupby("Food_ID").agg(
+        claim_count=("Claim_ID", "size"),
+        completed=("Status", lambda s: (s == "Completed").any()),
+    )
+    listings = data["food_listings"].merge(state, left_on="Food_ID", right_index=True, how="left")
+    listings["claim_count"] = listings["claim_count"].fillna(0).astype("int64")
+    listings["completed"] = listings["completed"].astype("boolean").fillna(False).astype(bool)
+    return listings
+
+
+# ------------------------ Reference computations ------------------------
+# Custom SQL question number -> function(data, listings) returning the expected DataFrame
+def ref_claim_rate_by_food_type(data, listings):
+    df = listings.groupby("Food_Type").agg(total_listings=("Food_ID", "size"), total_claims=("claim_count", "sum"))
+    df["claim_rate"] = (100.0 * df["total_claims"] / df["total_listings"]).round(2)
+    return df.reset_index().sort_values("claim_rate")
+
+
+def ref_unclaimed_by_provider(data, listings):
+    unclaimed = listings[~listings["completed"]].merge(data["providers"], on="Provider_ID")
+    df = unclaimed.groupby("Name")["Quantity"].sum().reset_index()
+    return df.sort_values("Quantity", ascending=False)
+
+
+def ref_unclaimed_by_weekday(data, listings):
+    unclaimed = listings[~listings["completed"]].copy()
+    unclaimed["day"] = unclaimed["Expiry_Date"].dt.day_name()
+    return unclaimed.groupby("day")["Quantity"].sum().reset_index().sort_values("Quantity", ascending=False)
+
+
+def ref_unclaimed_by_city(data, listings):
+    df = listings.groupby("Location").agg(
+        total=("Food_ID", "size"),
+        claimed=("completed", "sum"),
+    ).reset_index()
+    df["unclaimed"] = df["total"] - df["claimed"]
+    return df.sort_values(["unclaimed", "Location"], ascending=[False, True]).head(5)
+
+
+def ref_unclaimed_by_meal_type(data, listings):
+    unclaimed = listings[~listings["completed"]]
+    return unclaimed.groupby("Meal_Type")["Quantity"].sum().reset_index().sort_values("Quantity", ascending=False)
+
+
+def ref_unclaimed_by_food_name(data, listings):
+    unclaimed = listings[~listings["completed"]]
+    df = unclaimed.groupby("Food_Name").size().rename("unclaimed").reset_index()
+    return df.sort_values(["unclaimed", "Food_Name"], ascending=[False, True]).head(10)
+
+
+def ref_unclaimed_listings_by_provider(data, listings):
+    merged = listings.merge(data["providers"], on="Provider_ID")
+    merged["unclaimed"] = ~merged["completed"]
+    df = merged.groupby("Name").agg(
+        total_listings=("Food_ID", "size"),
+        total_claims=("claim_count", "sum"),
+        unclaimed_listings=("unclaimed", "sum"),
+    ).reset_index()
+    return df.sort_values(["unclaimed_listings", "Name"], ascending=[False, True]).head(5)
+
+
+REFERENCES = {
+    "1": ref_claim_rate_by_food_type,
+    "2": ref_unclaimed_by_provider,
+    "3": ref_unclaimed_by_weekday,
+    "4": ref_unclaimed_by_city,
+    "8": ref_unclaimed_by_meal_type,
+    "9": ref_unclaimed_by_food_name,
+    "10": ref_unclaimed_listings_by_provider,
+}
+
+
+def _normalize(df, limited):
+    df = df.copy()
+    df.columns = range(len(df.columns))
+    for column in df.columns:
+        if df[column].map(lambda value: isinstance(value, Decimal)).all():
+            df[column] = df[column].astype(float)
+        if pd.api.types.is_numeric_dtype(df[column]):
+            df[column] = df[column].astype(float).round(2)
+        else:
+            df[column] = df[column].astype(str)
+    if not limited:
+        # Unlimited queries may order ties differently; compare as sets of rows
+        df = df.sort_values(list(df.columns))
+    return df.reset_index(drop=True)
+
+
+def check(directory):
+    data = load_csvs(directory)
+    listings = listing_state(data)
+    failures = 0
+    with connection() as conn:
+        for question, query in REGISTRY.page("custom").items():
+            number = question.split(".", 1)[0]
+            if number not in REFERENCES:
+                continue
+            expected = REFERENCES[number](data, listings)
+            with conn.cursor() as cursor:
+                cursor.execute(query.sql, query.bind() or None)
+                actual = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
+            conn.rollback()
+            limited = "LIMIT" in query.sql.upper()
+            expected, actual = _normalize(expected, limited), _normalize(actual, limited)
+
+            if expected.shape == actual.shape and np.array_equal(expected.values, actual.values):
+                print(f"OK    {question}")
+            else:
+                failures += 1
+                print(f"FAIL  {question}")
+                print("  expected:\n" + expected.head(10).to_string())
+                print("  actual:\n" + actual.head(10).to_string())
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare claim-state analytics with a pandas reference.")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directory holding the *_data.csv files the database was loaded from")
+    args = parser.parse_args()
+    sys.exit(1 if check(args.dir) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Columnar snapshots of the four tables and an embedded DuckDB analytics backend.
+
+``export`` writes providers, receivers, food_listings and claims to Parquet
+under ``FOOD_WASTE_SNAPSHOT_DIR``. food_listings is partitioned by Expiry_Date
+month and claims by claim Timestamp month, in hive-style directories such as
+``food_listings/expiry_month=2025-03/``. The source is the live database or, with
+``--from-csv``, a directory of ``*_data.csv`` files. A new snapshot replaces the
+old one in a single rename, so readers never see a half-written one.
+
+``DuckDBBackend`` runs the canned queries in queries.REGISTRY unchanged,
+in-process, over the snapshot, or straight over the bundled CSVs when no
+snapshot has been exported. It defines the same ``listing_claim_state`` view,
+computes the ``summary_*`` tables with the recompute queries from summaries.py,
+and adds a ``to_char`` macro for the PostgreSQL date formats the queries use.
+Heavy GROUP BYs then run off the primary, and the analytics pages work
+without a database server. Results are column-name compatible with PostgreSQL
+(lower case).
+
+duckdb and pyarrow are only needed by this module; the rest of the app runs
+without them.
+
+Usage:
+    python columnar.py export [--from-csv DIR] [--out DIR]   # write a Parquet snapshot
+    python columnar.py compare                                 # run every canned query on both backends
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import perf
+from query_cache import read_sql_cached
+from schema import TABLES
+from summaries import LISTING_CLAIM_STATE_DDL, SUMMARIES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.environ.get("FOOD_WASTE_SNAPSHOT_DIR", os.path.join(BASE_DIR, "snapshot"))
+ANALYTICS_BACKEND = os.environ.get("FOOD_WASTE_ANALYTICS_BACKEND", "postgres")  # default for the analytics pages
+EXPORT_CHUNK_ROWS = 50_000
+MANIFEST = "snapshot.json"
+
+BACKENDS = {"postgres": "PostgreSQL (live)", "duckdb": "DuckDB (snapshot)"}
+
+# table -> (partition column, the date/timestamp column it is the month of)
+PARTITIONS = {
+    "food_listings": ("expiry_month", "expiry_date"),
+    "claims": ("claim_month", "timestamp"),
+}
+
+# PostgreSQL type OID -> Arrow type name, for a fixed snapshot schema
+PG_ARROW_TYPES = {16: "bool_", 20: "int64", 21: "int16", 23: "int32", 25: "string", 1043: "string",
+                  700: "float32", 701: "float64", 1082: "date32", 1114: "timestamp", 1184: "timestamp"}
+
+# PostgreSQL TO_CHAR date formats used by the canned queries
+TO_CHAR_MACRO = """
+    CREATE OR REPLACE MACRO to_char(value, fmt) AS
+        CASE fmt
+            WHEN 'Day' THEN rpad(dayname(value), 9, ' ')
+            WHEN 'FMDay' THEN dayname(value)
+            WHEN 'Dy' THEN left(dayname(value), 3)
+            WHEN 'Month' THEN rpad(monthname(value), 9, ' ')
+            WHEN 'FMMonth' THEN monthname(value)
+            WHEN 'Mon' THEN left(monthname(value), 3)
+            WHEN 'YYYY-MM' THEN strftime(value, '%Y-%m')
+            WHEN 'YYYY-MM-DD' THEN strftime(value, '%Y-%m-%d')
+            WHEN 'IYYY-IW' THEN strftime(value, '%G-%V')
+            ELSE error('to_char format not supported by the DuckDB backend: ' || fmt)
+        END
+"""
+
+
+# ------------------------ Sources ------------------------
+def _csv_views(db, csv_dir):
+    """Views over ``*_data.csv`` in ``csv_dir`` with the database's (lower-case) column names."""
+    for table, spec in TABLES.items():
+        path = os.path.join(csv_dir, spec["csv"])
+        options = "".join(f", {'dateformat' if '%H' not in fmt else 'timestampformat'} = '{fmt}'"
+                          for fmt in spec["dates"].values())
+        columns = ", ".join(f'"{col}" AS {col.lower()}' for col in spec["columns"])
+        db.execute(f"CREATE OR REPLACE VIEW {table} AS "
+                   f"SELECT {columns} FROM read_csv('{path}', header = true{options})")
+
+
+def _parquet_views(db, snapshot_dir):
+    for table in TABLES:
+        pattern = os.path.join(snapshot_dir, table, "**", "*.parquet")
+        partition = PARTITIONS.get(table)
+        exclude = f" EXCLUDE ({partition[0]})" if partition else ""
+        db.execute(f"CREATE OR REPLACE VIEW {table} AS "
+                   f"SELECT *{exclude} FROM read_parquet('{pattern}', hive_partitioning = true)")
+
+
+def _postgres_arrow(conn, table):
+    """``table`` as an Arrow table, streamed from a server-side cursor."""
+    import pyarrow as pa
+    batches, schema = [], None
+    with conn.cursor(name=f"snapshot_{table}") as cursor:
+        cursor.execute(f"SELECT * FROM {table}")
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+            if schema is None:
+                schema = pa.schema([(desc.name, _arrow_type(pa, desc.type_code)) for desc in cursor.description])
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            batches.append(pa.record_batch([pa.array(values, type=field.type)
+                                            for values, field in zip(columns, schema)], schema=schema))
+    conn.rollback()
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def _arrow_type(pa, type_code):
+    name = PG_ARROW_TYPES.get(type_code)
+    if name is None:
+        raise ValueError(f"No snapshot type for PostgreSQL type OID {type_code}")
+    return pa.timestamp("us") if name == "timestamp" else getattr(pa, name)()
+
+
+# ------------------------ Export ------------------------
+def _write_snapshot(db, out_dir, source):
+    """Write every table of ``db`` (views named as in TABLES) to Parquet and swap it in as ``out_dir``."""
+    staging = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    counts = {}
+    for table in TABLES:
+        target = os.path.join(staging, table)
+        partition = PARTITIONS.get(table)
+        if partition:
+            column, source_column = partition
+            db.execute(f"""
+                COPY (SELECT *, strftime({source_column}, '%Y-%m') AS {column} FROM {table})
+                TO '{target}' (FORMAT parquet, PARTITION_BY ({column}))
+            """)
+        else:
+            os.makedirs(target)
+            db.execute(f"COPY {table} TO '{os.path.join(target, 'data.parquet')}' (FORMAT parquet)")
+        counts[table] = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump({"created_at": datetime.now().isoformat(timespec="seconds"), "source": source,
+                   "rows": counts}, f, indent=2)
+
+    previous = f"{out_dir}.old-{os.getpid()}"
+    if os.path.exists(out_dir):
+        os.rename(out_dir, previous)
+    os.rename(staging, out_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return counts
+
+
+def export_from_csv(csv_dir, out_dir=SNAPSHOT_DIR):
+    import duckdb
+    db = duckdb.connect()
+    _csv_views(db, csv_dir)
+    return _write_snapshot(db, out_dir, source=f"csv:{os.path.abspath(csv_dir)}")
+
+
+def export_from_postgres(conn, out_dir=SNAPSHOT_DIR):
+    import duckdb
+    db = duckdb.connect()
+    for table in TABLES:
+        db.register(table, _postgres_arrow(conn, table))
+    return _write_snapshot(db, out_dir, source="postgres")
+
+
+# ------------------------ Backend ------------------------
+class DuckDBBackend:
+    """Canned analytics queries over the snapshot in ``snapshot_dir`` (bundled CSVs if there is none).
+
+    A newly exported snapshot is picked up on the next query. Results are cached
+    until then, since a snapshot never changes.
+    """
+
+    def __init__(self, snapshot_dir=SNAPSHOT_DIR, csv_dir=BASE_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.csv_dir = csv_dir
+        self._lock = threading.Lock()
+        self._db = None
+        self._version = None
+        self._results = {}
+        self.description = None
+
+    def _current_version(self):
+        try:
+            return os.stat(os.path.join(self.snapshot_dir, MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return "csv"
+
+    def _load(self, version):
+        import duckdb
+        db = duckdb.connect()
+        if version == "csv":
+            _csv_views(db, self.csv_dir)
+            self.description = f"bundled CSVs in {self.csv_dir}"
+        else:
+            _parquet_views(db, self.snapshot_dir)
+            with open(os.path.join(self.snapshot_dir, MANIFEST)) as f:
+                manifest = json.load(f)
+            self.description = f"snapshot of {manifest['created_at']} (from {manifest['source']})"
+        db.execute(TO_CHAR_MACRO)
+        db.execute(LISTING_CLAIM_STATE_DDL)
+        for name, (ddl, _, recompute_sql) in SUMMARIES.items():
+            db.execute(ddl)
+            db.execute(f"INSERT INTO {name} {recompute_sql}")
+        return db
+
+    def _connection(self):
+        version = self._current_version()
+        with self._lock:
+            if version != self._version:
+                self._db = self._load(version)
+                self._version = version
+                self._results = {}
+            # A cursor is a separate connection to the same database, safe to use on this thread
+            return self._db.cursor(), version
+
+    def query(self, query, params=None):
+        """Result of ``query``; ``params`` are bound to its ``%(name)s`` placeholders as in psycopg2."""
+        key = (" ".join(query.split()), tuple(sorted((params or {}).items())))
+        if params:
+            query = _PYFORMAT_PARAM.sub(r"$\1", query).replace("%%", "%")
+        cursor, version = self._connection()
+        try:
+            df = self._results.get(key)
+            if df is None:
+                with perf.timer("execute"):
+                    result = cursor.execute(query, params or None)
+                with perf.timer("frame"):
+                    types = [desc[1] for desc in result.description]
+                    df = result.df()
+                    df.columns = [col.lower() for col in df.columns]
+                    for col, type_name in zip(df.columns, types):
+                        # SUM over integers is a 128-bit HUGEINT here (pandas float); PostgreSQL gives bigint
+                        if type_name == "HUGEINT":
+                            df[col] = df[col].astype("int64" if df[col].notna().all() else "Int64")
+                    df.attrs["truncated"] = False
+                with self._lock:
+                    if version == self._version:
+                        self._results[key] = df
+            return df
+        finally:
+            cursor.close()
+
+
+_PYFORMAT_PARAM = re.compile(r"%\((\w+)\)s")
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = DuckDBBackend()
+    return _backend
+
+
+def read_analytics(query, params=None, backend=None, timeout=None, owners=None, ttl=None, tables=None):
+    """Run a canned analytics query on ``backend`` (``"postgres"`` or ``"duckdb"``; default ANALYTICS_BACKEND).
+
+    ``ttl`` and ``tables`` only apply to the PostgreSQL result cache; snapshot results live
+    as long as the snapshot.
+    """
+    backend = backend or ANALYTICS_BACKEND
+    if backend == "duckdb":
+        return get_backend().query(query, params)
+    if backend != "postgres":
+        raise ValueError(f"Unknown analytics backend: {backend}")
+    return read_sql_cached(query, params=params, ttl=ttl, timeout=timeout, owners=owners, tables=tables)
+
+
+# ------------------------ CLI ------------------------
+def _normalized(df):
+    """Rows as sorted strings with numbers rounded, since ties come back in either order."""
+    import pandas as pd
+    df = df.copy()
+    for col in df.columns:
+        try:
+            df[col] = pd.to_numeric(df[col].astype(object)).round(6)
+        except (ValueError, TypeError):
+            pass
+    return df.astype(str).sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def _compare():
+    """Run every canned query on both backends; returns the number of queries whose results differ."""
+    from queries import REGISTRY
+    duck = get_backend()
+    mismatches = 0
+    for query in REGISTRY:
+        if "duckdb" not in query.backends:
+            continue
+        # Not query.run(): under ``python columnar.py`` that would use a second copy of this module
+        params = query.bind() or None
+        started = time.perf_counter()
+        expected = read_analytics(query.sql, params, "postgres")
+        pg_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        actual = read_analytics(query.sql, params, "duckdb")
+        duck_ms = (time.perf_counter() - started) * 1000
+        same = list(expected.columns) == list(actual.columns) and len(expected) == len(actual)
+        if same and "LIMIT" not in query.sql.upper():
+            same = _normalized(expected).equals(_normalized(actual))
+        mismatches += not same
+        print(f"{'OK  ' if same else 'DIFF'} postgres {pg_ms:7.1f} ms  duckdb {duck_ms:7.1f} ms  {query.title}")
+    print(f"DuckDB read the {duck.description}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet snapshots and the DuckDB analytics backend.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export")
+    export_parser.add_argument("--from-csv", metavar="DIR", default=None,
+                               help="build the snapshot from the CSVs in DIR instead of the database")
+    export_parser.add_argument("--out", default=SNAPSHOT_DIR)
+    sub.add_parser("compare")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        started = time.perf_counter()
+        if args.from_csv:
+            counts = export_from_csv(args.from_csv, args.out)
+        else:
+            from db import connection
+            with connection() as conn:
+                counts = export_from_postgres(conn, args.out)
+        for table, rows in counts.items():
+            print(f"  {table}: {rows:,} rows")
+        print(f"Snapshot written to {args.out} in {time.perf_counter() - started:.1f}s")
+    else:
+        raise SystemExit(1 if _compare() else 0)
+
+
+if __name__ == "__main__":
+    main()
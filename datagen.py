@@ -0,0 +1,185 @@
+"""Seeded synthetic data generator for benchmarking at realistic volumes.
+
+Writes the four ``*_data.csv`` files with the same columns and date formats as
+the shipped datasets, ``scale`` times larger. Value distributions are sampled
+from the shipped CSVs: provider/receiver types, claim status mix, Food_Name,
+Food_Type, Meal_Type, quantities, expiry spread and how long before expiry
+claims are made. Listings inherit Provider_Type and Location from their
+provider, as in the real data. Cities are Zipf-skewed so that some cities are
+dense, as in real usage.
+
+Usage:
+    python datagen.py --scale 10000 --out data/sf10000     # ~10M rows per table
+    python ingest.py --dir data/sf10000
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from schema import TABLES
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+CHUNK_ROWS = 1_000_000
+
+
+def _read_source(table):
+    return pd.read_csv(os.path.join(SOURCE_DIR, TABLES[table]["csv"]))
+
+
+def _empirical(rng, series, size):
+    """Sample ``size`` values with the frequencies observed in ``series``."""
+    counts = series.value_counts(normalize=True)
+    return rng.choice(counts.index.to_numpy(), size=size, p=counts.to_numpy())
+
+
+class Generator:
+    def __init__(self, scale, seed=42, days=None):
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+
+        self.providers_src = _read_source("providers")
+        self.receivers_src = _read_source("receivers")
+        self.listings_src = _read_source("food_listings")
+        self.claims_src = _read_source("claims")
+
+        self.n_providers = int(len(self.providers_src) * scale)
+        self.n_receivers = int(len(self.receivers_src) * scale)
+        self.n_listings = int(len(self.listings_src) * scale)
+        self.n_claims = int(len(self.claims_src) * scale)
+
+        # Expiry window: same start as the shipped data, optionally stretched
+        expiry = pd.to_datetime(self.listings_src["Expiry_Date"], format=TABLES["food_listings"]["dates"]["Expiry_Date"])
+        self.expiry_start = expiry.min()
+        self.expiry_offsets = (expiry - self.expiry_start).dt.days.to_numpy()
+        if days:
+            self.expiry_offsets = self.expiry_offsets * (days / max(self.expiry_offsets.max() + 1, 1))
+
+        # How long before (or after) expiry claims happen, in minutes
+        claims = self.claims_src.merge(self.listings_src[["Food_ID", "Expiry_Date"]], on="Food_ID")
+        claim_time = pd.to_datetime(claims["Timestamp"], format=TABLES["claims"]["dates"]["Timestamp"])
+        claim_expiry = pd.to_datetime(claims["Expiry_Date"], format=TABLES["food_listings"]["dates"]["Expiry_Date"])
+        self.claim_lead_minutes = ((claim_expiry - claim_time).dt.total_seconds() // 60).to_numpy()
+
+        # City pool grows with sqrt(scale); popularity is Zipf-like
+        base_cities = pd.unique(pd.concat([self.providers_src["City"], self.receivers_src["City"]]))
+        copies = max(1, math.ceil(math.sqrt(scale)))
+        self.cities = np.array([city if k == 0 else f"{city} {k + 1}" for k in range(copies) for city in base_cities])
+        weights = 1.0 / np.arange(1, len(self.cities) + 1) ** 0.8
+        self.city_weights = weights / weights.sum()
+        self.rng.shuffle(self.cities)
+
+    def _chunks(self, total):
+        for start in range(0, total, CHUNK_ROWS):
+            yield start, min(CHUNK_ROWS, total - start)
+
+    def providers(self):
+        src = self.providers_src
+        for start, size in self._chunks(self.n_providers):
+            yield pd.DataFrame({
+                "Provider_ID": np.arange(start + 1, start + size + 1),
+                "Name": self.rng.choice(src["Name"].to_numpy(), size),
+                "Type": _empirical(self.rng, src["Type"], size),
+                "Address": self.rng.choice(src["Address"].to_numpy(), size),
+                "City": self.rng.choice(self.cities, size, p=self.city_weights),
+                "Contact": self.rng.choice(src["Contact"].to_numpy(), size),
+            })
+
+    def receivers(self):
+        src = self.receivers_src
+        for start, size in self._chunks(self.n_receivers):
+            yield pd.DataFrame({
+                "Receiver_ID": np.arange(start + 1, start + size + 1),
+                "Name": self.rng.choice(src["Name"].to_numpy(), size),
+                "Type": _empirical(self.rng, src["Type"], size),
+                "City": self.rng.choice(self.cities, size, p=self.city_weights),
+                "Contact": self.rng.choice(src["Contact"].to_numpy(), size),
+            })
+
+    def food_listings(self, provider_type, provider_city):
+        src = self.listings_src
+        for start, size in self._chunks(self.n_listings):
+            provider_ids = self.rng.integers(1, self.n_providers + 1, size)
+            offsets = self.rng.choice(self.expiry_offsets, size)
+            yield pd.DataFrame({
+                "Food_ID": np.arange(start + 1, start + size + 1),
+                "Food_Name": _empirical(self.rng, src["Food_Name"], size),
+                "Quantity": self.rng.choice(src["Quantity"].to_numpy(), size),
+                "Expiry_Date": self.expiry_start + pd.to_timedelta(np.floor(offsets), unit="D"),
+                "Provider_ID": provider_ids,
+                "Provider_Type": provider_type[provider_ids - 1],
+                "Location": provider_city[provider_ids - 1],
+                "Food_Type": _empirical(self.rng, src["Food_Type"], size),
+                "Meal_Type": _empirical(self.rng, src["Meal_Type"], size),
+            })
+
+    def claims(self, listing_expiry):
+        src = self.claims_src
+        for start, size in self._chunks(self.n_claims):
+            food_ids = self.rng.integers(1, self.n_listings + 1, size)
+            lead = self.rng.choice(self.claim_lead_minutes, size)
+            yield pd.DataFrame({
+                "Claim_ID": np.arange(start + 1, start + size + 1),
+                "Food_ID": food_ids,
+                "Receiver_ID": self.rng.integers(1, self.n_receivers + 1, size),
+                "Status": _empirical(self.rng, src["Status"], size),
+                "Timestamp": listing_expiry[food_ids - 1] - pd.to_timedelta(lead, unit="min"),
+            })
+
+
+def _write(table, chunks, out_dir):
+    path = os.path.join(out_dir, TABLES[table]["csv"])
+    date_format = next(iter(TABLES[table]["dates"].values()), None)
+    rows = 0
+    started = time.perf_counter()
+    for i, chunk in enumerate(chunks):
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=(i == 0), index=False, date_format=date_format)
+        rows += len(chunk)
+    print(f"{table}: {rows:,} rows -> {path} ({time.perf_counter() - started:.1f}s)")
+
+
+def generate(scale, out_dir, seed=42, days=None):
+    os.makedirs(out_dir, exist_ok=True)
+    gen = Generator(scale, seed=seed, days=days)
+
+    # Listings need each provider's type and city, claims each listing's expiry date
+    provider_type, provider_city = [], []
+
+    def providers():
+        for chunk in gen.providers():
+            provider_type.append(chunk["Type"].to_numpy())
+            provider_city.append(chunk["City"].to_numpy())
+            yield chunk
+
+    _write("providers", providers(), out_dir)
+    _write("receivers", gen.receivers(), out_dir)
+
+    listing_expiry = []
+
+    def listings():
+        for chunk in gen.food_listings(np.concatenate(provider_type), np.concatenate(provider_city)):
+            listing_expiry.append(chunk["Expiry_Date"].to_numpy())
+            yield chunk
+
+    _write("food_listings", listings(), out_dir)
+    _write("claims", gen.claims(np.concatenate(listing_expiry)), out_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate scaled synthetic copies of the CSV datasets.")
+    parser.add_argument("--scale", type=float, default=10, help="multiple of the shipped row counts (default: 10)")
+    parser.add_argument("--out", default=None, help="output directory (default: data/sf<scale>)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=None,
+                        help="spread expiry dates over this many days (default: same window as the shipped data)")
+    args = parser.parse_args()
+
+    out_dir = args.out or os.path.join(SOURCE_DIR, "data", f"sf{args.scale:g}")
+    generate(args.scale, out_dir, seed=args.seed, days=args.days)
+
+
+if __name__ == "__main__":
+    main()
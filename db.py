@@ -0,0 +1,229 @@
+"""Process-wide PostgreSQL connection pool shared by every page of the app."""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+# ------------------------ Settings ------------------------
+# Defaults match the original hard-coded connection; override with environment variables.
+DB_SETTINGS = {
+    "host": os.environ.get("FOOD_WASTE_DB_HOST", "localhost"),
+    "port": int(os.environ.get("FOOD_WASTE_DB_PORT", "5432")),
+    "database": os.environ.get("FOOD_WASTE_DB_NAME", "food_waste"),
+    "user": os.environ.get("FOOD_WASTE_DB_USER", "postgres"),
+    "password": os.environ.get("FOOD_WASTE_DB_PASSWORD", "POSTGRESQL"),  # 🔁 Change this if your password is different
+}
+
+POOL_MIN_SIZE = int(os.environ.get("FOOD_WASTE_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.environ.get("FOOD_WASTE_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.environ.get("FOOD_WASTE_POOL_TIMEOUT", "10"))      # seconds to wait for a free connection
+POOL_MAX_AGE = float(os.environ.get("FOOD_WASTE_POOL_MAX_AGE", "1800"))    # recycle connections older than this
+POOL_CHECK_IDLE = float(os.environ.get("FOOD_WASTE_POOL_CHECK_IDLE", "30"))  # ping connections idle longer than this
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free within the pool timeout."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are health-checked on checkout, recycled when broken or too old,
+    and always handed back with no open transaction.
+    """
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 max_age=POOL_MAX_AGE, check_idle=POOL_CHECK_IDLE, **settings):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check_idle = check_idle
+        self.settings = settings or dict(DB_SETTINGS)
+
+        self._cond = threading.Condition()
+        self._idle = []        # stack of (conn, created_at, returned_at)
+        self._created_at = {}  # id(conn) -> creation time for connections currently checked out
+        self._size = 0         # idle + checked out
+        self._closed = False
+
+        self._metrics = {
+            "checkouts": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "exhausted": 0,
+            "created": 0,
+            "discarded": 0,
+            "failed_health_checks": 0,
+        }
+
+        # Warm up; if the server is unreachable the first checkout reports the error instead.
+        for _ in range(min_size):
+            try:
+                conn = self._connect()
+            except psycopg2.OperationalError:
+                break
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+            self._size += 1
+
+    # ------------------------ Internals ------------------------
+    def _connect(self):
+        conn = psycopg2.connect(**self.settings)
+        with self._cond:
+            self._metrics["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            self._metrics["discarded"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, created_at, returned_at):
+        now = time.monotonic()
+        if conn.closed or now - created_at > self.max_age:
+            return False
+        if now - returned_at > self.check_idle:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                with self._cond:
+                    self._metrics["failed_health_checks"] += 1
+                return False
+        return True
+
+    # ------------------------ Checkout / Return ------------------------
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        counted_exhaustion = False
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeout("connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    if not counted_exhaustion:
+                        self._metrics["exhausted"] += 1
+                        counted_exhaustion = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"no database connection free after {self.timeout:.1f}s "
+                                          f"(pool size {self.max_size})")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, created_at, returned_at = self._idle.pop()
+                else:
+                    conn, created_at, returned_at = None, None, None
+                    self._size += 1  # reserve the slot before connecting outside the lock
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                created_at = time.monotonic()
+            elif not self._is_healthy(conn, created_at, returned_at):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._created_at[id(conn)] = created_at
+                self._metrics["checkouts"] += 1
+                self._metrics["wait_time_total"] += waited
+                self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], waited)
+            return conn
+
+    def putconn(self, conn, broken=False):
+        with self._cond:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        with self._cond:
+            if broken or conn.closed or self._closed:
+                self._discard(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a ``with`` block.
+
+        Any transaction left open by the caller is rolled back on return, so
+        writes must be committed explicitly, exactly as with a plain connection.
+        """
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    # ------------------------ Metrics / Shutdown ------------------------
+    def stats(self):
+        with self._cond:
+            stats = dict(self._metrics)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["max_size"] = self.max_size
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+
+# ------------------------ Process-wide pool ------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the pool shared by every session in this process, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def connection():
+    """Context manager checking a connection out of the shared pool."""
+    return get_pool().connection()
+
+
+def pool_stats():
+    return get_pool().stats()
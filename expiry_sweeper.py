@@ -0,0 +1,215 @@
+"""Incremental expiry sweeper for food listings.
+
+Listings are found by expiry day through migration 4's partial index on live
+listings, ``(expiry_date, food_id) WHERE expired_at IS NULL``: Postgres keeps it
+current on every insert, delete and ``Expiry_Date`` edit, whatever order the
+writes commit in, and expiring a listing takes it out. A tick
+
+1. reads only the index entries dated before the sweep day, and for those
+   listings sets ``expired_at``, cancels their Pending claims and records a
+   ``waste_events`` row for each one that never got a Completed claim,
+2. reads the next day a listing is due from the front of the index,
+3. saves the sweep day to ``sweeper_checkpoint``
+
+all in one transaction. Listings that fell due while no sweeper ran are still
+in the index, so a restart picks up where the last committed tick stopped;
+``food_listings`` itself is never scanned. The cancelled claims a tick reports
+are the ones recorded in ``waste_events``.
+
+Needs migration 4 (``python migrations.py upgrade``).
+
+Usage:
+    python expiry_sweeper.py once [--as-of YYYY-MM-DD]   # one tick
+    python expiry_sweeper.py run [--interval SECONDS]     # tick forever
+    python expiry_sweeper.py status
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+
+from db import connection
+
+SWEEP_INTERVAL = float(os.environ.get("FOOD_WASTE_SWEEP_INTERVAL", "60"))  # seconds between ticks
+SWEEPER_IN_APP = os.environ.get("FOOD_WASTE_SWEEPER", "0") == "1"          # run the sweeper inside the app
+CHECKPOINT_NAME = "expiry"
+
+logger = logging.getLogger(__name__)
+
+
+class ExpirySweeper:
+    def __init__(self, name=CHECKPOINT_NAME):
+        self.name = name
+        self.swept_through = None
+        self.next_due = None   # earliest Expiry_Date of a live listing, as of the last tick
+        self._lock = threading.Lock()
+        self._metrics = {
+            "ticks": 0,
+            "listings_expired": 0,
+            "quantity_wasted": 0,
+            "claims_cancelled": 0,
+            "last_tick_ms": 0.0,
+            "last_tick_at": None,
+        }
+
+    def _expire(self, cursor, as_of):
+        """Expire the listings due before ``as_of``; returns ``(expired, quantity_wasted, claims_cancelled)``."""
+        cursor.execute("""
+            WITH expired AS (
+                UPDATE food_listings SET expired_at = now()
+                WHERE expired_at IS NULL AND expiry_date < %(as_of)s
+                RETURNING *
+            ), cancelled AS (
+                UPDATE claims c SET status = 'Cancelled'
+                FROM expired e
+                WHERE c.food_id = e.food_id AND c.status = 'Pending'
+                RETURNING c.food_id
+            ), wasted AS (
+                INSERT INTO waste_events (food_id, provider_id, location, food_type, meal_type, quantity,
+                                          expiry_date, expired_at, cancelled_claims)
+                SELECT e.food_id, e.provider_id, e.location, e.food_type, e.meal_type, e.quantity,
+                       e.expiry_date, e.expired_at,
+                       (SELECT COUNT(*) FROM cancelled x WHERE x.food_id = e.food_id)
+                FROM expired e
+                WHERE NOT EXISTS (SELECT 1 FROM claims c
+                                  WHERE c.food_id = e.food_id AND c.status = 'Completed')
+                RETURNING quantity, cancelled_claims
+            )
+            SELECT (SELECT COUNT(*) FROM expired),
+                   (SELECT COALESCE(SUM(quantity), 0) FROM wasted),
+                   (SELECT COALESCE(SUM(cancelled_claims), 0) FROM wasted)
+        """, {"as_of": as_of})
+        expired, wasted, cancelled = cursor.fetchone()
+        return expired, int(wasted), int(cancelled)
+
+    def tick(self, conn, as_of=None):
+        """Run one sweep in one transaction; returns what it did, or None if another sweeper holds the lock."""
+        as_of = as_of or date.today()
+        started = time.perf_counter()
+        with self._lock, conn.cursor() as cursor:
+            # One sweeper per database; others skip their tick instead of waiting
+            cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('expiry_sweeper'))")
+            if not cursor.fetchone()[0]:
+                conn.rollback()
+                return None
+            try:
+                expired, wasted, cancelled = self._expire(cursor, as_of)
+                cursor.execute("SELECT MIN(expiry_date) FROM food_listings WHERE expired_at IS NULL")
+                next_due = cursor.fetchone()[0]
+                cursor.execute("""
+                    INSERT INTO sweeper_checkpoint (name, swept_through) VALUES (%s, %s)
+                    ON CONFLICT (name) DO UPDATE SET swept_through = EXCLUDED.swept_through, updated_at = now()
+                """, (self.name, as_of))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self.swept_through = as_of
+            self.next_due = next_due
+
+            self._metrics["ticks"] += 1
+            self._metrics["listings_expired"] += expired
+            self._metrics["quantity_wasted"] += wasted
+            self._metrics["claims_cancelled"] += cancelled
+            self._metrics["last_tick_ms"] = (time.perf_counter() - started) * 1000
+            self._metrics["last_tick_at"] = datetime.now()
+        if expired or cancelled:
+            _invalidate_cached_results()
+        return {"expired": expired, "quantity_wasted": wasted, "claims_cancelled": cancelled, "next_due": next_due}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["swept_through"] = self.swept_through
+            stats["next_due"] = self.next_due
+        return stats
+
+
+def _invalidate_cached_results():
+    # Only meaningful inside the app process, where the result cache lives
+    import query_cache
+    query_cache.invalidate_table("food_listings")
+    query_cache.invalidate_table("claims")
+
+
+# ------------------------ Background thread ------------------------
+_sweeper = None
+_thread = None
+_stop = threading.Event()
+
+
+def get_sweeper():
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = ExpirySweeper()
+    return _sweeper
+
+
+def _loop(interval):
+    sweeper = get_sweeper()
+    while not _stop.is_set():
+        try:
+            with connection() as conn:
+                sweeper.tick(conn)
+        except Exception:
+            logger.exception("Expiry sweeper tick failed")
+        _stop.wait(interval)
+
+
+def start_background(interval=SWEEP_INTERVAL):
+    """Start the process-wide sweeper thread once; later calls are no-ops."""
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _stop.clear()
+        _thread = threading.Thread(target=_loop, args=(interval,), name="expiry-sweeper", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def stop_background():
+    _stop.set()
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Expire listings past their Expiry_Date incrementally.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    once_parser = sub.add_parser("once")
+    once_parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                             help="expire listings dated before this day (default: today)")
+    run_parser = sub.add_parser("run")
+    run_parser.add_argument("--interval", type=float, default=SWEEP_INTERVAL)
+    sub.add_parser("status")
+    args = parser.parse_args()
+
+    if args.command == "once":
+        with connection() as conn:
+            result = get_sweeper().tick(conn, as_of=args.as_of)
+        print("Another sweeper holds the lock; nothing done." if result is None else
+              f"Expired: {result['expired']:,}  wasted quantity: {result['quantity_wasted']:,}  "
+              f"cancelled claims: {result['claims_cancelled']:,}  next due: {result['next_due']}")
+    elif args.command == "run":
+        print(f"Sweeping every {args.interval:g}s; Ctrl+C to stop.")
+        try:
+            _loop(args.interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        with connection() as conn, conn.cursor() as cursor:
+            cursor.execute("SELECT name, swept_through, updated_at FROM sweeper_checkpoint")
+            for name, swept_through, updated_at in cursor.fetchall():
+                print(f"{name}: swept through {swept_through}, at {updated_at:%Y-%m-%d %H:%M:%S}")
+            cursor.execute("""
+                SELECT COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(cancelled_claims), 0)
+                FROM waste_events
+            """)
+            events, quantity, cancelled = cursor.fetchone()
+            print(f"Waste events: {events:,} listings, {quantity:,} units, {cancelled:,} pending claims cancelled")
+            cursor.execute("SELECT COUNT(*) FROM food_listings WHERE expired_at IS NULL")
+            print(f"Live listings: {cursor.fetchone()[0]:,}")
+
+
+if __name__ == "__main__":
+    main()
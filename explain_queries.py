@@ -0,0 +1,99 @@
+"""Record query plans and timings for every canned analytics query.
+
+Runs ``EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)`` on each query in
+``queries.REGISTRY`` (with its default parameters) and saves the plans with their
+planning/execution time and buffer counts, so runs before and after a schema
+change can be compared.
+
+Usage:
+    python explain_queries.py record LABEL          # writes explain_reports/LABEL.json
+    python explain_queries.py compare BEFORE AFTER
+"""
+import argparse
+import json
+import os
+from datetime import datetime
+
+from db import connection
+from queries import REGISTRY
+from query_registry import PAGES
+
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "explain_reports")
+
+
+def canned_queries():
+    """``(key, sql, params)`` for every canned query; keys are prefixed with the page they come from."""
+    for query in REGISTRY:
+        yield f"{PAGES[query.page]} {query.title}", query.sql, query.bind() or None
+
+
+def explain(conn, query, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query.strip().rstrip(";"), params)
+        result = cursor.fetchone()[0][0]
+    conn.rollback()
+    plan = result["Plan"]  # buffer counts on the root node include all children
+    return {
+        "planning_ms": result.get("Planning Time"),
+        "execution_ms": result.get("Execution Time"),
+        "shared_hit_blocks": plan.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": plan.get("Shared Read Blocks", 0),
+        "plan": result,
+    }
+
+
+def record(conn, label):
+    """Explain every canned query, save ``explain_reports/<label>.json`` and return the report."""
+    report = {"label": label, "recorded_at": datetime.now().isoformat(timespec="seconds"), "queries": {}}
+    for key, query, params in canned_queries():
+        try:
+            report["queries"][key] = explain(conn, query, params)
+        except Exception as e:
+            conn.rollback()
+            report["queries"][key] = {"error": str(e)}
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    path = os.path.join(REPORT_DIR, f"{label}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1, default=str)
+    print(f"Wrote {path}")
+    return report
+
+
+def load(label):
+    with open(os.path.join(REPORT_DIR, f"{label}.json")) as f:
+        return json.load(f)
+
+
+def print_comparison(before, after):
+    print(f"{'Query':<70} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for key, old in before["queries"].items():
+        new = after["queries"].get(key, {})
+        old_ms, new_ms = old.get("execution_ms"), new.get("execution_ms")
+        if old_ms is None or new_ms is None:
+            print(f"{key[:70]:<70} {'error' if old_ms is None else f'{old_ms:.2f}':>10} "
+                  f"{'error' if new_ms is None else f'{new_ms:.2f}':>10}")
+            continue
+        speedup = old_ms / new_ms if new_ms else float("inf")
+        print(f"{key[:70]:<70} {old_ms:>10.2f} {new_ms:>10.2f} {speedup:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and compare plans of the canned queries.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record_parser = sub.add_parser("record")
+    record_parser.add_argument("label")
+    compare_parser = sub.add_parser("compare")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        with connection() as conn:
+            record(conn, args.label)
+    else:
+        print_comparison(load(args.before), load(args.after))
+
+
+if __name__ == "__main__":
+    main()
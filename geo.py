@@ -0,0 +1,229 @@
+"""Coordinates and proximity search for providers and receivers.
+
+The dataset's cities are generated names with no real-world location, so the
+bundled ``city_coords.csv`` gives every city a stable synthetic coordinate
+(derived from a hash of its name, inside the continental US). ``geocode``
+copies it into the ``city_coords`` table and fills ``latitude``/``longitude``
+on providers and receivers from their City. Real coordinates can be used by
+editing the CSV and geocoding again.
+
+Nearest-neighbour search is available two ways:
+
+* in-process: ``GridIndex``, a uniform lat/lon grid, answers "nearest N within
+  R km" by checking only the cells that overlap the search radius;
+* in SQL: ``nearest_providers(lat, lon, radius_km, n[, as_of])`` (migration 5),
+  a bounding-box prefilter on an index of (latitude, longitude) followed by an
+  exact haversine distance.
+
+Usage:
+    python geo.py build-table [--dir DIR ...]    # add missing cities to city_coords.csv
+    python geo.py geocode                         # load city_coords.csv and fill lat/lon
+    python geo.py nearest LAT LON [--radius KM] [--limit N] [--as-of DATE]
+"""
+import argparse
+import hashlib
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from db import connection
+from schema import TABLES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CITY_COORDS_CSV = os.path.join(BASE_DIR, "city_coords.csv")
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.045
+# Bounding box the synthetic city coordinates are drawn from (continental US)
+LAT_RANGE = (25.0, 49.0)
+LON_RANGE = (-124.0, -67.0)
+DEFAULT_CELL_KM = 25.0
+
+
+# ------------------------ Distance ------------------------
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; accepts scalars or numpy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _lon_degrees(radius_km, lat):
+    """Longitude span of ``radius_km`` at latitude ``lat`` (whole circle near the poles)."""
+    cos_lat = math.cos(math.radians(lat))
+    return 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+
+
+# ------------------------ In-process grid index ------------------------
+class GridIndex:
+    """Points bucketed into square cells of ``cell_km`` (measured in latitude degrees)."""
+
+    def __init__(self, ids, lats, lons, cell_km=DEFAULT_CELL_KM):
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        self.ids = np.asarray(ids)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        cells = defaultdict(list)
+        rows = np.floor(self.lats / self.cell_deg).astype(int)
+        cols = np.floor(self.lons / self.cell_deg).astype(int)
+        for position, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            cells[cell].append(position)
+        self.cells = {cell: np.array(positions) for cell, positions in cells.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def nearest(self, lat, lon, n=10, radius_km=25.0):
+        """``[(id, distance_km), ...]`` of the ``n`` closest points within ``radius_km``, closest first."""
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = _lon_degrees(radius_km, lat)
+        row_range = range(math.floor((lat - dlat) / self.cell_deg), math.floor((lat + dlat) / self.cell_deg) + 1)
+        col_range = range(math.floor((lon - dlon) / self.cell_deg), math.floor((lon + dlon) / self.cell_deg) + 1)
+        candidates = [self.cells[(r, c)] for r in row_range for c in col_range if (r, c) in self.cells]
+        if not candidates:
+            return []
+        positions = np.concatenate(candidates)
+        distances = haversine_km(lat, lon, self.lats[positions], self.lons[positions])
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        order = np.lexsort((self.ids[positions], distances))[:n]  # ties (same city) by id, as in SQL
+        return [(self.ids[p].item(), float(d)) for p, d in zip(positions[order], distances[order])]
+
+
+def load_provider_index(conn, as_of=None, cell_km=DEFAULT_CELL_KM):
+    """GridIndex over providers that have unexpired, not yet completed listings on ``as_of``."""
+    as_of = as_of or date.today()
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT p.provider_id, p.latitude, p.longitude
+            FROM providers p
+            WHERE p.latitude IS NOT NULL
+              AND EXISTS (SELECT 1 FROM food_listings f
+                          WHERE f.provider_id = p.provider_id
+                            AND f.expiry_date >= %s AND f.expired_at IS NULL
+                            AND NOT EXISTS (SELECT 1 FROM claims c
+                                            WHERE c.food_id = f.food_id AND c.status = 'Completed'))
+        """, (as_of,))
+        rows = cursor.fetchall()
+    conn.rollback()
+    if not rows:
+        return GridIndex([], [], [], cell_km=cell_km)
+    ids, lats, lons = zip(*rows)
+    return GridIndex(ids, lats, lons, cell_km=cell_km)
+
+
+# ------------------------ City table / Geocoding ------------------------
+def city_coordinates(city):
+    """Stable synthetic ``(latitude, longitude)`` for a city name."""
+    digest = hashlib.sha1(city.strip().lower().encode("utf-8")).digest()
+    u = int.from_bytes(digest[:8], "big") / 2 ** 64
+    v = int.from_bytes(digest[8:16], "big") / 2 ** 64
+    return (round(LAT_RANGE[0] + u * (LAT_RANGE[1] - LAT_RANGE[0]), 6),
+            round(LON_RANGE[0] + v * (LON_RANGE[1] - LON_RANGE[0]), 6))
+
+
+def build_table(directories):
+    """Add every city found in the datasets under ``directories`` to city_coords.csv; returns how many."""
+    if os.path.exists(CITY_COORDS_CSV):
+        table = pd.read_csv(CITY_COORDS_CSV)
+    else:
+        table = pd.DataFrame(columns=["City", "Latitude", "Longitude"])
+    known = set(table["City"])
+
+    cities = set()
+    for directory in directories:
+        for name, column in (("providers", "City"), ("receivers", "City"), ("food_listings", "Location")):
+            path = os.path.join(directory, TABLES[name]["csv"])
+            if os.path.exists(path):
+                cities.update(pd.read_csv(path, usecols=[column])[column].dropna().unique())
+
+    new = sorted(cities - known)
+    if new:
+        rows = pd.DataFrame([(city, *city_coordinates(city)) for city in new],
+                            columns=["City", "Latitude", "Longitude"])
+        table = pd.concat([table, rows], ignore_index=True).sort_values("City")
+        table.to_csv(CITY_COORDS_CSV, index=False)
+    return len(new)
+
+
+def geocode(conn):
+    """Load city_coords.csv into ``city_coords`` and set lat/lon on providers and receivers from City."""
+    table = pd.read_csv(CITY_COORDS_CSV)
+    counts = {}
+    with conn.cursor() as cursor:
+        cursor.execute("TRUNCATE city_coords")
+        execute_values(cursor, "INSERT INTO city_coords (city, latitude, longitude) VALUES %s",
+                       list(table.itertuples(index=False, name=None)), page_size=10000)
+        for name in ("providers", "receivers"):
+            cursor.execute(f"""
+                UPDATE {name} t SET latitude = c.latitude, longitude = c.longitude
+                FROM city_coords c
+                WHERE c.city = t.city
+                  AND (t.latitude, t.longitude) IS DISTINCT FROM (c.latitude, c.longitude)
+            """)
+            updated = cursor.rowcount
+            cursor.execute(f"SELECT COUNT(*) FROM {name} WHERE latitude IS NULL")
+            counts[name] = (updated, cursor.fetchone()[0])
+        cursor.execute("ANALYZE providers")
+        cursor.execute("ANALYZE receivers")
+    conn.commit()
+    return counts
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Geocode providers/receivers and search by distance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build-table")
+    build_parser.add_argument("--dir", action="append", default=None,
+                              help="dataset directory to take cities from (repeatable; default: the shipped CSVs)")
+    sub.add_parser("geocode")
+    nearest_parser = sub.add_parser("nearest")
+    nearest_parser.add_argument("lat", type=float)
+    nearest_parser.add_argument("lon", type=float)
+    nearest_parser.add_argument("--radius", type=float, default=50.0, help="km (default: 50)")
+    nearest_parser.add_argument("--limit", type=int, default=10)
+    nearest_parser.add_argument("--as-of", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+
+    if args.command == "build-table":
+        added = build_table(args.dir or [BASE_DIR])
+        print(f"Added {added} cities to {CITY_COORDS_CSV}")
+    elif args.command == "geocode":
+        with connection() as conn:
+            counts = geocode(conn)
+        for name, (updated, missing) in counts.items():
+            print(f"{name}: {updated:,} rows updated, {missing:,} without coordinates")
+    else:
+        as_of = args.as_of or date.today()
+        with connection() as conn:
+            started = time.perf_counter()
+            index = load_provider_index(conn, as_of)
+            loaded = time.perf_counter() - started
+            started = time.perf_counter()
+            nearest = index.nearest(args.lat, args.lon, n=args.limit, radius_km=args.radius)
+            searched = time.perf_counter() - started
+            print(f"In-process: {len(index):,} providers indexed in {loaded * 1000:.0f} ms, "
+                  f"search {searched * 1000:.2f} ms")
+            for provider_id, distance in nearest:
+                print(f"  provider {provider_id:>8}  {distance:8.2f} km")
+
+            with conn.cursor() as cursor:
+                started = time.perf_counter()
+                cursor.execute("SELECT * FROM nearest_providers(%s, %s, %s, %s, %s)",
+                               (args.lat, args.lon, args.radius, args.limit, as_of))
+                rows = cursor.fetchall()
+                print(f"SQL nearest_providers: {(time.perf_counter() - started) * 1000:.2f} ms")
+            for provider_id, name, city, distance, listings, quantity in rows:
+                print(f"  provider {provider_id:>8}  {distance:8.2f} km  {name} ({city}): "
+                      f"{listings} listings, {quantity} units")
+
+
+if __name__ == "__main__":
+    main()
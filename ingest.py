@@ -0,0 +1,138 @@
+"""Bulk-load the ``*_data.csv`` files with PostgreSQL ``COPY``.
+
+Each CSV is read in chunks, dates are parsed on the way through, and every chunk
+is streamed with ``COPY ... FROM STDIN`` into a temporary staging table. The
+staging table is then upserted into the real table (existing IDs updated, new
+ones inserted), so re-running the loader on a newer dump refreshes existing rows
+instead of failing on duplicate keys. The upsert doesn't use ``ON CONFLICT``:
+the tables partitioned by migration 11 have no unique index on the ID alone.
+Loading claims recounts the ``remaining_quantity`` (migration 9) of the listings
+they refer to, in the same transaction.
+
+Usage:
+    python ingest.py [--dir DIR] [--chunksize N] [table ...]
+"""
+import argparse
+import io
+import os
+import time
+
+import pandas as pd
+
+from db import connection
+from reservations import RECOUNT_SQL
+from schema import TABLES
+import summaries
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def _chunks(path, spec, chunksize):
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False, na_values=[""])
+    for chunk in reader:
+        missing = set(spec["columns"]) - set(chunk.columns)
+        if missing:
+            raise ValueError(f"{path} is missing columns: {', '.join(sorted(missing))}")
+        chunk = chunk[spec["columns"]]
+        for column, date_format in spec["dates"].items():
+            # Written back out in ISO format, which COPY accepts for DATE and TIMESTAMP
+            chunk[column] = pd.to_datetime(chunk[column], format=date_format)
+        yield chunk
+
+
+def load_table(conn, table, path, chunksize=DEFAULT_CHUNKSIZE):
+    """Load one CSV into ``table``; returns ``(rows, seconds)``."""
+    spec = TABLES[table]
+    columns = ", ".join(spec["columns"])
+    key = spec["primary_key"]
+    updates = ", ".join(f"{col} = staged.{col}" for col in spec["columns"] if col != key)
+    staging = f"staging_{table}"
+
+    started = time.perf_counter()
+    rows = 0
+    with conn.cursor() as cursor:
+        cursor.execute(spec["ddl"])
+        # Only the CSV's columns, without constraints; the rest are filled in by the real table
+        cursor.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {columns} FROM {table} WITH NO DATA")
+
+        for chunk in _chunks(path, spec, chunksize):
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            rows += len(chunk)
+            elapsed = time.perf_counter() - started
+            print(f"  {table}: {rows:,} rows staged ({rows / elapsed:,.0f} rows/s)", flush=True)
+
+        affected = None
+        if table == "claims":
+            cursor.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'food_listings' AND column_name = 'remaining_quantity'
+            """)
+            if cursor.fetchone():
+                # Migration 9's trigger only sees writes to food_listings, so the listings the claims
+                # refer to, before and after the load, are recounted below
+                cursor.execute(f"""
+                    SELECT s.food_id FROM {staging} s
+                    UNION SELECT c.food_id FROM claims c JOIN {staging} s USING (claim_id)
+                """)
+                affected = [food_id for food_id, in cursor.fetchall()]
+
+        # The last occurrence of a key in the dump wins
+        cursor.execute(f"""
+            WITH staged AS (
+                SELECT DISTINCT ON ({key}) {columns} FROM (
+                    SELECT *, ctid AS row_position FROM {staging}
+                ) positioned
+                ORDER BY {key}, row_position DESC
+            ), updated AS (
+                UPDATE {table} current SET {updates}
+                FROM staged WHERE current.{key} = staged.{key}
+                RETURNING current.{key}
+            )
+            INSERT INTO {table} ({columns})
+            SELECT {columns} FROM staged s
+            WHERE NOT EXISTS (SELECT 1 FROM updated u WHERE u.{key} = s.{key})
+        """)
+        if affected:
+            cursor.execute(RECOUNT_SQL, (affected,))
+
+        # Keep the ID sequence added by migrations.py ahead of the loaded keys
+        cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, key.lower()))
+        sequence = cursor.fetchone()[0]
+        if sequence:
+            cursor.execute(f"SELECT setval(%s, COALESCE((SELECT MAX({key}) FROM {table}), 0) + 1, false)", (sequence,))
+    conn.commit()
+    return rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load the CSV datasets with COPY.")
+    parser.add_argument("tables", nargs="*", help="tables to load (default: all, in dependency order)")
+    parser.add_argument("--dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directory holding the *_data.csv files")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="rows per COPY chunk")
+    args = parser.parse_args()
+
+    unknown = set(args.tables) - set(TABLES)
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(sorted(unknown))}")
+    tables = [table for table in TABLES if table in (args.tables or TABLES)]
+    total_rows, total_seconds = 0, 0.0
+    with connection() as conn:
+        for table in tables:
+            path = os.path.join(args.dir, TABLES[table]["csv"])
+            rows, seconds = load_table(conn, table, path, args.chunksize)
+            total_rows += rows
+            total_seconds += seconds
+            print(f"{table}: {rows:,} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)")
+
+        # Bulk loads bypass the CRUD page, so recompute the analytics summaries once at the end
+        summaries.rebuild(conn)
+
+    print(f"Total: {total_rows:,} rows in {total_seconds:.1f}s ({total_rows / max(total_seconds, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
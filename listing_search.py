@@ -0,0 +1,97 @@
+"""Typeahead lookup of food listings for the CRUD page's Food ID picker.
+
+A search term matches Food_Name, Location or the provider's Name (or an exact
+Food_ID when it is a number), and returns at most ``SEARCH_LIMIT`` listings.
+With the pg_trgm extension (migration 7 installs it where available) terms
+match anywhere in the text through trigram indexes; without it they match as
+a prefix through ``lower(...) text_pattern_ops`` indexes.
+
+Results and listing details go through the shared query cache, so repeated
+keystrokes and recently viewed listings don't hit the database again until a
+write to food_listings invalidates them.
+"""
+import os
+
+from db import connection
+from query_cache import read_sql_cached
+
+SEARCH_LIMIT = int(os.environ.get("FOOD_WASTE_SEARCH_LIMIT", "20"))
+SEARCH_MIN_CHARS = 2     # shorter terms would match most of the table
+SEARCH_TTL = 60          # seconds a search result is reused while the user keeps typing or paging back
+RECENT_LIMIT = 10
+
+_trigram = None
+
+
+def has_trigram():
+    """Whether pg_trgm is installed in the database (checked once per process)."""
+    global _trigram
+    if _trigram is None:
+        with connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+                _trigram = cursor.fetchone()[0]
+    return _trigram
+
+
+def _escape_like(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_listings(term, page=0, limit=SEARCH_LIMIT):
+    """One page of listings matching ``term``, or None if the term is too short.
+
+    Columns: food_id, food_name, provider, location, expiry_date, quantity. ``df.attrs["more"]``
+    says whether there is a next page.
+    """
+    term = term.strip()
+    food_id = int(term) if term.isdigit() else None
+    if food_id is None and len(term) < SEARCH_MIN_CHARS:
+        return None
+
+    if has_trigram():
+        pattern = f"%{_escape_like(term)}%"
+        match = "{col} ILIKE %(pattern)s"
+    else:
+        pattern = f"{_escape_like(term.lower())}%"
+        match = "lower({col}) LIKE %(pattern)s"
+
+    # One indexed branch per column, each cut at the rows this page needs, instead of an OR
+    # that would make the planner walk every listing in food_id order
+    def branch(col, source="food_listings f"):
+        return f"""(SELECT f.food_id FROM {source} WHERE {match.format(col=col)}
+                    ORDER BY f.food_id LIMIT %(window)s)"""
+
+    query = f"""
+        WITH hits AS (
+            SELECT food_id FROM food_listings WHERE food_id = %(food_id)s
+            UNION {branch("f.food_name")}
+            UNION {branch("f.location")}
+            UNION {branch("p.name", "providers p JOIN food_listings f ON f.provider_id = p.provider_id")}
+        )
+        SELECT f.food_id, f.food_name, p.name AS provider, f.location, f.expiry_date, f.quantity
+        FROM hits
+        JOIN food_listings f USING (food_id)
+        LEFT JOIN providers p ON p.provider_id = f.provider_id
+        ORDER BY f.food_id = %(food_id)s DESC, f.food_id
+        LIMIT %(limit)s OFFSET %(offset)s
+    """
+    offset = page * limit
+    df = read_sql_cached(query, params={"food_id": food_id, "pattern": pattern, "window": offset + limit + 1,
+                                        "limit": limit + 1, "offset": offset}, ttl=SEARCH_TTL)
+    results = df.iloc[:limit].copy()  # the cached frame is shared; don't touch its attrs
+    results.attrs["more"] = len(df) > limit
+    return results
+
+
+def listing_details(food_id):
+    """The full row of one listing (cached until food_listings is written to)."""
+    return read_sql_cached("SELECT * FROM food_listings WHERE food_id = %s", params=(int(food_id),))
+
+
+def remember(recent, food_id):
+    """Move ``food_id`` to the front of a session's recently viewed list."""
+    if food_id in recent:
+        recent.remove(food_id)
+    recent.insert(0, food_id)
+    del recent[RECENT_LIMIT:]
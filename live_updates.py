@@ -0,0 +1,297 @@
+"""Push-based live updates from PostgreSQL LISTEN/NOTIFY.
+
+Migration 10 adds statement-level triggers on the four base tables that send one
+notification per INSERT / UPDATE / DELETE on channel ``food_waste_changes``::
+
+    {"table": "claims", "op": "U", "count": 1, "rows": [{...the new row...}]}
+    {"table": "food_listings", "op": "D", "count": 2, "keys": [17, 18]}
+
+``rows`` / ``keys`` are left out for statements touching many rows (bulk loads).
+One ``ChangeListener`` thread per process LISTENs on its own connection and, for
+every change, made by this process or any other,
+
+1. invalidates the shared query cache for the table, so cached analytics and the
+   trend series are re-read on their next use instead of after their TTL, and
+2. puts the change in the mailbox of every subscribed session, so an open view
+   can patch what it shows (``patch_rows``) rather than re-reading the table.
+
+After the connection drops, changes may have been missed: on reconnect every
+table is invalidated and subscribers get a ``"reset"`` change.
+
+With read replicas (see replicas.py) each change also carries ``lsn``, the
+primary's WAL position when it arrived, and reads of its table wait for a
+replica to replay that far before the cached results are refilled from it.
+
+Needs migration 10 (``python migrations.py upgrade``).
+
+Usage:
+    python live_updates.py watch    # print changes as they arrive
+"""
+import argparse
+import json
+import logging
+import os
+import select
+import threading
+import time
+import weakref
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+
+from db import DB_SETTINGS
+from replicas import get_router, lsn
+
+LIVE_UPDATES = os.environ.get("FOOD_WASTE_LIVE_UPDATES", "0") == "1"      # run the listener inside the app
+LIVE_POLL = float(os.environ.get("FOOD_WASTE_LIVE_POLL", "2"))             # seconds between mailbox checks in a page
+CHANNEL = "food_waste_changes"
+TABLES = ("providers", "receivers", "food_listings", "claims")
+RECONNECT_DELAY = 5     # seconds before connecting again after the connection dropped
+MAILBOX_SIZE = 500      # changes kept per session; older ones are replaced by a reset
+
+logger = logging.getLogger(__name__)
+
+
+class TriggersMissing(RuntimeError):
+    """The database has no change notification triggers (migration 10), so there is nothing to listen for."""
+
+
+# ------------------------ Per-session mailbox ------------------------
+class Subscription:
+    """Changes a session has not looked at yet."""
+
+    def __init__(self, listener):
+        self._listener = listener
+        self._lock = threading.Lock()
+        self._changes = deque()
+
+    def put(self, change):
+        with self._lock:
+            if len(self._changes) >= MAILBOX_SIZE:
+                self._changes.clear()
+                change = {"table": None, "op": "reset"}
+            self._changes.append(change)
+
+    def pending(self, table=None):
+        """Whether changes to ``table`` (any table by default) are waiting; doesn't take them."""
+        with self._lock:
+            return any(table is None or change["table"] in (table, None) for change in self._changes)
+
+    def drain(self, table=None):
+        """Take the waiting changes to ``table`` (or all of them) and drop the rest.
+
+        Returns None while the listener is not connected: changes may be missed then,
+        so whatever a view holds can't be trusted to be current.
+        """
+        with self._lock:
+            changes = [change for change in self._changes if table is None or change["table"] in (table, None)]
+            self._changes.clear()
+        return changes if self._listener.connected else None
+
+
+# ------------------------ Listener ------------------------
+class ChangeListener:
+    def __init__(self, channel=CHANNEL, settings=None):
+        self.channel = channel
+        self.settings = settings or dict(DB_SETTINGS)
+        self.connected = False
+        self.error = None    # why the listener gave up, if it did
+        self._subscriptions = weakref.WeakSet()   # a session's subscription lives in its session_state
+        self._handlers = []                       # process-wide callbacks, e.g. cache invalidation
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._metrics = {"notifications": 0, "resets": 0, "reconnects": 0, "last_change_at": None}
+
+    def subscribe(self):
+        subscription = Subscription(self)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def on_change(self, handler):
+        """Call ``handler(change)`` from the listener thread for every change."""
+        self._handlers.append(handler)
+
+    def dispatch(self, change):
+        for handler in self._handlers:
+            try:
+                handler(change)
+            except Exception:
+                logger.exception("Live update handler failed")
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(change)
+
+    def _reset(self, position=None):
+        self._metrics["resets"] += 1
+        for table in TABLES:
+            self.dispatch({"table": table, "op": "reset", "lsn": position})
+
+    @staticmethod
+    def _position(conn):
+        """The primary's WAL position now, for read replicas; None without them."""
+        if get_router() is None:
+            return None
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_insert_lsn()::text")
+            return lsn(cursor.fetchone()[0])
+
+    def _listen(self):
+        conn = psycopg2.connect(**self.settings)
+        try:
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_proc WHERE proname = 'notify_table_change'")
+                if cursor.fetchone() is None:
+                    raise TriggersMissing("change notification triggers are missing; run `python migrations.py upgrade`")
+                cursor.execute(f"LISTEN {self.channel}")
+            self.connected = True
+            # Anything written while we weren't listening was missed
+            self._reset(self._position(conn))
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notifies = list(conn.notifies)
+                    del conn.notifies[:]
+                    # Read once they arrived, so it's at or after their commits; any that
+                    # arrive with its result wait for the next round
+                    position = self._position(conn)
+                    for notify in notifies:
+                        self._metrics["notifications"] += 1
+                        self._metrics["last_change_at"] = time.time()
+                        self.dispatch(dict(json.loads(notify.payload), lsn=position))
+        finally:
+            self.connected = False
+            conn.close()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except TriggersMissing as e:
+                # Retrying won't help until the migration runs; the app works without live updates
+                self.error = str(e)
+                logger.error("Live updates are off: %s", e)
+                return
+            except Exception as e:
+                logger.warning("Live update listener disconnected: %s", e)
+                self._metrics["reconnects"] += 1
+            self._stop.wait(RECONNECT_DELAY)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        stats = dict(self._metrics)
+        stats["connected"] = self.connected
+        stats["error"] = self.error
+        with self._lock:
+            stats["sessions"] = len(self._subscriptions)
+        return stats
+
+
+def _invalidate_cached_results(change):
+    import query_cache
+    if change["table"] is not None:
+        if change.get("lsn") is not None:
+            # First, so no read refills the cache from a replica that hasn't replayed the change
+            get_router().note_write(change["lsn"], [change["table"]])
+        query_cache.invalidate_table(change["table"])
+
+
+# ------------------------ Patching views ------------------------
+def _from_json(value, is_date):
+    # to_jsonb writes dates as "2025-03-17" and timestamps as "2025-03-05T05:26:00"
+    if not is_date or value is None:
+        return value
+    return pd.Timestamp(value)
+
+
+def patch_rows(df, key, changes, dates=(), after=None, last=False):
+    """A keyset page ``df`` with ``changes`` applied, or None if it has to be re-read.
+
+    ``df`` holds the rows with ``key`` above ``after`` (None: from the start of the table) up
+    to its last row, or to the end of the table with ``last``. Updated rows are replaced in
+    place; ``dates`` are the date and timestamp columns, which arrive as ISO strings. Inserts
+    and deletes outside the page leave it as it is. Anything else, including changes without
+    rows and values the page's dtypes can't hold (a NULL in an int32 column), returns None.
+    """
+    high = df[key].max() if len(df) and not last else None
+    positions = None
+    patched = df
+    for change in changes:
+        if change["op"] == "U" and "rows" in change:
+            if positions is None:
+                positions = {k: i for i, k in enumerate(df[key])}
+            for row in change["rows"]:
+                if row[key] not in positions:
+                    continue
+                if patched is df:
+                    patched = df.copy()
+                for column in patched.columns.intersection(list(row)):
+                    value = _from_json(row[column], column in dates)
+                    values = patched[column]
+                    if value is None and isinstance(values.dtype, np.dtype) and values.dtype.kind in "iu":
+                        return None  # pandas would turn the column into floats
+                    if isinstance(values.dtype, pd.CategoricalDtype) and value is not None \
+                            and value not in values.cat.categories:
+                        patched[column] = values.cat.add_categories([value])
+                    try:
+                        patched.iat[positions[row[key]], patched.columns.get_loc(column)] = value
+                    except (TypeError, ValueError):
+                        return None
+        elif change["op"] in ("I", "D") and ("rows" in change or "keys" in change):
+            keys = [row[key] for row in change["rows"]] if "rows" in change else change["keys"]
+            if any((after is None or k > after) and (high is None or k <= high) for k in keys):
+                return None
+        else:
+            return None
+    return patched
+
+
+# ------------------------ Process-wide listener ------------------------
+_listener = None
+_thread = None
+
+
+def get_listener():
+    global _listener
+    if _listener is None:
+        _listener = ChangeListener()
+        _listener.on_change(_invalidate_cached_results)
+    return _listener
+
+
+def start_listener():
+    """Start the process-wide listener thread once; later calls are no-ops."""
+    global _thread
+    if (_thread is None or not _thread.is_alive()) and get_listener().error is None:
+        _thread = threading.Thread(target=get_listener().run, name="live-updates", daemon=True)
+        _thread.start()
+    return get_listener()
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Watch row changes published by the notification triggers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("watch")
+    parser.parse_args()
+
+    listener = ChangeListener()
+    listener.on_change(lambda change: print(json.dumps(change, default=str)))
+    print(f"Listening on {CHANNEL}; Ctrl+C to stop.")
+    try:
+        listener.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
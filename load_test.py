@@ -0,0 +1,498 @@
+"""Headless load test: many concurrent app sessions driven over Streamlit's websocket.
+
+Each simulated user talks to the app the way a browser tab does: it opens the
+``/_stcore/stream`` websocket, sends reruns with its widget values and reads the
+script's output until the run finishes, so every step costs the server what a
+click costs it. Users loop over scripted paths, picked at random by ``--mix``:
+
+* browse:    View Tables, a random table, the next page, a filter on one column,
+             then idle on the page while its live-update fragment polls,
+* analytics: a random SQL Analysis and Custom SQL query, then Trends,
+* crud:      add a "Load test" listing, update it, then delete it.
+
+Between steps a user waits ``--think`` seconds on average. The app is started on
+a free port (or use ``--url`` for one that is already running; ``--pid`` then
+gives the server process whose memory to sample). Every ``--sample`` seconds the
+run records the database's connections by state (pg_stat_activity) and the
+server's resident memory. It reports latency percentiles per page and step,
+the samples, and errors: failed steps and error messages the app showed.
+Listings the crud path left behind are removed at the end.
+
+The database is the configured one (FOOD_WASTE_DB_*, see db.py); seed it at the
+scale to test first, as for benchmark.py. With ``--report LABEL`` the results
+also go to ``load_reports/LABEL.json``.
+
+Usage:
+    python datagen.py --scale 100 --out data/sf100 && python ingest.py --dir data/sf100
+    python load_test.py [--sessions 20] [--duration 120] [--think 2] [--mix browse=2,analytics=2,crud=1]
+                        [--ramp 10] [--sample 5] [--url ws://host:port] [--pid PID] [--report LABEL]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import websockets
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from benchmark import _metadata
+from db import connection
+from stress_reservations import remove_listings
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FOOD WASTAGE.py")
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_reports")
+SERVER_START_TIMEOUT = 60   # seconds to wait for a started server to answer
+STEP_TIMEOUT = 120          # seconds before a step that hasn't finished counts as failed
+LISTING_NAME = "Load test"  # food_name prefix of the listings the crud path writes
+
+NAV = "Go to:"
+WIDGETS = ("radio", "selectbox", "multiselect", "text_input", "number_input", "button", "slider",
+           "date_input", "checkbox")
+
+
+class StepFailed(Exception):
+    """A scripted step couldn't be taken: a widget is missing or the run didn't finish."""
+
+
+# ------------------------ One browser tab ------------------------
+class AppSession:
+    """A websocket session with the app, holding the widget values a browser tab would."""
+
+    def __init__(self, url, recorder):
+        self.url = url
+        self.recorder = recorder
+        self.page = None
+        self.widgets = {}      # label -> (kind, proto) of the widgets the last run showed
+        self.states = {}       # widget id -> WidgetState sent with every rerun
+        self.fragments = {}    # fragment id -> seconds between the auto reruns it asked for
+        self._page_hash = ""
+        self._ws = None
+
+    async def open(self):
+        self._ws = await websockets.connect(f"{self.url}/_stcore/stream", subprotocols=["streamlit"],
+                                            max_size=None, open_timeout=STEP_TIMEOUT)
+        await self.step("🏠 Project Introduction", "open")
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+
+    @property
+    def connected(self):
+        return self._ws is not None and self._ws.state is websockets.State.OPEN
+
+    def widget(self, label):
+        """``(kind, proto)`` of the widget labelled ``label``, or whose label starts with it."""
+        if label in self.widgets:
+            return self.widgets[label]
+        for known, widget in self.widgets.items():
+            if known.startswith(label):
+                return widget
+        raise StepFailed(f"no widget {label!r} on {self.page}")
+
+    def options(self, label):
+        return list(self.widget(label)[1].options)
+
+    def set(self, label, value):
+        """Give the widget ``label`` a value, sent with the next rerun; buttons are clicked."""
+        kind, proto = self.widget(label)
+        state = WidgetState(id=proto.id)
+        if kind == "button":
+            state.trigger_value = True
+        elif kind in ("radio", "selectbox"):
+            if value not in proto.options:
+                raise StepFailed(f"{value!r} is not an option of {label!r}")
+            state.string_value = value
+        elif kind == "multiselect":
+            state.string_array_value.data.extend(value)
+        elif kind == "number_input":
+            state.double_value = value
+        elif kind == "text_input":
+            state.string_value = value
+        else:
+            raise StepFailed(f"setting {kind} widgets isn't supported")
+        self.states[proto.id] = state
+
+    async def step(self, page, name, fragment_id=None, **values):
+        """Set ``values`` (widget label -> value), rerun and record how long it took under ``page: name``."""
+        for label, value in values.items():
+            self.set(label, value)
+        started = time.perf_counter()
+        try:
+            errors = await asyncio.wait_for(self._rerun(fragment_id), STEP_TIMEOUT)
+        except (asyncio.TimeoutError, websockets.ConnectionClosed) as e:
+            self.recorder.failed(page, name, f"{type(e).__name__}: {e}")
+            raise StepFailed(f"{page}: {name} didn't finish") from e
+        self.recorder.record(page, name, time.perf_counter() - started, errors)
+        self.page = page
+
+    async def _rerun(self, fragment_id):
+        msg = BackMsg()
+        client = msg.rerun_script
+        client.page_script_hash = self._page_hash
+        client.widget_states.widgets.extend(self.states.values())
+        if fragment_id:
+            client.fragment_id = fragment_id
+            client.is_auto_rerun = True
+        await self._ws.send(msg.SerializeToString())
+        # Clicks are one-shot, as in the browser
+        self.states = {key: state for key, state in self.states.items() if state.WhichOneof("value") != "trigger_value"}
+
+        errors = []
+        full_run = False
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self._ws.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "new_session":
+                self._page_hash = forward.new_session.page_script_hash
+                if not forward.new_session.fragment_ids_this_run:
+                    # A full run: fragments it doesn't render again stop, and the server drops them
+                    full_run = True
+                    self.widgets = {}
+                    self.fragments = {}
+            elif kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_kind = element.WhichOneof("type")
+                if element_kind in WIDGETS:
+                    widget = getattr(element, element_kind)
+                    self.widgets[widget.label] = (element_kind, widget)
+                elif element_kind == "exception":
+                    errors.append(f"{element.exception.type}: {element.exception.message}")
+                elif element_kind == "alert" and element.alert.format == Alert.ERROR:
+                    errors.append(element.alert.body)
+            elif kind == "auto_rerun":
+                self.fragments[forward.auto_rerun.fragment_id] = forward.auto_rerun.interval
+            elif kind == "stop_auto_rerun":
+                self.fragments.pop(forward.stop_auto_rerun.fragment_id, None)
+            elif kind == "script_finished" \
+                    and forward.script_finished != ForwardMsg.ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN:
+                if full_run:
+                    # Widgets that are gone no longer send values, as in the browser
+                    shown = {proto.id for _, proto in self.widgets.values()}
+                    self.states = {key: state for key, state in self.states.items() if key in shown}
+                return errors
+
+    async def idle(self, seconds):
+        """Stay on the page for ``seconds``, letting its fragments rerun as the browser would."""
+        deadline = time.monotonic() + seconds
+        while self.fragments:
+            fragment_id, interval = next(iter(self.fragments.items()))
+            if time.monotonic() + interval > deadline:
+                break
+            await asyncio.sleep(interval)
+            await self.step(self.page, "live poll", fragment_id=fragment_id)
+        await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    async def go(self, page):
+        await self.step(page, "open", **{NAV: page})
+
+
+# ------------------------ Scripted paths ------------------------
+async def browse(session, rng, think):
+    page = "📄 View Tables"
+    await session.go(page)
+    table = rng.choice(session.options("Choose a table to view"))
+    await session.step(page, "choose table", **{"Choose a table to view": table})
+    await session.idle(rng.expovariate(1 / think))
+    if not session.widget("Next ➡️")[1].disabled:
+        await session.step(page, "next page", **{"Next ➡️": True})
+        await session.idle(rng.expovariate(1 / think))
+    column = rng.choice(session.options("Select columns to apply filters"))
+    await session.step(page, "add filter", **{"Select columns to apply filters": [column]})
+    if f"Filter '{column}' (select values)" in session.widgets:
+        label = f"Filter '{column}' (select values)"
+        values = session.options(label)
+        await session.step(page, "filter values", **{label: rng.sample(values, max(1, len(values) // 2))})
+    elif f"Filter '{column}' (contains text)" in session.widgets:
+        await session.step(page, "filter text", **{f"Filter '{column}' (contains text)": rng.choice("aeiou")})
+    await session.idle(rng.expovariate(1 / think))
+    # Leave the filter off again, or the next visit starts filtered
+    await session.step(page, "clear filter", **{"Select columns to apply filters": []})
+
+
+async def analytics(session, rng, think):
+    for page, label in (("📊 SQL Analysis", "Select a SQL Analysis Query"),
+                        ("🧠 Custom SQL", "Select a Custom SQL Query")):
+        await session.go(page)
+        await session.step(page, "run query", **{label: rng.choice(session.options(label))})
+        await session.idle(rng.expovariate(1 / think))
+    await session.go("📈 Trends")
+    await session.idle(rng.expovariate(1 / think))
+
+
+async def crud(session, rng, think):
+    page = "🛠️ CRUD Operations"
+    operation = "Choose a CRUD Operation"
+    search = "Search by Food ID, food name, provider or location"
+    name = f"{LISTING_NAME} {rng.randrange(10 ** 9)}"
+    await session.go(page)
+    await session.step(page, "choose add", **{operation: "Add New Listing"})
+    await session.step(page, "add", **{"Food Name": name, "Quantity": rng.randint(1, 50),
+                                       "Provider Type": "Restaurant", "Location": LISTING_NAME,
+                                       "Add Listing": True})
+    await session.idle(rng.expovariate(1 / think))
+
+    await session.step(page, "choose update", **{operation: "Update Existing Listing"})
+    await session.step(page, "search", **{search: name})
+    if "Listing" not in session.widgets:
+        raise StepFailed(f"the listing {name!r} just added wasn't found")
+    await session.step(page, "update", **{"Quantity": rng.randint(1, 50), "Update Listing": True})
+    await session.idle(rng.expovariate(1 / think))
+
+    await session.step(page, "choose delete", **{operation: "Delete Listing"})
+    await session.step(page, "search", **{search: name})
+    await session.step(page, "delete", **{"Delete Listing with ID": True})
+
+
+PATHS = {"browse": browse, "analytics": analytics, "crud": crud}
+
+
+# ------------------------ Recording ------------------------
+class Recorder:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.timings = {}    # "page: step" -> seconds
+        self.errors = {}     # "page: step" -> messages
+        self.samples = []
+        self.active = 0
+
+    def record(self, page, name, seconds, errors):
+        key = f"{page}: {name}"
+        self.timings.setdefault(key, []).append(seconds)
+        if errors:
+            self.errors.setdefault(key, []).extend(errors)
+
+    def failed(self, page, name, message):
+        self.errors.setdefault(f"{page}: {name}", []).append(message)
+
+    def summary(self):
+        results = {}
+        for key in sorted(set(self.timings) | set(self.errors)):
+            samples = np.array(self.timings.get(key, [])) * 1000
+            results[key] = {"runs": len(samples), "errors": len(self.errors.get(key, []))}
+            if len(samples):
+                p50, p95, p99 = np.quantile(samples, (0.5, 0.95, 0.99))
+                results[key].update(p50_ms=p50, p95_ms=p95, p99_ms=p99, max_ms=samples.max())
+        return results
+
+
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _connections():
+    """The database's backends by state, leaving out this one."""
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(state, 'unknown'), COUNT(*) FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid()
+                GROUP BY 1
+            """)
+            counts = dict(cursor.fetchall())
+        conn.rollback()
+    return counts
+
+
+async def sample(recorder, pid, every, stop):
+    while True:
+        connections = await asyncio.to_thread(_connections)
+        recorder.samples.append({"at_s": round(time.monotonic() - recorder.started, 1),
+                                 "sessions": recorder.active,
+                                 "connections": connections,
+                                 "server_rss_mb": _rss_mb(pid) if pid else None})
+        try:
+            await asyncio.wait_for(stop.wait(), every)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+
+# ------------------------ Users ------------------------
+async def user(number, url, recorder, mix, think, delay, deadline):
+    rng = random.Random(number)
+    await asyncio.sleep(delay)
+    session = AppSession(url, recorder)
+    recorder.active += 1
+    try:
+        await session.open()
+        paths, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            path = rng.choices(paths, weights)[0]
+            try:
+                await PATHS[path](session, rng, think)
+            except StepFailed as e:
+                recorder.failed("paths", path, str(e))
+                if not session.connected:
+                    break
+    except (OSError, StepFailed, websockets.WebSocketException) as e:
+        recorder.failed("sessions", "connect", str(e))
+    finally:
+        recorder.active -= 1
+        await session.close()
+
+
+async def run_users(url, args, pid):
+    recorder = Recorder()
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample(recorder, pid, args.sample, stop))
+    deadline = time.monotonic() + args.duration
+    await asyncio.gather(*(user(number, url, recorder, args.mix, args.think,
+                                args.ramp * number / max(1, args.sessions), deadline)
+                           for number in range(args.sessions)))
+    stop.set()
+    await sampler
+    return recorder
+
+
+# ------------------------ Server ------------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(log):
+    """Run the app with ``streamlit run`` on a free port; returns ``(process, url)`` once it answers."""
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true",
+                               "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+                              stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"streamlit exited with code {server.returncode}; see {log.name}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+            return server, f"ws://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.5)
+    server.terminate()
+    raise SystemExit(f"streamlit didn't answer within {SERVER_START_TIMEOUT}s; see {log.name}")
+
+
+def remove_test_listings():
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT food_id FROM food_listings WHERE food_name LIKE %s", (f"{LISTING_NAME} %",))
+            food_ids = [row[0] for row in cursor.fetchall()]
+        conn.rollback()
+        if food_ids:
+            remove_listings(conn, food_ids)
+    return len(food_ids)
+
+
+# ------------------------ Report ------------------------
+def print_report(recorder, elapsed):
+    results = recorder.summary()
+    steps = sum(result["runs"] for result in results.values())
+    print(f"\n{steps:,} steps in {elapsed:.0f}s ({steps / elapsed:.1f}/s)\n")
+    print(f"{'Page: step':<44} {'runs':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for key, result in results.items():
+        if "p50_ms" in result:
+            timings = "".join(f" {result[column]:9.0f}" for column in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        else:
+            timings = f" {'':>39}"
+        print(f"{key:<44} {result['runs']:>6}{timings} {result['errors']:>7}")
+
+    states = sorted({state for entry in recorder.samples for state in entry["connections"]})
+    print(f"\n{'t, s':>6} {'sessions':>8} " + "".join(f"{state[:20]:>21}" for state in states) + f" {'server MB':>10}")
+    for entry in recorder.samples:
+        rss = entry["server_rss_mb"]
+        print(f"{entry['at_s']:>6.0f} {entry['sessions']:>8} "
+              + "".join(f"{entry['connections'].get(state, 0):>21}" for state in states)
+              + (f" {rss:>10.0f}" if rss is not None else f" {'-':>10}"))
+
+    for key, messages in recorder.errors.items():
+        print(f"\nERRORS {key}: {len(messages)}")
+        for message, count in _most_common(messages):
+            print(f"  {count:>5} x {message[:200]}")
+    return results
+
+
+def _most_common(messages, limit=5):
+    counts = {}
+    for message in messages:
+        counts[message] = counts.get(message, 0) + 1
+    return sorted(counts.items(), key=lambda item: -item[1])[:limit]
+
+
+def _mix(text):
+    mix = {}
+    for part in text.split(","):
+        path, _, weight = part.partition("=")
+        if path not in PATHS:
+            raise argparse.ArgumentTypeError(f"unknown path {path}; choose from {', '.join(PATHS)}")
+        mix[path] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive many concurrent app sessions and report latencies.")
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=120, help="seconds users keep starting new paths")
+    parser.add_argument("--think", type=float, default=2, help="mean seconds between a user's steps")
+    parser.add_argument("--mix", type=_mix, default="browse=2,analytics=2,crud=1", help="path weights")
+    parser.add_argument("--ramp", type=float, default=10, help="seconds over which users join")
+    parser.add_argument("--sample", type=float, default=5, help="seconds between connection / memory samples")
+    parser.add_argument("--url", help="an app that is already running, e.g. ws://localhost:8501")
+    parser.add_argument("--pid", type=int, help="with --url: the server process whose memory to sample")
+    parser.add_argument("--report", metavar="LABEL", help="also write load_reports/LABEL.json")
+    args = parser.parse_args()
+
+    with connection() as conn:
+        metadata = _metadata(conn)
+    server = None
+    if args.url:
+        url, pid = args.url.rstrip("/"), args.pid
+    else:
+        log = open(os.path.join(os.environ.get("TMPDIR", "/tmp"), "load_test_server.log"), "w")
+        server, url = start_server(log)
+        pid = server.pid
+    print(f"{args.sessions} sessions for {args.duration:g}s against {url} "
+          f"({', '.join(f'{table} {rows:,}' for table, rows in metadata['row_counts'].items())} rows)")
+
+    started = time.monotonic()
+    try:
+        recorder = asyncio.run(run_users(url, args, pid))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        removed = remove_test_listings()
+    elapsed = time.monotonic() - started
+    results = print_report(recorder, elapsed)
+    if removed:
+        print(f"\nRemoved {removed} {LISTING_NAME!r} listings left behind")
+
+    if args.report:
+        report = {"label": args.report, "metadata": metadata,
+                  "settings": {key: value for key, value in vars(args).items() if key not in ("report", "pid")},
+                  "elapsed_s": elapsed, "results": results, "samples": recorder.samples,
+                  "errors": {key: dict(_most_common(messages)) for key, messages in recorder.errors.items()}}
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        path = os.path.join(REPORT_DIR, f"{args.report}.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1, default=float)
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Expiry-aware matching of open food listings to receivers.
+
+Open listings (not expired, with quantity nobody has reserved) are taken
+soonest expiry first from a heap. Each one goes to a receiver in the same city: the
+highest-priority receiver type that still has room for the listing's quantity,
+and within a type the receiver with the most room left. Receiver capacity is a
+per-run quantity budget by type, minus what the receiver already has pending.
+Every match becomes a Pending claim for the listing's remaining quantity,
+reserved the way reservations.py does it, and they are all written in one
+transaction.
+
+Usage:
+    python matching.py [--as-of YYYY-MM-DD] [--dry-run]
+"""
+import argparse
+import heapq
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+from psycopg2.extras import execute_values
+
+from db import connection
+from reservations import OPEN_LISTING
+import summaries
+
+# Lower number = served first
+RECEIVER_TYPE_PRIORITY = {"Shelter": 0, "NGO": 1, "Charity": 2, "Individual": 3}
+# Units of food a receiver can take per matching run, before subtracting its pending claims
+RECEIVER_CAPACITY = {"Shelter": 200, "NGO": 150, "Charity": 100, "Individual": 20}
+DEFAULT_PRIORITY = len(RECEIVER_TYPE_PRIORITY)
+DEFAULT_CAPACITY = 20
+
+
+# ------------------------ Loading ------------------------
+def load_listings(cursor, as_of):
+    """``(expiry_date, food_id, remaining_quantity, city)`` for every listing still open on ``as_of``."""
+    cursor.execute(f"""
+        SELECT f.expiry_date, f.food_id, f.remaining_quantity, COALESCE(f.location, p.city)
+        FROM food_listings f
+        LEFT JOIN providers p ON p.provider_id = f.provider_id
+        WHERE {OPEN_LISTING}
+          AND f.expiry_date >= %s
+          AND f.remaining_quantity > 0
+    """, (as_of,))
+    return cursor.fetchall()
+
+
+def load_receivers(cursor):
+    """``(receiver_id, type, city, pending_quantity)`` for every receiver with a city."""
+    cursor.execute("""
+        SELECT r.receiver_id, r.type, r.city, COALESCE(SUM(COALESCE(c.quantity, f.quantity)), 0)
+        FROM receivers r
+        LEFT JOIN claims c ON c.receiver_id = r.receiver_id AND c.status = 'Pending'
+        LEFT JOIN food_listings f ON f.food_id = c.food_id
+        WHERE r.city IS NOT NULL
+        GROUP BY r.receiver_id, r.type, r.city
+    """)
+    return cursor.fetchall()
+
+
+# ------------------------ Matching ------------------------
+class Matcher:
+    """Per-city receiver index: city -> {priority: max-heap of (-remaining, receiver_id)}."""
+
+    def __init__(self, receivers):
+        self.index = defaultdict(lambda: defaultdict(list))
+        for receiver_id, receiver_type, city, pending in receivers:
+            remaining = RECEIVER_CAPACITY.get(receiver_type, DEFAULT_CAPACITY) - pending
+            if remaining > 0:
+                priority = RECEIVER_TYPE_PRIORITY.get(receiver_type, DEFAULT_PRIORITY)
+                self.index[city][priority].append((-remaining, receiver_id))
+        self.tier_order = {}  # city -> its priorities, sorted once instead of per listing
+        for city, tiers in self.index.items():
+            for heap in tiers.values():
+                heapq.heapify(heap)
+            self.tier_order[city] = sorted(tiers)
+
+    def assign(self, city, quantity):
+        """Receiver id for ``quantity`` units in ``city`` (its capacity is consumed), or None."""
+        tiers = self.index.get(city)
+        if not tiers:
+            return None
+        for priority in self.tier_order[city]:
+            heap = tiers[priority]
+            # The top of a max-heap has the most room in this tier; if it can't fit, nobody can
+            if heap and -heap[0][0] >= quantity:
+                remaining, receiver_id = heap[0]
+                remaining += quantity
+                if remaining < 0:
+                    heapq.heapreplace(heap, (remaining, receiver_id))
+                else:
+                    heapq.heappop(heap)
+                return receiver_id
+        return None
+
+    def match(self, listings):
+        """Match listings soonest-expiry first; returns ``(matches, unmatched_count)``."""
+        heap = [(expiry, -quantity, food_id, city) for expiry, food_id, quantity, city in listings]
+        heapq.heapify(heap)
+        matches, unmatched = [], 0
+        while heap:
+            _, neg_quantity, food_id, city = heapq.heappop(heap)
+            receiver_id = self.assign(city, -neg_quantity)
+            if receiver_id is None:
+                unmatched += 1
+            else:
+                matches.append((food_id, receiver_id, -neg_quantity))
+        return matches, unmatched
+
+
+def write_claims(cursor, matches, claimed_at):
+    """Reserve and insert one Pending claim per match and keep the analytics summaries current.
+
+    A listing someone reserved from, or that expired, since it was loaded is skipped; returns how many
+    claims were written.
+    """
+    claimed = execute_values(cursor, f"""
+        WITH m(food_id, receiver_id, quantity, claimed_at) AS (VALUES %s),
+        taken AS (
+            UPDATE food_listings f SET remaining_quantity = f.remaining_quantity - m.quantity
+            FROM m
+            WHERE f.food_id = m.food_id AND f.remaining_quantity >= m.quantity AND {OPEN_LISTING}
+            RETURNING f.food_id
+        )
+        INSERT INTO claims (food_id, receiver_id, status, timestamp, quantity)
+        SELECT m.food_id, m.receiver_id, 'Pending', m.claimed_at, m.quantity
+        FROM m JOIN taken USING (food_id)
+        RETURNING food_id
+    """, [(food_id, receiver_id, quantity, claimed_at) for food_id, receiver_id, quantity in matches],
+        template="(%s, %s, %s, %s::timestamp)", page_size=10000, fetch=True)
+    summaries.pending_claims_added(cursor, [food_id for food_id, in claimed])
+    return len(claimed)
+
+
+def run(conn, as_of=None, dry_run=False):
+    """Match every open listing and (unless ``dry_run``) commit the proposed claims; returns stats."""
+    as_of = as_of or date.today()
+    timings = {}
+    with conn.cursor() as cursor:
+        # One matching run at a time, or two runs would hand out the same listings
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('matching'))")
+        started = time.perf_counter()
+        listings = load_listings(cursor, as_of)
+        receivers = load_receivers(cursor)
+        timings["load_s"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        matches, unmatched = Matcher(receivers).match(listings)
+        timings["match_s"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        written = 0
+        if matches and not dry_run:
+            written = write_claims(cursor, matches, datetime.now())
+        timings["write_s"] = time.perf_counter() - started
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    return dict(listings=len(listings), receivers=len(receivers), matched=len(matches),
+                unmatched=unmatched, written=written, **timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose claims for open listings, soonest expiry first.")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="also treat listings expiring before this later date as expired (default: today)")
+    parser.add_argument("--dry-run", action="store_true", help="match but do not write any claims")
+    args = parser.parse_args()
+
+    with connection() as conn:
+        stats = run(conn, as_of=args.as_of, dry_run=args.dry_run)
+    print(f"Open listings: {stats['listings']:,}  receivers: {stats['receivers']:,}")
+    written = "dry run, nothing written" if args.dry_run else f"claims written: {stats['written']:,}"
+    print(f"Matched: {stats['matched']:,}  unmatched: {stats['unmatched']:,}  ({written})")
+    print(f"Load {stats['load_s']:.2f}s  match {stats['match_s']:.2f}s  write {stats['write_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,548 @@
+"""Versioned schema migrations for the food_waste database.
+
+Each migration runs once, in its own transaction, and is recorded in
+``schema_migrations``. Constraints a migration adds ``NOT VALID`` are validated
+after it commits, each in a transaction of its own (see validate_constraints).
+Run after the tables exist (notebook or ``ingest.py``):
+
+    python migrations.py status
+    python migrations.py upgrade [--to VERSION] [--explain]
+
+``--explain`` records ``EXPLAIN (ANALYZE, BUFFERS)`` for every canned query
+before and after the upgrade (see explain_queries.py).
+"""
+import argparse
+import sys
+
+from db import connection
+import summaries
+
+# Months of partitions created ahead of today (see migration 11 and partitions.py)
+PARTITIONS_AHEAD = 3
+
+
+def _notify_triggers(tables):
+    """Statement-level change notification triggers (migration 10) for ``[(table, key column), ...]``."""
+    return [
+        statement
+        for table, key in tables
+        for event, transition in [("INSERT", "NEW TABLE AS new_rows"),
+                                  ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+                                  ("DELETE", "OLD TABLE AS old_rows")]
+        for statement in [
+            f"DROP TRIGGER IF EXISTS {table}_notify_{event.lower()} ON {table}",
+            f"""CREATE TRIGGER {table}_notify_{event.lower()}
+                AFTER {event} ON {table} REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change('{key}')""",
+        ]
+    ]
+
+
+def _month_partitioned(table, column, key):
+    """Statements replacing ``table`` by a copy range-partitioned by month of ``column``.
+
+    The copy gets the same columns, defaults, checks and indexes, one partition per month
+    that has rows plus this month through PARTITIONS_AHEAD months ahead, and a DEFAULT
+    partition for anything else. Triggers and foreign keys are left to the caller; the
+    old table is left as ``{table}_unpartitioned``.
+    """
+    old = f"{table}_unpartitioned"
+    return [
+        f"ALTER TABLE {table} RENAME TO {old}",
+        f"""CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ({column})""",
+        f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL",
+        # Months without rows are left to the DEFAULT partition: every partition adds to
+        # the planning of lookups by ID, which can't be pruned
+        f"""SELECT ensure_month_partitions('{table}', month, month)
+            FROM (SELECT DISTINCT date_trunc('month', {column})::date AS month FROM {old}) months""",
+        f"""SELECT ensure_month_partitions('{table}', CURRENT_DATE,
+                (CURRENT_DATE + interval '{PARTITIONS_AHEAD} months')::date)""",
+        f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT",
+        f"INSERT INTO {table} SELECT * FROM {old}",
+        f"ALTER INDEX {table}_pkey RENAME TO {old}_pkey",
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({key}, {column})",
+        # Same indexes under the same names; the old ones are renamed out of the way first
+        f"""DO $$
+            DECLARE
+                old_index RECORD;
+            BEGIN
+                FOR old_index IN
+                    SELECT indexname, indexdef FROM pg_indexes
+                    WHERE schemaname = current_schema() AND tablename = '{old}' AND indexname <> '{old}_pkey'
+                LOOP
+                    EXECUTE format('ALTER INDEX %I RENAME TO %I', old_index.indexname, left(old_index.indexname, 50) || '_old');
+                    EXECUTE replace(old_index.indexdef, ' ON ' || current_schema() || '.{old} ', ' ON {table} ');
+                END LOOP;
+            END
+            $$""",
+        f"ALTER SEQUENCE IF EXISTS {table}_{key}_seq OWNED BY {table}.{key}",
+    ]
+
+
+MIGRATIONS = [
+    {
+        "version": 1,
+        "description": "Generate Food_ID and Claim_ID for new rows",
+        # The notebook declares plain INT primary keys, so inserts without an ID failed.
+        "statements": [
+            "CREATE SEQUENCE IF NOT EXISTS food_listings_food_id_seq OWNED BY food_listings.food_id",
+            "SELECT setval('food_listings_food_id_seq', COALESCE((SELECT MAX(food_id) FROM food_listings), 0) + 1, false)",
+            "ALTER TABLE food_listings ALTER COLUMN food_id SET DEFAULT nextval('food_listings_food_id_seq')",
+            "CREATE SEQUENCE IF NOT EXISTS claims_claim_id_seq OWNED BY claims.claim_id",
+            "SELECT setval('claims_claim_id_seq', COALESCE((SELECT MAX(claim_id) FROM claims), 0) + 1, false)",
+            "ALTER TABLE claims ALTER COLUMN claim_id SET DEFAULT nextval('claims_claim_id_seq')",
+        ],
+    },
+    {
+        "version": 2,
+        "description": "Foreign keys and value checks",
+        # Added NOT VALID: existing rows are checked after the migration commits (validate_constraints)
+        "statements": [
+            """ALTER TABLE food_listings ADD CONSTRAINT food_listings_provider_id_fkey
+               FOREIGN KEY (provider_id) REFERENCES providers (provider_id) NOT VALID""",
+            """ALTER TABLE claims ADD CONSTRAINT claims_food_id_fkey
+               FOREIGN KEY (food_id) REFERENCES food_listings (food_id) ON DELETE CASCADE NOT VALID""",
+            """ALTER TABLE claims ADD CONSTRAINT claims_receiver_id_fkey
+               FOREIGN KEY (receiver_id) REFERENCES receivers (receiver_id) NOT VALID""",
+            """ALTER TABLE claims ADD CONSTRAINT claims_status_check
+               CHECK (status IN ('Pending', 'Completed', 'Cancelled')) NOT VALID""",
+            """ALTER TABLE food_listings ADD CONSTRAINT food_listings_quantity_check
+               CHECK (quantity > 0) NOT VALID""",
+        ],
+    },
+    {
+        "version": 3,
+        "description": "Indexes for the analytics joins and filters",
+        "statements": [
+            # Join keys
+            "CREATE INDEX IF NOT EXISTS claims_food_id_idx ON claims (food_id)",
+            "CREATE INDEX IF NOT EXISTS claims_receiver_id_idx ON claims (receiver_id)",
+            "CREATE INDEX IF NOT EXISTS food_listings_provider_id_idx ON food_listings (provider_id)",
+            # "Has this listing been claimed successfully?" probes and Completed-only aggregates
+            "CREATE INDEX IF NOT EXISTS claims_completed_food_id_idx ON claims (food_id) WHERE status = 'Completed'",
+            "CREATE INDEX IF NOT EXISTS claims_completed_receiver_id_idx ON claims (receiver_id) WHERE status = 'Completed'",
+            # Filters and groupings
+            "CREATE INDEX IF NOT EXISTS food_listings_location_idx ON food_listings (location)",
+            "CREATE INDEX IF NOT EXISTS food_listings_expiry_date_idx ON food_listings (expiry_date)",
+            "CREATE INDEX IF NOT EXISTS providers_city_idx ON providers (city)",
+            "CREATE INDEX IF NOT EXISTS receivers_city_idx ON receivers (city)",
+            "ANALYZE providers",
+            "ANALYZE receivers",
+            "ANALYZE food_listings",
+            "ANALYZE claims",
+        ],
+    },
+    {
+        "version": 4,
+        "description": "Expiry tracking: expired_at, waste events and sweeper checkpoint",
+        "statements": [
+            "ALTER TABLE food_listings ADD COLUMN IF NOT EXISTS expired_at TIMESTAMP",
+            # The sweeper finds due listings through this index, never by scanning the table
+            """CREATE INDEX IF NOT EXISTS food_listings_live_expiry_idx
+               ON food_listings (expiry_date, food_id) WHERE expired_at IS NULL""",
+            """CREATE TABLE IF NOT EXISTS waste_events(
+                event_id SERIAL PRIMARY KEY,
+                food_id INT NOT NULL,
+                provider_id INT,
+                location TEXT,
+                food_type TEXT,
+                meal_type TEXT,
+                quantity INT,
+                expiry_date DATE,
+                expired_at TIMESTAMP NOT NULL,
+                cancelled_claims INT NOT NULL)""",
+            "CREATE INDEX IF NOT EXISTS waste_events_expired_at_idx ON waste_events (expired_at)",
+            """CREATE TABLE IF NOT EXISTS sweeper_checkpoint(
+                name TEXT PRIMARY KEY,
+                last_food_id INT NOT NULL DEFAULT 0,
+                swept_through DATE,
+                updated_at TIMESTAMP NOT NULL DEFAULT now())""",
+        ],
+    },
+    {
+        "version": 5,
+        "description": "Coordinates for providers and receivers, nearest_providers()",
+        # Filled by ``python geo.py geocode`` from the bundled city_coords.csv
+        "statements": [
+            "ALTER TABLE providers ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+            "ALTER TABLE providers ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+            "ALTER TABLE receivers ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION",
+            "ALTER TABLE receivers ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION",
+            """CREATE TABLE IF NOT EXISTS city_coords(
+                city TEXT PRIMARY KEY,
+                latitude DOUBLE PRECISION NOT NULL,
+                longitude DOUBLE PRECISION NOT NULL)""",
+            # Bounding-box prefilter for the distance searches
+            "CREATE INDEX IF NOT EXISTS providers_lat_lon_idx ON providers (latitude, longitude)",
+            "CREATE INDEX IF NOT EXISTS receivers_lat_lon_idx ON receivers (latitude, longitude)",
+            """CREATE OR REPLACE FUNCTION haversine_km(lat1 DOUBLE PRECISION, lon1 DOUBLE PRECISION,
+                                                      lat2 DOUBLE PRECISION, lon2 DOUBLE PRECISION)
+               RETURNS DOUBLE PRECISION LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                   SELECT 2 * 6371.0088 * asin(sqrt(
+                       sin(radians(lat2 - lat1) / 2) ^ 2
+                       + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lon2 - lon1) / 2) ^ 2))
+               $$""",
+            """CREATE OR REPLACE FUNCTION nearest_providers(lat DOUBLE PRECISION, lon DOUBLE PRECISION,
+                                                           radius_km DOUBLE PRECISION, n INT,
+                                                           as_of DATE DEFAULT CURRENT_DATE)
+               RETURNS TABLE(provider_id INT, name TEXT, city TEXT, distance_km DOUBLE PRECISION,
+                             open_listings BIGINT, open_quantity BIGINT)
+               LANGUAGE sql STABLE AS $$
+                   WITH box AS (
+                       SELECT radius_km / 111.045 AS dlat,
+                              LEAST(180, radius_km / (111.045 * GREATEST(cos(radians(lat)), 1e-6))) AS dlon
+                   ), nearby AS (
+                       SELECT p.provider_id, p.name, p.city,
+                              haversine_km(lat, lon, p.latitude, p.longitude) AS distance_km
+                       FROM providers p, box
+                       WHERE p.latitude BETWEEN lat - box.dlat AND lat + box.dlat
+                         AND p.longitude BETWEEN lon - box.dlon AND lon + box.dlon
+                   )
+                   SELECT nb.provider_id, nb.name, nb.city, nb.distance_km,
+                          COUNT(*), SUM(f.quantity)::BIGINT
+                   FROM nearby nb
+                   JOIN food_listings f ON f.provider_id = nb.provider_id
+                   WHERE nb.distance_km <= radius_km
+                     AND f.expiry_date >= as_of AND f.expired_at IS NULL
+                     AND NOT EXISTS (SELECT 1 FROM claims c
+                                     WHERE c.food_id = f.food_id AND c.status = 'Completed')
+                   GROUP BY nb.provider_id, nb.name, nb.city, nb.distance_km
+                   ORDER BY nb.distance_km, nb.provider_id
+                   LIMIT n
+               $$""",
+        ],
+    },
+    {
+        "version": 6,
+        "description": "row_version on food_listings for optimistic concurrency",
+        # Every UPDATE bumps it; editors send back the version they read and lose if it moved.
+        "statements": [
+            "ALTER TABLE food_listings ADD COLUMN IF NOT EXISTS row_version INT NOT NULL DEFAULT 1",
+        ],
+    },
+    {
+        "version": 7,
+        "description": "Search indexes for the listing picker",
+        "statements": [
+            # Prefix search works everywhere
+            "CREATE INDEX IF NOT EXISTS food_listings_food_name_prefix_idx ON food_listings (lower(food_name) text_pattern_ops)",
+            "CREATE INDEX IF NOT EXISTS food_listings_location_prefix_idx ON food_listings (lower(location) text_pattern_ops)",
+            "CREATE INDEX IF NOT EXISTS providers_name_prefix_idx ON providers (lower(name) text_pattern_ops)",
+            # Substring search where the pg_trgm contrib extension is installed
+            """DO $$
+               BEGIN
+                   IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+                       CREATE EXTENSION IF NOT EXISTS pg_trgm;
+                       CREATE INDEX IF NOT EXISTS food_listings_food_name_trgm_idx
+                           ON food_listings USING gin (food_name gin_trgm_ops);
+                       CREATE INDEX IF NOT EXISTS food_listings_location_trgm_idx
+                           ON food_listings USING gin (location gin_trgm_ops);
+                       CREATE INDEX IF NOT EXISTS providers_name_trgm_idx
+                           ON providers USING gin (name gin_trgm_ops);
+                   END IF;
+               END
+               $$""",
+        ],
+    },
+    {
+        "version": 8,
+        "description": "listed_at on food_listings and a claims time index for the trend series",
+        "statements": [
+            # Existing listings keep NULL: when they became available was never recorded
+            "ALTER TABLE food_listings ADD COLUMN IF NOT EXISTS listed_at TIMESTAMP",
+            "ALTER TABLE food_listings ALTER COLUMN listed_at SET DEFAULT now()",
+            # Incremental refreshes of timeseries.py only read claims from the last bucket on
+            "CREATE INDEX IF NOT EXISTS claims_timestamp_idx ON claims (timestamp)",
+        ],
+    },
+    {
+        "version": 9,
+        "description": "Claim reservations: claims.quantity and food_listings.remaining_quantity",
+        "statements": [
+            # NULL on claims made before reservations: they took the whole listing
+            "ALTER TABLE claims ADD COLUMN IF NOT EXISTS quantity INT",
+            "ALTER TABLE claims ADD CONSTRAINT claims_quantity_check CHECK (quantity > 0) NOT VALID",
+            "ALTER TABLE food_listings ADD COLUMN IF NOT EXISTS remaining_quantity INT",
+            """UPDATE food_listings f SET remaining_quantity = GREATEST(f.quantity - COALESCE((
+                   SELECT SUM(COALESCE(c.quantity, f.quantity)) FROM claims c
+                   WHERE c.food_id = f.food_id AND c.status IN ('Pending', 'Completed')), 0), 0)""",
+            # New listings start fully available; a quantity edit keeps what is already reserved
+            """CREATE OR REPLACE FUNCTION food_listings_remaining_quantity() RETURNS trigger
+               LANGUAGE plpgsql AS $$
+               BEGIN
+                   IF TG_OP = 'INSERT' THEN
+                       NEW.remaining_quantity := COALESCE(NEW.remaining_quantity, NEW.quantity, 0);
+                   ELSIF NEW.quantity IS DISTINCT FROM OLD.quantity THEN
+                       NEW.remaining_quantity := GREATEST(OLD.remaining_quantity + NEW.quantity - OLD.quantity, 0);
+                   END IF;
+                   RETURN NEW;
+               END
+               $$""",
+            "DROP TRIGGER IF EXISTS food_listings_remaining_quantity ON food_listings",
+            """CREATE TRIGGER food_listings_remaining_quantity
+               BEFORE INSERT OR UPDATE OF quantity ON food_listings
+               FOR EACH ROW EXECUTE FUNCTION food_listings_remaining_quantity()""",
+            """ALTER TABLE food_listings ADD CONSTRAINT food_listings_remaining_quantity_check
+               CHECK (remaining_quantity >= 0 AND remaining_quantity <= quantity)""",
+        ],
+    },
+    {
+        "version": 10,
+        "description": "Change notifications on the base tables for live updates",
+        # One NOTIFY per statement on channel food_waste_changes (see live_updates.py):
+        # {"table", "op": "I"/"U"/"D", "count", "rows": new rows} or {..., "keys": deleted keys};
+        # updates also list the "columns" that changed. Large statements (bulk loads) only send
+        # the count, so NOTIFY's 8000-byte limit is never hit.
+        "statements": [
+            """CREATE OR REPLACE FUNCTION notify_table_change() RETURNS trigger
+               LANGUAGE plpgsql AS $$
+               DECLARE
+                   changed BIGINT;
+                   payload JSONB;
+               BEGIN
+                   IF TG_OP = 'DELETE' THEN
+                       SELECT COUNT(*) INTO changed FROM old_rows;
+                   ELSE
+                       SELECT COUNT(*) INTO changed FROM new_rows;
+                   END IF;
+                   IF changed = 0 THEN
+                       RETURN NULL;
+                   END IF;
+                   payload := jsonb_build_object('table', TG_TABLE_NAME, 'op', left(TG_OP, 1), 'count', changed);
+                   IF changed <= 20 THEN
+                       IF TG_OP = 'DELETE' THEN
+                           payload := payload || jsonb_build_object(
+                               'keys', (SELECT jsonb_agg(to_jsonb(o) -> TG_ARGV[0]) FROM old_rows o));
+                       ELSE
+                           payload := payload || jsonb_build_object(
+                               'rows', (SELECT jsonb_agg(to_jsonb(n)) FROM new_rows n));
+                       END IF;
+                       IF TG_OP = 'UPDATE' THEN
+                           payload := payload || jsonb_build_object('columns', (
+                               SELECT COALESCE(jsonb_agg(DISTINCT changed_column.key), '[]')
+                               FROM new_rows n
+                               JOIN old_rows o ON to_jsonb(o) -> TG_ARGV[0] = to_jsonb(n) -> TG_ARGV[0]
+                               CROSS JOIN jsonb_each(to_jsonb(n)) changed_column
+                               WHERE to_jsonb(o) -> changed_column.key IS DISTINCT FROM changed_column.value));
+                       END IF;
+                       IF octet_length(payload::text) > 7900 THEN
+                           payload := payload - 'rows' - 'keys';
+                       END IF;
+                   END IF;
+                   PERFORM pg_notify('food_waste_changes', payload::text);
+                   RETURN NULL;
+               END
+               $$""",
+        ] + _notify_triggers([("providers", "provider_id"), ("receivers", "receiver_id"),
+                              ("food_listings", "food_id"), ("claims", "claim_id")]),
+    },
+    {
+        "version": 11,
+        "description": "Partition claims by Timestamp month and food_listings by Expiry_Date month",
+        # See partitions.py for creating future partitions and archiving old ones. A partitioned
+        # table's primary key has to include the partition column, and a foreign key can only
+        # reference a unique key, so claims -> food_listings is kept by triggers from now on.
+        "statements": [
+            # Creates the missing monthly partitions of ``parent`` from first_month through last_month.
+            # Rows of those months that went to the DEFAULT partition are moved into them.
+            """CREATE OR REPLACE FUNCTION ensure_month_partitions(parent TEXT, first_month DATE, last_month DATE)
+               RETURNS INT LANGUAGE plpgsql AS $$
+               DECLARE
+                   this_month DATE := date_trunc('month', first_month);
+                   next_month DATE;
+                   partition TEXT;
+                   column_name TEXT;
+                   fallback TEXT := parent || '_default';
+                   created INT := 0;
+                   stray BOOLEAN;
+               BEGIN
+                   SELECT a.attname INTO column_name
+                   FROM pg_partitioned_table p JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+                   WHERE p.partrelid = parent::regclass;
+                   WHILE this_month <= last_month LOOP
+                       next_month := this_month + interval '1 month';
+                       partition := format('%s_%s', parent, to_char(this_month, 'YYYY_MM'));
+                       IF to_regclass(partition) IS NULL THEN
+                           stray := false;
+                           IF to_regclass(fallback) IS NOT NULL THEN
+                               EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                                              fallback, column_name, this_month, column_name, next_month) INTO stray;
+                           END IF;
+                           IF stray THEN
+                               EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, fallback);
+                           END IF;
+                           EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                                          partition, parent, this_month, next_month);
+                           IF stray THEN
+                               EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) '
+                                              'INSERT INTO %I SELECT * FROM moved',
+                                              fallback, column_name, this_month, column_name, next_month, partition);
+                               EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', parent, fallback);
+                           END IF;
+                           created := created + 1;
+                       END IF;
+                       this_month := next_month;
+                   END LOOP;
+                   RETURN created;
+               END
+               $$""",
+            # Referential integrity and ON DELETE CASCADE of the dropped claims_food_id_fkey
+            """CREATE OR REPLACE FUNCTION claims_check_food_id() RETURNS trigger
+               LANGUAGE plpgsql AS $$
+               DECLARE
+                   missing INT;
+               BEGIN
+                   PERFORM 1 FROM food_listings WHERE food_id IN (SELECT food_id FROM new_rows) FOR KEY SHARE;
+                   SELECT n.food_id INTO missing FROM new_rows n
+                   WHERE n.food_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM food_listings f WHERE f.food_id = n.food_id)
+                   LIMIT 1;
+                   IF FOUND THEN
+                       RAISE foreign_key_violation USING
+                           MESSAGE = format('Food_ID %s is not present in table "food_listings"', missing);
+                   END IF;
+                   RETURN NULL;
+               END
+               $$""",
+            """CREATE OR REPLACE FUNCTION food_listings_delete_claims() RETURNS trigger
+               LANGUAGE plpgsql AS $$
+               BEGIN
+                   DELETE FROM claims WHERE food_id IN (SELECT food_id FROM old_rows);
+                   RETURN NULL;
+               END
+               $$""",
+            "DROP VIEW IF EXISTS listing_claim_state",
+            "ALTER TABLE claims DROP CONSTRAINT IF EXISTS claims_food_id_fkey",
+        ] + _month_partitioned("food_listings", "expiry_date", "food_id") + _month_partitioned("claims", "timestamp", "claim_id") + [
+            """ALTER TABLE food_listings ADD CONSTRAINT food_listings_provider_id_fkey
+               FOREIGN KEY (provider_id) REFERENCES providers (provider_id)""",
+            """ALTER TABLE claims ADD CONSTRAINT claims_receiver_id_fkey
+               FOREIGN KEY (receiver_id) REFERENCES receivers (receiver_id)""",
+            """CREATE TRIGGER food_listings_remaining_quantity
+               BEFORE INSERT OR UPDATE OF quantity ON food_listings
+               FOR EACH ROW EXECUTE FUNCTION food_listings_remaining_quantity()""",
+            # Statement-level, so they fire for the parent table only: moving rows between
+            # partitions (partitions.py) neither checks nor cascades
+            """CREATE TRIGGER claims_check_food_id_insert
+               AFTER INSERT ON claims REFERENCING NEW TABLE AS new_rows
+               FOR EACH STATEMENT EXECUTE FUNCTION claims_check_food_id()""",
+            """CREATE TRIGGER claims_check_food_id_update
+               AFTER UPDATE ON claims REFERENCING NEW TABLE AS new_rows
+               FOR EACH STATEMENT EXECUTE FUNCTION claims_check_food_id()""",
+            """CREATE TRIGGER food_listings_delete_claims
+               AFTER DELETE ON food_listings REFERENCING OLD TABLE AS old_rows
+               FOR EACH STATEMENT EXECUTE FUNCTION food_listings_delete_claims()""",
+        ] + _notify_triggers([("food_listings", "food_id"), ("claims", "claim_id")]) + [
+            "DROP TABLE food_listings_unpartitioned, claims_unpartitioned",
+            summaries.LISTING_CLAIM_STATE_DDL,
+            "ANALYZE food_listings",
+            "ANALYZE claims",
+        ],
+    },
+]
+
+
+def _ensure_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT now())
+    """)
+
+
+def applied_versions(conn):
+    with conn.cursor() as cursor:
+        _ensure_table(cursor)
+        cursor.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] for row in cursor.fetchall()}
+    conn.commit()
+    return versions
+
+
+def pending(conn, target=None):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS
+            if m["version"] not in applied and (target is None or m["version"] <= target)]
+
+
+def validate_constraints(conn):
+    """Validate the constraints left NOT VALID, each in its own transaction.
+
+    ADD CONSTRAINT locks the table exclusively until the migration commits, so
+    migrations add constraints NOT VALID and the existing rows are checked here,
+    under VALIDATE CONSTRAINT's SHARE UPDATE EXCLUSIVE lock: reads and writes go
+    on meanwhile. Constraints an interrupted upgrade left unchecked are picked up
+    by the next one.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT conrelid::regclass::text, quote_ident(conname) FROM pg_constraint
+            WHERE NOT convalidated AND connamespace = current_schema()::regnamespace
+            ORDER BY oid
+        """)
+        unchecked = cursor.fetchall()
+    conn.commit()
+    for table, name in unchecked:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+        conn.commit()
+        print(f"Validated constraint {name} on {table}")
+
+
+def upgrade(conn, target=None):
+    """Apply pending migrations in order; returns the versions applied."""
+    done = []
+    validate_constraints(conn)
+    for migration in pending(conn, target):
+        with conn.cursor() as cursor:
+            # Serialize concurrent upgrades; the lock is released at commit
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (migration["version"],))
+            if cursor.fetchone():
+                conn.rollback()
+                continue
+            for statement in migration["statements"]:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (migration["version"], migration["description"]))
+        conn.commit()
+        done.append(migration["version"])
+        print(f"Applied migration {migration['version']}: {migration['description']}")
+        validate_constraints(conn)
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations.")
+    parser.add_argument("command", choices=["status", "upgrade"])
+    parser.add_argument("--to", type=int, help="stop after this version")
+    parser.add_argument("--explain", action="store_true",
+                        help="record EXPLAIN (ANALYZE, BUFFERS) of every canned query before and after")
+    args = parser.parse_args()
+
+    with connection() as conn:
+        if args.command == "status":
+            applied = applied_versions(conn)
+            for migration in MIGRATIONS:
+                mark = "applied" if migration["version"] in applied else "pending"
+                print(f"{migration['version']:>3}  {mark:<8} {migration['description']}")
+            return
+
+        todo = pending(conn, args.to)
+        if not todo:
+            validate_constraints(conn)
+            print("Database is up to date.")
+            return
+
+        if args.explain:
+            import explain_queries
+            before = explain_queries.record(conn, "before")
+        upgrade(conn, args.to)
+        if args.explain:
+            after = explain_queries.record(conn, "after")
+            explain_queries.print_comparison(before, after)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Run many canned analytics queries concurrently over pooled connections.
+
+Each query runs on its own pooled connection in a worker thread with a
+server-side ``statement_timeout``; results are yielded in completion order so a
+page can render them progressively, and one slow query never holds up the
+others. Queries still running when the batch deadline passes (or when the
+batch is cancelled, e.g. because the user navigated away) are cancelled on the
+server.
+
+With ``FOOD_WASTE_PREWARM=1`` the app also runs every registered query once
+in the background at startup (heavy ones first), so the first visitors to the
+analytics pages are served from the cache.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+import perf
+from db import POOL_MAX_SIZE
+from columnar import ANALYTICS_BACKEND, read_analytics
+from query_runner import QUERY_TIMEOUT, QueryCancelled, cancel, current_run
+from replicas import current_position, set_position
+
+QUERY_WORKERS = int(os.environ.get("FOOD_WASTE_QUERY_WORKERS", str(max(1, POOL_MAX_SIZE // 2))))
+PREWARM = os.environ.get("FOOD_WASTE_PREWARM", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBatch:
+    """Concurrent execution of ``{key: query}``; iterate ``results()`` to consume them as they finish.
+
+    A query is a SQL string or a registered ``AnalyticsQuery`` (run with its default parameters,
+    cache TTL and declared tables).
+
+    ``backend`` is ``"postgres"`` or ``"duckdb"`` (see columnar.py); None means the configured default.
+    """
+
+    def __init__(self, queries, timeout=QUERY_TIMEOUT, max_workers=QUERY_WORKERS, backend=None):
+        self.queries = dict(queries)
+        self.timeout = timeout
+        self.backend = backend
+        self.max_workers = max(1, min(max_workers, len(self.queries) or 1))
+        # Workers run on other threads: register their queries under the page's run and this batch
+        self.owners = (current_run(), uuid.uuid4().hex)
+        self.perf_key = perf.current_key()
+        self.position = current_position()   # replicas serving the batch must have the session's writes
+        self._cancelled = threading.Event()
+
+    def _execute(self, key, query):
+        """Worker: serve from the backend's cache or run ``query`` on the backend."""
+        if self._cancelled.is_set():
+            raise QueryCancelled("cancelled before it started")
+        started = time.perf_counter()
+        set_position(self.position)
+        label = key[-1] if isinstance(key, tuple) else key
+        with perf.scope(f"{self.perf_key}: {label}"):
+            if isinstance(query, str):
+                df = read_analytics(query, backend=self.backend, timeout=self.timeout, owners=self.owners)
+            else:
+                df = query.run(backend=self.backend, timeout=self.timeout, owners=self.owners)
+        return df, time.perf_counter() - started
+
+    def cancel(self):
+        """Stop queued queries from starting and cancel the ones running on the server."""
+        self._cancelled.set()
+        cancel(self.owners[1])
+
+    def results(self):
+        """Yield ``(key, df, error, seconds)`` in completion order; ``df`` is None when ``error`` is set.
+
+        Every key is yielded exactly once. Queries not finished within the batch
+        deadline (statement timeout plus time spent waiting for a connection)
+        are cancelled and reported as errors.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="query")
+        started = time.perf_counter()
+        futures = {executor.submit(self._execute, key, query): key for key, query in self.queries.items()}
+        pending = set(futures)
+        deadline = self.timeout * (1 + len(self.queries) / self.max_workers)
+        try:
+            for future in as_completed(futures, timeout=deadline):
+                pending.discard(future)
+                key = futures[future]
+                try:
+                    df, seconds = future.result()
+                    yield key, df, None, seconds
+                except Exception as e:
+                    yield key, None, e, time.perf_counter() - started
+        except FuturesTimeout:
+            self.cancel()
+            for future in pending:
+                yield futures[future], None, QueryCancelled("batch deadline exceeded"), time.perf_counter() - started
+        finally:
+            # Also reached when the consumer stops iterating early (page rerun / navigation)
+            if pending:
+                self.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run_queries(queries, timeout=QUERY_TIMEOUT, max_workers=QUERY_WORKERS, backend=None):
+    """Shortcut for ``QueryBatch(queries, ...).results()``."""
+    return QueryBatch(queries, timeout=timeout, max_workers=max_workers, backend=backend).results()
+
+
+# ------------------------ Prewarming ------------------------
+_prewarm_thread = None
+
+
+def prewarm(queries, backend=None):
+    """Run ``queries`` (AnalyticsQuery objects) into the cache, heavy ones first; returns the failures."""
+    queries = [query for query in queries if (backend or ANALYTICS_BACKEND) in query.backends]
+    ordered = sorted(queries, key=lambda query: not query.heavy)
+    with perf.scope("prewarm"):
+        batch = QueryBatch({query.key: query for query in ordered}, backend=backend)
+        failures = {key: error for key, _, error, _ in batch.results() if error is not None}
+    for key, error in failures.items():
+        logger.warning("Prewarming %s failed: %s", key, error)
+    return failures
+
+
+def start_prewarm(queries, backend=None):
+    """Prewarm in a background thread, once per process; later calls are no-ops."""
+    global _prewarm_thread
+    if _prewarm_thread is None:
+        _prewarm_thread = threading.Thread(target=prewarm, args=(list(queries), backend),
+                                           name="query-prewarm", daemon=True)
+        _prewarm_thread.start()
+    return _prewarm_thread
@@ -0,0 +1,257 @@
+"""Monthly partitions of claims and food_listings: create ahead, archive old ones.
+
+Since migration 11, ``claims`` is range-partitioned by month of ``Timestamp`` and
+``food_listings`` by month of ``Expiry_Date``, one table per month named like
+``claims_2025_03``, plus a DEFAULT partition for rows outside every month.
+Queries with a condition on those columns (the analysis pages' "Since" window)
+only read the matching months.
+
+``create`` adds the partitions up to PARTITIONS_AHEAD months from now, moving
+rows that ended up in the DEFAULT partition into them. ``archive`` takes the
+months that ended more than RETENTION_MONTHS ago out of the database: each is
+written to ``ARCHIVE_DIR/<partition>.csv.gz`` from one snapshot, then detached and
+dropped in a short transaction, so the parent table is only locked exclusively
+for the detach, not while the file is written. A month that was written to
+during the export is kept. A month of listings is kept as long as a claim that
+is still in the database refers to one of them. ``restore`` loads such a file
+back. After archiving or restoring, the analytics summaries are rebuilt and
+open views are told to reload (see live_updates.py).
+
+Usage:
+    python partitions.py status
+    python partitions.py create [--ahead MONTHS]
+    python partitions.py archive [--keep MONTHS] [--dir DIR] [--detach-only] [--dry-run]
+    python partitions.py restore FILE [FILE ...]
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+from datetime import date
+
+from db import connection
+from live_updates import CHANNEL
+import summaries
+
+PARTITIONS_AHEAD = int(os.environ.get("FOOD_WASTE_PARTITIONS_AHEAD", "3"))
+RETENTION_MONTHS = int(os.environ.get("FOOD_WASTE_RETENTION_MONTHS", "24"))
+ARCHIVE_DIR = os.environ.get("FOOD_WASTE_ARCHIVE_DIR",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+
+# Partitioned table -> partition column. Listings come after claims: they are only
+# archived once no remaining claim refers to them.
+PARTITIONED = {"claims": "timestamp", "food_listings": "expiry_date"}
+_MONTH_PATTERN = re.compile(r"^(claims|food_listings)_(\d{4})_(\d{2})$")
+
+
+def _add_months(day, months):
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def _notify_reset(cursor, table):
+    # Rows appeared or disappeared without INSERT / DELETE triggers firing
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps({"table": table, "op": "reset"})))
+
+
+def monthly_partitions(cursor, table):
+    """``[(partition, first day of its month), ...]`` of ``table``, oldest first; DEFAULT left out."""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, (table,))
+    months = []
+    for (name,) in cursor.fetchall():
+        match = _MONTH_PATTERN.match(name)
+        if match:
+            months.append((name, date(int(match.group(2)), int(match.group(3)), 1)))
+    return sorted(months, key=lambda partition: partition[1])
+
+
+# ------------------------ Create ------------------------
+def create(conn, ahead=PARTITIONS_AHEAD, today=None):
+    """Create the missing partitions from this month to ``ahead`` months on; returns ``{table: created}``."""
+    this_month = _add_months(today or date.today(), 0)
+    created = {}
+    with conn.cursor() as cursor:
+        for table in PARTITIONED:
+            cursor.execute("SELECT ensure_month_partitions(%s, %s, %s)",
+                           (table, this_month, _add_months(this_month, ahead)))
+            created[table] = cursor.fetchone()[0]
+    conn.commit()
+    return created
+
+
+# ------------------------ Archive / restore ------------------------
+def _export(conn, partition, path):
+    """Write ``partition`` to ``path`` from one snapshot.
+
+    Returns ``(rows, xid)``: rows written by transaction ``xid`` or later may not be in the file.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint % 4294967296")
+        xid = cursor.fetchone()[0]
+        with gzip.open(path, "wt", newline="") as out:
+            cursor.copy_expert(f"COPY {partition} TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        rows = cursor.rowcount
+    conn.rollback()
+    return rows, xid
+
+
+def _archive_partition(conn, table, partition, directory, detach_only):
+    path = None if detach_only else os.path.join(directory, f"{partition}.csv.gz")
+    if path is not None:
+        # Exported before the detach, which locks the parent table against every read and write, and
+        # under a temporary name first, so a failed run never leaves a partial archive
+        exported, xid = _export(conn, partition, path + ".tmp")
+    with conn.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+        if path is None:
+            cursor.execute(f"SELECT COUNT(*), 0 FROM {partition}")
+        else:
+            cursor.execute(f"SELECT COUNT(*), COUNT(*) FILTER (WHERE age(xmin) <= age(%s::text::xid)) FROM {partition}",
+                           (xid,))
+        rows, written = cursor.fetchone()
+        if path is not None and (rows != exported or written):
+            # Old months are normally left alone; this one stays attached and is tried again next run
+            conn.rollback()
+            os.remove(path + ".tmp")
+            return 0, None, "kept: written to while it was exported"
+        if not rows:
+            cursor.execute(f"DROP TABLE {partition}")
+            note = "empty, dropped"
+        elif path is None:
+            note = "detached"
+        else:
+            cursor.execute(f"DROP TABLE {partition}")
+            note = "archived"
+        if rows:
+            _notify_reset(cursor, table)
+    if path is not None and not rows:
+        os.remove(path + ".tmp")
+        path = None
+    elif path is not None:
+        os.replace(path + ".tmp", path)
+    conn.commit()
+    return rows, path, note
+
+
+def archive(conn, keep=RETENTION_MONTHS, directory=ARCHIVE_DIR, detach_only=False, dry_run=False, today=None):
+    """Archive the partitions of months that ended more than ``keep`` months ago.
+
+    Returns ``[(partition, rows, file or None, note), ...]``; with ``dry_run`` nothing is changed.
+    """
+    cutoff = _add_months(today or date.today(), -keep)
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    for table in PARTITIONED:
+        with conn.cursor() as cursor:
+            old = [(name, month) for name, month in monthly_partitions(cursor, table)
+                   if _add_months(month, 1) <= cutoff]
+        conn.rollback()
+        for partition, _ in old:
+            if table == "food_listings":
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) FROM claims WHERE food_id IN (SELECT food_id FROM {partition})")
+                    referring = cursor.fetchone()[0]
+                conn.rollback()
+                if referring:
+                    results.append((partition, 0, None, f"kept: {referring:,} newer claims refer to its listings"))
+                    continue
+            if dry_run:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"SELECT COUNT(*) FROM {partition}")
+                    results.append((partition, cursor.fetchone()[0], None, "would be archived"))
+                conn.rollback()
+                continue
+            results.append((partition, *_archive_partition(conn, table, partition, directory, detach_only)))
+    if any(note in ("archived", "detached") for *_, note in results):
+        summaries.rebuild(conn)
+    return results
+
+
+def restore(conn, path):
+    """Load an archive written by ``archive`` back into its partition; returns the rows loaded."""
+    partition = os.path.basename(path).split(".")[0]
+    match = _MONTH_PATTERN.match(partition)
+    if not match:
+        raise ValueError(f"{path} is not a partition archive (<table>_YYYY_MM.csv.gz)")
+    table = match.group(1)
+    month = date(int(match.group(2)), int(match.group(3)), 1)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT ensure_month_partitions(%s, %s, %s)", (table, month, month))
+        with gzip.open(path, "rt", newline="") as data:
+            header = data.readline().strip()
+            cursor.copy_expert(f"COPY {partition} ({header}) FROM STDIN WITH (FORMAT csv)", data)
+        rows = cursor.rowcount
+        if table == "claims":
+            # Loaded straight into the partition, so the parent's Food_ID check didn't run
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM {partition} c
+                WHERE NOT EXISTS (SELECT 1 FROM food_listings f WHERE f.food_id = c.food_id)
+            """)
+            orphans = cursor.fetchone()[0]
+            if orphans:
+                conn.rollback()
+                raise ValueError(f"{orphans:,} claims in {path} refer to listings that aren't in the database; "
+                                 "restore their food_listings months first")
+        _notify_reset(cursor, table)
+    conn.commit()
+    summaries.rebuild(conn)
+    return rows
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Create and archive the monthly partitions.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    create_parser = sub.add_parser("create")
+    create_parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD, help="months ahead of this one")
+    archive_parser = sub.add_parser("archive")
+    archive_parser.add_argument("--keep", type=int, default=RETENTION_MONTHS, help="months of history kept")
+    archive_parser.add_argument("--dir", default=ARCHIVE_DIR)
+    archive_parser.add_argument("--detach-only", action="store_true",
+                                help="detach the partitions but keep them as tables, without writing files")
+    archive_parser.add_argument("--dry-run", action="store_true")
+    restore_parser = sub.add_parser("restore")
+    restore_parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    with connection() as conn:
+        if args.command == "status":
+            with conn.cursor() as cursor:
+                for table in PARTITIONED:
+                    cursor.execute(f"""
+                        SELECT tableoid::regclass::text, COUNT(*), pg_total_relation_size(tableoid)
+                        FROM {table} GROUP BY tableoid
+                    """)
+                    counts = {name: (rows, size) for name, rows, size in cursor.fetchall()}
+                    partitions = monthly_partitions(cursor, table)
+                    print(f"{table}: {len(partitions)} monthly partitions"
+                          + (f", {partitions[0][1]:%Y-%m} to {partitions[-1][1]:%Y-%m}" if partitions else ""))
+                    for name in [name for name, _ in partitions] + [f"{table}_default"]:
+                        rows, size = counts.get(name, (0, 0))
+                        if rows:
+                            print(f"  {name:<26} {rows:>10,} rows  {size / 1024 / 1024:8.1f} MB")
+        elif args.command == "create":
+            for table, created in create(conn, args.ahead).items():
+                print(f"{table}: {created} partition(s) created")
+        elif args.command == "archive":
+            results = archive(conn, args.keep, args.dir, args.detach_only, args.dry_run)
+            for partition, rows, path, note in results:
+                print(f"{partition}: {note}" + (f", {rows:,} rows" if rows else "") + (f" -> {path}" if path else ""))
+            if not results:
+                print(f"Nothing older than {args.keep} months.")
+        else:
+            for path in args.files:
+                try:
+                    print(f"{path}: {restore(conn, path):,} rows restored")
+                except ValueError as e:
+                    raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Latency instrumentation for the app's pages and queries.
+
+Timings are recorded per (key, phase). The key says what was being done, e.g. a
+page name or ``"SQL Analysis: 3. ..."``. The phase is one of
+
+* ``connect``: waiting for a pooled connection and setting up its transaction,
+* ``execute``: running the statement until the first rows arrive,
+* ``fetch``: streaming the remaining rows,
+* ``frame``: building the DataFrame,
+* ``render``: handing results to Streamlit (``st.dataframe``, charts),
+* ``write``: a CRUD transaction,
+* ``page``: the whole script run of a page.
+
+The latest ``PERF_SAMPLES`` timings per (key, phase) are kept in a ring buffer
+for percentiles; counts and totals are cumulative. The app shows them on a
+diagnostics page that is only listed with ``?perf=1`` in the URL. They can be
+downloaded there in the Prometheus text format, or written to
+``FOOD_WASTE_PERF_TEXTFILE`` after every page run for node_exporter's textfile
+collector. The same page can cProfile a single rerun.
+
+Code running during a page records under the thread's current key, which the app
+sets with ``begin_page`` / ``set_key``; ``scope`` nests a key for a block.
+"""
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+
+PERF_SAMPLES = int(os.environ.get("FOOD_WASTE_PERF_SAMPLES", "500"))   # timings kept per (key, phase)
+PERF_TEXTFILE = os.environ.get("FOOD_WASTE_PERF_TEXTFILE")              # Prometheus textfile to keep current
+TEXTFILE_INTERVAL = 15                                                  # seconds between textfile writes
+PROFILE_DIR = os.environ.get("FOOD_WASTE_PROFILE_DIR",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyRecorder:
+    def __init__(self, samples=PERF_SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._timings = {}  # (key, phase) -> deque of seconds, newest last
+        self._totals = {}   # (key, phase) -> [count, sum of seconds] since start
+
+    def record(self, key, phase, seconds):
+        with self._lock:
+            timings = self._timings.get((key, phase))
+            if timings is None:
+                timings = self._timings[(key, phase)] = deque(maxlen=self.samples)
+                self._totals[(key, phase)] = [0, 0.0]
+            timings.append(seconds)
+            totals = self._totals[(key, phase)]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def stats(self):
+        """One dict per (key, phase): count, total and the percentiles of the buffered timings, in ms."""
+        with self._lock:
+            snapshot = [(key, phase, np.array(timings), *self._totals[(key, phase)])
+                        for (key, phase), timings in self._timings.items()]
+        rows = []
+        for key, phase, timings, count, total in snapshot:
+            p50, p95, p99 = np.quantile(timings, QUANTILES) * 1000
+            rows.append({"key": key, "phase": phase, "count": count, "total_ms": total * 1000,
+                         "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": timings.max() * 1000})
+        return rows
+
+    def prometheus(self):
+        """Timings as a Prometheus summary (quantiles over the buffer, count/sum cumulative)."""
+        with self._lock:
+            snapshot = [(key, phase, np.array(timings), *self._totals[(key, phase)])
+                        for (key, phase), timings in sorted(self._timings.items())]
+        lines = ["# HELP food_waste_latency_seconds Latency of app phases per page/query key.",
+                 "# TYPE food_waste_latency_seconds summary"]
+        for key, phase, timings, count, total in snapshot:
+            labels = f'key="{_escape_label(key)}",phase="{phase}"'
+            for q, value in zip(QUANTILES, np.quantile(timings, QUANTILES)):
+                lines.append(f'food_waste_latency_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"food_waste_latency_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"food_waste_latency_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._timings.clear()
+            self._totals.clear()
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_recorder = LatencyRecorder()
+
+
+def get_recorder():
+    return _recorder
+
+
+# ------------------------ Keys ------------------------
+_local = threading.local()
+
+
+def current_key():
+    """Key timings on this thread are recorded under (``"-"`` outside a page run)."""
+    keys = getattr(_local, "keys", None)
+    return keys[-1] if keys else "-"
+
+
+def begin_page(page):
+    """Start timing a script run of ``page``; timings are recorded under ``page`` until ``set_key``."""
+    _local.page = page
+    _local.keys = [page]
+    _local.page_started = time.perf_counter()
+
+
+def end_page():
+    """Record the run's total time and keep the textfile export current."""
+    started = getattr(_local, "page_started", None)
+    if started is None:
+        return
+    _recorder.record(_local.page, "page", time.perf_counter() - started)
+    _local.page_started = None
+    if PERF_TEXTFILE:
+        _write_textfile(PERF_TEXTFILE)
+
+
+def set_key(key):
+    """Record the rest of this run's timings under ``key`` (e.g. the query a page shows)."""
+    keys = getattr(_local, "keys", None)
+    if keys:
+        keys[-1] = key
+    else:
+        _local.keys = [key]
+
+
+@contextmanager
+def scope(key):
+    """Record timings inside the block under ``key`` (used by worker threads for their query)."""
+    keys = getattr(_local, "keys", None)
+    if keys is None:
+        keys = _local.keys = []
+    keys.append(key)
+    try:
+        yield
+    finally:
+        keys.pop()
+
+
+# ------------------------ Timers ------------------------
+def record(phase, seconds, key=None):
+    _recorder.record(current_key() if key is None else key, phase, seconds)
+
+
+@contextmanager
+def timer(phase, key=None):
+    """Time the block as ``phase``; recorded even if the block raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - started, key=key)
+
+
+def latency_stats():
+    return _recorder.stats()
+
+
+def prometheus_text():
+    """Latency summary plus the connection pool and result cache counters."""
+    # Imported here: query_runner, which query_cache is built on, records its timings through this module
+    from db import pool_stats
+    from query_cache import cache_stats
+    lines = [_recorder.prometheus().rstrip("\n")]
+    for prefix, stats in (("food_waste_pool", pool_stats()), ("food_waste_cache", cache_stats())):
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+_textfile_written = 0.0
+_textfile_lock = threading.Lock()
+
+
+def _write_textfile(path):
+    global _textfile_written
+    with _textfile_lock:
+        if time.monotonic() - _textfile_written < TEXTFILE_INTERVAL:
+            return
+        _textfile_written = time.monotonic()
+    try:
+        # Write then rename, so the collector never reads a half-written file
+        with open(f"{path}.tmp", "w") as f:
+            f.write(prometheus_text())
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        logger.warning("Could not write metrics to %s: %s", path, e)
+
+
+# ------------------------ Profiling ------------------------
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def finish_profile(profiler, label, top=25):
+    """Stop ``profiler``, dump it to PROFILE_DIR; returns ``(path, summary of the top functions)``."""
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_")[:40]
+    path = os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{safe_label}.prof")
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    return path, out.getvalue()
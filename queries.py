@@ -0,0 +1,404 @@
+"""Canned analytics queries shown on the SQL Analysis, Custom SQL and Insights Overview pages.
+
+Each query is an ``AnalyticsQuery`` (see query_registry.py) in ``REGISTRY``, with the
+tables it reads, its cache TTL, its plot and its parameters.
+
+Queries that only need per-group totals read the pre-aggregated tables from
+summaries.py instead of scanning food_listings and claims. "Unclaimed" means a
+listing with no Completed claim; those queries join ``listing_claim_state``
+(one row per claimed listing) so each listing is counted exactly once.
+"""
+from datetime import date
+
+from query_registry import AnalyticsQuery, Param, PlotSpec, QueryRegistry
+
+REGISTRY = QueryRegistry()
+register = REGISTRY.register
+
+# Providers and receivers only change through ingest.py; their results can be kept longer
+REFERENCE_TTL = 3600
+
+# Optional time window of the queries that scan claims or food_listings. It is a condition on
+# the column the table is partitioned by (see partitions.py), so only the months from then on
+# are read; left empty, all history is.
+CLAIMS_SINCE = Param("since", "Claims made since", kind=date)
+LISTINGS_SINCE = Param("since", "Listings expiring since", kind=date)
+
+
+def since(column):
+    return f"(%(since)s::date IS NULL OR {column} >= %(since)s)"
+
+
+# ------------------------ SQL Analysis ------------------------
+register(AnalyticsQuery(
+    key="sql_1", page="sql",
+    title="1. How many food providers and receivers are there in each city?",
+    tables={"providers", "receivers"}, ttl=REFERENCE_TTL,
+    sql="""
+        SELECT
+            COALESCE(p.city, r.city) AS city,
+            COALESCE(p.num_providers, 0) AS num_providers,
+            COALESCE(r.num_receivers, 0) AS num_receivers
+        FROM
+            (SELECT city, COUNT(*) AS num_providers FROM providers GROUP BY city) p
+        FULL OUTER JOIN
+            (SELECT city, COUNT(*) AS num_receivers FROM receivers GROUP BY city) r
+        ON p.city = r.city
+        ORDER BY city;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_2", page="sql",
+    title="2. Which type of food provider (restaurant, grocery store, etc.) contributes the most food?",
+    tables={"food_listings"},
+    sql="""
+        SELECT
+            provider_type,
+            total_quantity
+        FROM summary_provider_type
+        ORDER BY total_quantity DESC
+        LIMIT 3;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_3", page="sql",
+    title="3. What is the contact information of food providers in a specific city?",
+    tables={"providers"}, ttl=REFERENCE_TTL,
+    params=(Param("city", "City", default="New Jessica"),),
+    sql="""
+        SELECT
+            name,
+            type,
+            contact
+        FROM providers
+        WHERE city = %(city)s;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_4", page="sql",
+    title="4. Which receivers have claimed the most food?",
+    tables={"claims", "receivers"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    sql=f"""
+        SELECT
+            r.name AS receiver_name,
+            COUNT(c.claim_id) AS total_claims
+        FROM claims c
+        JOIN receivers r ON c.receiver_id = r.receiver_id
+        WHERE {since('c.timestamp')}
+        GROUP BY r.name
+        ORDER BY total_claims DESC LIMIT 5;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_5", page="sql",
+    title="5. What is the total quantity of food available from all providers?",
+    tables={"food_listings"},
+    sql="""
+        SELECT
+                SUM(total_quantity)::BIGINT AS total_food_quantity
+        FROM summary_provider_type;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_6", page="sql",
+    title="6. Which city has the highest number of food listings?",
+    tables={"food_listings"}, heavy=True,
+    params=(LISTINGS_SINCE,),
+    sql=f"""
+        SELECT Location AS City, COUNT(*) AS Number_of_Listings
+        FROM food_listings
+        WHERE {since('expiry_date')}
+        GROUP BY Location
+        ORDER BY Number_of_Listings DESC
+        LIMIT 1;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_7", page="sql",
+    title="7. What are the most commonly available food types?",
+    tables={"food_listings", "claims"},
+    sql="""
+        SELECT Food_Type, listing_count AS Count
+        FROM summary_food_type
+        ORDER BY Count DESC
+        LIMIT 3;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_8", page="sql",
+    title="8. How many food claims have been made for each food item?",
+    tables={"food_listings", "claims"},
+    sql="""
+        SELECT Food_Name, claim_count AS Number_of_Claims
+        FROM summary_food_name
+        WHERE claim_count > 0
+        ORDER BY Number_of_Claims DESC;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_9", page="sql",
+    title="9. Which provider has had the highest number of successful food claims?",
+    tables={"claims", "food_listings", "providers"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    sql=f"""
+        SELECT p.Name AS Provider_Name, COUNT(c.claim_id) AS Successful_Claims
+        FROM claims c
+        JOIN food_listings f ON c.food_id = f.food_id
+        JOIN providers p ON f.provider_id = p.provider_id
+        WHERE c.status = 'Completed' AND {since('c.timestamp')}
+        GROUP BY p.Name
+        ORDER BY Successful_Claims DESC
+        LIMIT 1;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_10", page="sql",
+    title="10. What percentage of food claims are completed vs. pending vs. canceled?",
+    tables={"claims"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    sql=f"""
+        SELECT
+            status,
+            COUNT(*) * 100.0 / (SELECT COUNT(*) FROM claims WHERE {since('timestamp')}) AS percentage
+        FROM claims
+        WHERE {since('timestamp')}
+        GROUP BY status;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_11", page="sql",
+    title="11. What is the average quantity of food claimed per receiver?",
+    tables={"claims", "food_listings", "receivers"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    sql=f"""
+        SELECT
+            r.name AS receiver_name,
+            AVG(f.quantity) AS average_quantity_claimed
+        FROM claims c
+        JOIN food_listings f ON c.food_id = f.food_id
+        JOIN receivers r ON c.receiver_id = r.receiver_id
+        WHERE c.status = 'Completed' AND {since('c.timestamp')}
+        GROUP BY r.name
+        ORDER BY average_quantity_claimed DESC;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_12", page="sql",
+    title="12. Which meal type (breakfast, lunch, dinner, snacks) is claimed the most?",
+    tables={"claims", "food_listings"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    sql=f"""
+        SELECT f.Meal_Type, COUNT(c.claim_id) AS Claim_Count
+        FROM claims c
+        JOIN food_listings f ON c.food_id = f.food_id
+        WHERE {since('c.timestamp')}
+        GROUP BY f.Meal_Type
+        ORDER BY Claim_Count DESC
+        LIMIT 1;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="sql_13", page="sql",
+    title="13. What is the total quantity of food donated by each provider?",
+    tables={"food_listings", "providers"}, heavy=True,
+    params=(LISTINGS_SINCE,),
+    sql=f"""
+        SELECT p.Name AS Provider_Name, SUM(f.Quantity) AS Total_Donated_Quantity
+        FROM food_listings f
+        JOIN providers p ON f.Provider_ID = p.Provider_ID
+        WHERE {since('f.Expiry_Date')}
+        GROUP BY p.Name
+        ORDER BY Total_Donated_Quantity DESC;
+    """,
+))
+
+# ------------------------ Custom SQL ------------------------
+register(AnalyticsQuery(
+    key="custom_1", page="custom",
+    title="1. Which food types are listed the most but rarely claimed?",
+    tables={"food_listings", "claims"},
+    plot=PlotSpec("bar", "Claim Rate by Food Type", x="food_type", y="claim_rate"),
+    sql="""
+        SELECT
+            Food_Type,
+            listing_count AS total_listings,
+            claim_count AS total_claims,
+            ROUND(100.0 * claim_count / listing_count, 2) AS claim_rate
+        FROM summary_food_type
+        ORDER BY claim_rate ASC;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_2", page="custom",
+    title="2. Which providers have the most unclaimed food (by quantity)?",
+    tables={"food_listings", "claims", "providers"},
+    plot=PlotSpec("bar", "Unclaimed Food Quantity by Provider", x="provider_name", y="total_unclaimed_quantity"),
+    sql="""
+        SELECT
+            p.Name AS Provider_Name,
+            SUM(s.total_quantity)::BIGINT AS Total_Unclaimed_Quantity
+        FROM summary_unclaimed s
+        JOIN providers p ON s.provider_id = p.Provider_ID
+        GROUP BY p.Name
+        ORDER BY Total_Unclaimed_Quantity DESC;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_3", page="custom",
+    title="3. Which day of the week has the most unclaimed food (by quantity)?",
+    tables={"food_listings", "claims"}, heavy=True,
+    params=(LISTINGS_SINCE,),
+    plot=PlotSpec("bar", "Unclaimed Food Quantity by Day of Week", x="day_of_week", y="unclaimed_quantity"),
+    sql=f"""
+        SELECT
+            TO_CHAR(f.Expiry_Date, 'FMDay') AS Day_Of_Week,
+            SUM(f.Quantity) AS Unclaimed_Quantity
+        FROM food_listings f
+        LEFT JOIN listing_claim_state s ON s.food_id = f.Food_ID
+        WHERE s.completed IS NOT TRUE AND {since('f.Expiry_Date')}
+        GROUP BY Day_Of_Week
+        ORDER BY Unclaimed_Quantity DESC;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_4", page="custom",
+    title="4. Which cities have the most unclaimed food listings?",
+    tables={"food_listings", "claims"}, heavy=True,
+    params=(LISTINGS_SINCE,),
+    plot=PlotSpec("bar", "Top 5 Cities by Unclaimed Food Listings", x="city", y="unclaimed_listings"),
+    sql=f"""
+        SELECT
+            fl.Location AS City,
+            COUNT(*) AS Total_Listings,
+            COUNT(*) FILTER (WHERE s.completed) AS Claimed_Listings,
+            COUNT(*) FILTER (WHERE s.completed IS NOT TRUE) AS Unclaimed_Listings
+        FROM food_listings fl
+        LEFT JOIN listing_claim_state s ON s.food_id = fl.Food_ID
+        WHERE {since('fl.Expiry_Date')}
+        GROUP BY fl.Location
+        ORDER BY Unclaimed_Listings DESC, City
+        LIMIT 5;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_5", page="custom",
+    title="5. How many claims were made for food items after their expiry date?",
+    tables={"claims", "food_listings"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    plot=PlotSpec("metric", "Number of Late Claims (After Expiry)"),
+    sql=f"""
+        SELECT
+            COUNT(c.Claim_ID) AS Late_Claims
+        FROM claims c
+        JOIN food_listings f ON c.Food_ID = f.Food_ID
+        WHERE c.Timestamp > f.Expiry_Date AND {since('c.Timestamp')};
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_6", page="custom",
+    title="6. Which provider type lists the most food overall (by quantity)?",
+    tables={"food_listings"},
+    plot=PlotSpec("bar", "Top 3 Provider Types by Total Food Quantity Listed", x="provider_type", y="total_quantity"),
+    sql="""
+        SELECT
+            provider_type,
+            total_quantity
+        FROM summary_provider_type
+        ORDER BY total_quantity DESC
+        LIMIT 3;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_7", page="custom",
+    title="7. Which receiver city receives the most total claimed quantity?",
+    tables={"claims", "food_listings", "receivers"}, heavy=True,
+    params=(CLAIMS_SINCE,),
+    plot=PlotSpec("bar", "Top 10 Receiver Cities by Total Claimed Quantity", x="city", y="total_claimed_quantity"),
+    sql=f"""
+        SELECT
+            r.City,
+            SUM(f.Quantity) AS Total_Claimed_Quantity
+        FROM claims c
+        JOIN food_listings f ON c.Food_ID = f.Food_ID
+        JOIN receivers r ON c.Receiver_ID = r.Receiver_ID
+        WHERE c.Status = 'Completed' AND {since('c.Timestamp')}
+        GROUP BY r.City
+        ORDER BY Total_Claimed_Quantity DESC
+        LIMIT 10;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_8", page="custom",
+    title="8. Which meal type has the most unclaimed food (by quantity)?",
+    tables={"food_listings", "claims"},
+    plot=PlotSpec("bar", "Unclaimed Food Quantity by Meal Type", x="meal_type", y="unclaimed_quantity"),
+    sql="""
+        SELECT
+            meal_type,
+            SUM(total_quantity)::BIGINT AS Unclaimed_Quantity
+        FROM summary_unclaimed
+        GROUP BY meal_type
+        ORDER BY Unclaimed_Quantity DESC;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_9", page="custom",
+    title="9. Which specific food items are most frequently unclaimed?",
+    tables={"food_listings", "claims"}, heavy=True,
+    params=(LISTINGS_SINCE,),
+    plot=PlotSpec("bar", "Top 10 Most Frequently Unclaimed Food Items", x="food_name", y="unclaimed_listings"),
+    sql=f"""
+        SELECT
+            f.Food_Name,
+            COUNT(*) AS Unclaimed_Listings
+        FROM food_listings f
+        LEFT JOIN listing_claim_state s ON s.food_id = f.Food_ID
+        WHERE s.completed IS NOT TRUE AND {since('f.Expiry_Date')}
+        GROUP BY f.Food_Name
+        ORDER BY Unclaimed_Listings DESC, f.Food_Name
+        LIMIT 10;
+    """,
+))
+
+register(AnalyticsQuery(
+    key="custom_10", page="custom",
+    title="10. Which providers list the most food items that end up unclaimed?",
+    tables={"providers", "food_listings", "claims"}, heavy=True,
+    params=(LISTINGS_SINCE,),
+    plot=PlotSpec("bar", "Top 5 Providers by Unclaimed Food Listings", x="provider_name", y="unclaimed_listings"),
+    sql=f"""
+        SELECT
+            p.Name AS Provider_Name,
+            COUNT(*) AS total_listings,
+            COALESCE(SUM(s.claim_count), 0)::BIGINT AS total_claims,
+            COUNT(*) FILTER (WHERE s.completed IS NOT TRUE) AS unclaimed_listings
+        FROM providers p
+        JOIN food_listings f ON p.Provider_ID = f.Provider_ID
+        LEFT JOIN listing_claim_state s ON s.food_id = f.Food_ID
+        WHERE {since('f.Expiry_Date')}
+        GROUP BY p.Name
+        ORDER BY unclaimed_listings DESC, Provider_Name
+        LIMIT 5;
+    """,
+))
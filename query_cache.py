@@ -0,0 +1,147 @@
+"""Shared result cache for the canned analytics queries.
+
+Results are kept per (query, params) for a TTL, bounded by total DataFrame memory
+with least-recently-used eviction. Every entry remembers which tables it read, so
+a write to one table only drops the results that depend on it.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from query_runner import run_query
+from summaries import SUMMARY_SOURCES
+
+CACHE_TTL = float(os.environ.get("FOOD_WASTE_CACHE_TTL", "300"))                        # seconds
+CACHE_MAX_BYTES = int(os.environ.get("FOOD_WASTE_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+KNOWN_TABLES = ("providers", "receivers", "food_listings", "claims") + tuple(SUMMARY_SOURCES)
+_TABLE_PATTERN = re.compile(r"\b(" + "|".join(KNOWN_TABLES) + r")\b", re.IGNORECASE)
+
+
+def tables_in(query):
+    """Base tables a SQL string depends on; summary tables count as the tables they derive from."""
+    tables = set()
+    for name in _TABLE_PATTERN.findall(query):
+        name = name.lower()
+        tables.update(SUMMARY_SOURCES.get(name, (name,)))
+    return frozenset(tables)
+
+
+class QueryCache:
+    def __init__(self, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (df, tables, nbytes, expires_at), oldest first
+        self._bytes = 0
+        self._generations = {}         # table -> number of invalidations, guards against stale puts
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def _drop(self, key):
+        _, _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._metrics["misses"] += 1
+                return None
+            if entry[3] < time.monotonic():
+                self._drop(key)
+                self._metrics["expirations"] += 1
+                self._metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics["hits"] += 1
+            return entry[0]
+
+    def generation(self, tables):
+        """Snapshot to pass to ``put`` so a result read before an invalidation is not stored."""
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    def put(self, key, df, tables, ttl=None, generation=None):
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(t, 0) for t in sorted(tables)):
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (df, frozenset(tables), nbytes, expires_at)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._metrics["evictions"] += 1
+
+    def invalidate(self, table):
+        """Drop every cached result that read from ``table``."""
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if table in entry[1]]
+            for key in stale:
+                self._drop(key)
+            self._metrics["invalidations"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# ------------------------ Process-wide cache ------------------------
+_cache = QueryCache()
+
+
+def get_cache():
+    return _cache
+
+
+def _params_key(params):
+    if not params:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params)
+
+
+def read_sql_cached(query, params=None, ttl=None, timeout=None, owners=None, tables=None):
+    """``query_runner.run_query`` through the shared cache.
+
+    ``tables`` are the base tables whose writes invalidate the result; by default they are
+    found in the SQL text. The returned DataFrame is shared with other sessions and must
+    not be modified in place.
+    """
+    key = (" ".join(query.split()), _params_key(params))
+    df = _cache.get(key)
+    if df is None:
+        tables = tables_in(query) if tables is None else frozenset(tables)
+        generation = _cache.generation(tables)
+        df = run_query(query, params=params, timeout=timeout, owners=owners, tables=tables)
+        _cache.put(key, df, tables, ttl=ttl, generation=generation)
+    return df
+
+
+def invalidate_table(table):
+    return _cache.invalidate(table)
+
+
+def cache_stats():
+    return _cache.stats()
@@ -0,0 +1,112 @@
+"""Typed definitions for the canned analytics queries.
+
+Every query on the SQL Analysis, Custom SQL and Insights Overview pages is an
+``AnalyticsQuery`` in ``queries.REGISTRY``. It carries its SQL with named
+``%(name)s`` parameters and the parameters' types and defaults. It also carries
+the base tables it reads, which decide what invalidates its cached result, how
+long that result may be cached, how to plot it and which backends may run it.
+The registry is built once, when queries.py is imported.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date
+
+from columnar import BACKENDS, read_analytics
+from query_cache import tables_in
+
+_PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
+PAGES = {"sql": "SQL Analysis", "custom": "Custom SQL"}
+
+
+@dataclass(frozen=True)
+class Param:
+    """A value the user can change; always bound as a query parameter, never formatted into the SQL."""
+    name: str
+    label: str
+    kind: type = str      # str, int, float or date
+    default: object = None
+
+    def coerce(self, value):
+        if value is None or value == "":
+            return self.default
+        if isinstance(value, self.kind):
+            return value
+        if self.kind is date and isinstance(value, str):
+            return date.fromisoformat(value)
+        return self.kind(value)
+
+
+@dataclass(frozen=True)
+class PlotSpec:
+    kind: str             # "bar" or "metric"
+    title: str
+    x: str = None
+    y: str = None
+
+
+@dataclass(frozen=True)
+class AnalyticsQuery:
+    key: str              # stable id, e.g. "custom_3"
+    page: str             # "sql" (SQL Analysis) or "custom" (Custom SQL)
+    title: str            # the question shown in the page's selectbox
+    sql: str
+    tables: frozenset     # base tables read, directly or through summary tables
+    params: tuple = ()
+    ttl: float = None     # seconds the result may be cached; None for the cache default
+    heavy: bool = False   # scans/joins food_listings or claims rather than reading a summary table
+    plot: PlotSpec = None
+    backends: tuple = tuple(BACKENDS)
+
+    def __post_init__(self):
+        object.__setattr__(self, "tables", frozenset(self.tables))
+        used = set(_PARAM_PATTERN.findall(self.sql))
+        declared = {param.name for param in self.params}
+        if used != declared:
+            raise ValueError(f"{self.key}: SQL parameters {sorted(used)} don't match declared {sorted(declared)}")
+        undeclared = tables_in(self.sql) - self.tables
+        if undeclared:
+            raise ValueError(f"{self.key}: reads {', '.join(sorted(undeclared))} without declaring it")
+        if self.page not in PAGES:
+            raise ValueError(f"{self.key}: unknown page {self.page}")
+        unknown = set(self.backends) - set(BACKENDS)
+        if unknown:
+            raise ValueError(f"{self.key}: unknown backend(s) {', '.join(sorted(unknown))}")
+
+    def bind(self, values=None):
+        """Parameter values for ``self.sql``: defaults filled in, types checked."""
+        values = dict(values or {})
+        unknown = set(values) - {param.name for param in self.params}
+        if unknown:
+            raise ValueError(f"{self.key} has no parameter(s) {', '.join(sorted(unknown))}")
+        return {param.name: param.coerce(values.get(param.name)) for param in self.params}
+
+    def run(self, values=None, backend=None, timeout=None, owners=None):
+        """Result DataFrame on ``backend`` (the configured default if None), through that backend's cache."""
+        if backend is not None and backend not in self.backends:
+            raise ValueError(f"{self.key} cannot run on {backend}")
+        return read_analytics(self.sql, params=self.bind(values) or None, backend=backend, timeout=timeout,
+                              owners=owners, ttl=self.ttl, tables=self.tables)
+
+
+class QueryRegistry:
+    def __init__(self):
+        self._queries = {}  # key -> AnalyticsQuery, in registration order
+
+    def register(self, query):
+        if query.key in self._queries:
+            raise ValueError(f"Query {query.key} is already registered")
+        self._queries[query.key] = query
+        return query
+
+    def __getitem__(self, key):
+        return self._queries[key]
+
+    def __iter__(self):
+        return iter(self._queries.values())
+
+    def __len__(self):
+        return len(self._queries)
+
+    def page(self, page):
+        """Queries shown on ``page`` ("sql" or "custom") by title, in registration order."""
+        return {query.title: query for query in self if query.page == page}
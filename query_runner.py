@@ -0,0 +1,171 @@
+"""Bounded execution of user-triggered read queries.
+
+Every read goes through ``run_query`` (or ``guarded_connection`` for code that
+issues its own statements), which
+
+* sets ``statement_timeout`` for the transaction, so no click can pin a backend;
+* streams rows from a named server-side cursor in ``fetchmany`` chunks and stops
+  at a row/byte budget, marking the result with ``df.attrs["truncated"]``;
+* registers the connection under the current script run, so a newer run of the
+  same session (the user clicked elsewhere) cancels the query on the server;
+* runs on a read replica when one has caught up with the tables read and the
+  session's own writes, else on the primary (see replicas.py);
+* records connect / execute / fetch / frame timings with ``perf``.
+"""
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+import psycopg2
+import psycopg2.extensions
+
+import perf
+from db import connection
+from replicas import get_router, read_connection
+
+QUERY_TIMEOUT = float(os.environ.get("FOOD_WASTE_QUERY_TIMEOUT", "30"))                    # seconds per statement
+QUERY_MAX_ROWS = int(os.environ.get("FOOD_WASTE_QUERY_MAX_ROWS", "100000"))
+QUERY_MAX_BYTES = int(os.environ.get("FOOD_WASTE_QUERY_MAX_MB", "50")) * 1024 * 1024
+FETCH_CHUNK_ROWS = int(os.environ.get("FOOD_WASTE_FETCH_CHUNK", "2000"))
+
+
+class QueryCancelled(Exception):
+    """The query was cancelled on the server (statement timeout or a newer run of the page)."""
+
+
+# ------------------------ Run registry ------------------------
+# Script runs are identified by a token kept in the session's st.session_state; each
+# connection executing a query is registered with the tokens of whoever may cancel it.
+_lock = threading.Lock()
+_running = {}       # id(conn) -> (conn, owners)
+_cancelled = set()  # id(conn) of connections cancelled through cancel()
+_local = threading.local()
+
+
+def new_run(previous=None):
+    """Start a script run: cancel what the ``previous`` run still has in flight, return the new token."""
+    if previous is not None:
+        cancel(previous)
+    _local.run = uuid.uuid4().hex
+    return _local.run
+
+
+def current_run():
+    """Token of the script run on this thread, or None outside the app."""
+    return getattr(_local, "run", None)
+
+
+def cancel(owner):
+    """Cancel every running query registered under ``owner``; returns how many were cancelled."""
+    with _lock:
+        targets = [conn for conn, owners in _running.values() if owner in owners]
+        _cancelled.update(id(conn) for conn in targets)
+    for conn in targets:
+        try:
+            conn.cancel()
+        except psycopg2.Error:
+            pass
+    return len(targets)
+
+
+def running_queries():
+    with _lock:
+        return len(_running)
+
+
+@contextmanager
+def guarded_connection(timeout=None, owners=None, tables=None, primary=False):
+    """Pooled connection with ``statement_timeout`` set for its current transaction.
+
+    The timeout is ``SET LOCAL``, so it lasts until the caller commits or rolls
+    back. A statement cut short by the timeout or by ``cancel`` raises
+    ``QueryCancelled``; the connection stays usable and goes back to the pool.
+    The connection is for reads of ``tables`` (None: any table) and may be a
+    replica's, unless ``primary`` is set.
+    """
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    owners = tuple(owner for owner in (owners or (current_run(),)) if owner is not None)
+    started = time.perf_counter()
+    with (connection() if primary else read_connection(tables)) as conn:
+        with _lock:
+            _running[id(conn)] = (conn, owners)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+            perf.record("connect", time.perf_counter() - started)
+            yield conn
+        except psycopg2.extensions.QueryCanceledError:
+            conn.rollback()
+            with _lock:
+                by_cancel = id(conn) in _cancelled
+            raise QueryCancelled("cancelled" if by_cancel else f"exceeded the {timeout:g}s statement timeout")
+        finally:
+            with _lock:
+                _running.pop(id(conn), None)
+                _cancelled.discard(id(conn))
+
+
+# ------------------------ Streaming fetch ------------------------
+def run_query(query, params=None, timeout=None, max_rows=None, max_bytes=None, owners=None, tables=None,
+              primary=False):
+    """Run a read query and return at most ``max_rows`` rows / ``max_bytes`` as a DataFrame.
+
+    ``df.attrs["truncated"]`` is True when rows were left unread because of the budget.
+    ``tables`` are the tables it reads (None: any), for picking a replica; see ``guarded_connection``.
+    """
+    max_rows = QUERY_MAX_ROWS if max_rows is None else max_rows
+    max_bytes = QUERY_MAX_BYTES if max_bytes is None else max_bytes
+
+    chunks, rows, nbytes, truncated = [], 0, 0, False
+    fetching = framing = 0.0
+    try:
+        with guarded_connection(timeout=timeout, owners=owners, tables=tables, primary=primary) as conn:
+            with conn.cursor(name=f"query_{uuid.uuid4().hex}") as cursor:
+                started = time.perf_counter()
+                cursor.execute(query, params)
+                while True:
+                    # One row past the budget tells whether anything was left out
+                    batch = cursor.fetchmany(min(FETCH_CHUNK_ROWS, max_rows + 1 - rows))
+                    columns = [desc[0] for desc in cursor.description]
+                    if not chunks:
+                        # A named cursor only runs the statement on its first fetch
+                        perf.record("execute", time.perf_counter() - started)
+                    else:
+                        fetching += time.perf_counter() - started
+                    if not batch:
+                        break
+                    started = time.perf_counter()
+                    chunk = pd.DataFrame(batch, columns=columns)
+                    if rows + len(chunk) > max_rows:
+                        chunk = chunk.iloc[:max_rows - rows]
+                        truncated = True
+                    chunks.append(chunk)
+                    rows += len(chunk)
+                    nbytes += int(chunk.memory_usage(index=True, deep=True).sum())
+                    framing += time.perf_counter() - started
+                    if truncated:
+                        break
+                    if nbytes >= max_bytes:
+                        truncated = bool(cursor.fetchmany(1))
+                        break
+                    started = time.perf_counter()
+            conn.rollback()
+
+    except psycopg2.extensions.TransactionRollbackError:
+        # A replica cancels reads that conflict with changes it replays; the primary has no such conflicts
+        if primary or get_router() is None:
+            raise
+        return run_query(query, params, timeout, max_rows, max_bytes, owners, tables, primary=True)
+
+    started = time.perf_counter()
+    if not chunks:
+        df = pd.DataFrame(columns=columns)
+    else:
+        df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+    df.attrs["truncated"] = truncated
+    perf.record("fetch", fetching)
+    perf.record("frame", framing + time.perf_counter() - started)
+    return df
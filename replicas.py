@@ -0,0 +1,342 @@
+"""Read/write routing between the primary and streaming-replication read replicas.
+
+Writes always go to the primary (db.py's pool). The reads that only need to be
+recent, the analytics queries and the View Tables pages (see query_runner.py),
+go to one of the read replicas in FOOD_WASTE_DB_REPLICAS when one is caught up
+enough, and to the primary otherwise:
+
+* a replica that can't be reached, is busy (its pool is full), is no longer in
+  recovery (it was promoted) or replays more than REPLICA_MAX_LAG seconds behind
+  is skipped; its lag is checked at most every REPLICA_CHECK seconds,
+* read-your-writes: ``write_connection`` records the primary's WAL position after
+  a write in the session's ``WritePosition``, and that session's reads only go to
+  a replica that has replayed up to it; the tables it is told were written get
+  the position too (see below),
+* reads name the tables they read, and a replica only serves them once it has
+  replayed the last write to those tables this process knows of: its own, or one
+  reported by the live_updates.py listener. So a cached result refilled right
+  after a write is never read from before the write.
+
+Replicas take the primary's database, user and password; each entry is a host,
+``host:port`` or socket directory. With none configured every read runs on the
+primary, as before.
+
+Usage:
+    python replicas.py status    # lag and replay position of every replica
+    python replicas.py check     # write on the primary, time until each replica has replayed it
+"""
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from db import DB_SETTINGS, POOL_MAX_SIZE, ConnectionPool, PoolTimeout, connection, get_pool
+
+REPLICAS = [address.strip() for address in os.environ.get("FOOD_WASTE_DB_REPLICAS", "").split(",") if address.strip()]
+REPLICA_MAX_LAG = float(os.environ.get("FOOD_WASTE_REPLICA_MAX_LAG", "5"))    # seconds of replay lag a read may see
+REPLICA_CHECK = float(os.environ.get("FOOD_WASTE_REPLICA_CHECK", "2"))        # seconds between lag checks of a replica
+REPLICA_RETRY = 15      # seconds before a replica that failed is tried again
+CONNECT_TIMEOUT = 3     # seconds to connect to a replica
+
+LAG_SQL = """
+    SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text,
+           CASE WHEN pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn()
+                     AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+
+def lsn(text):
+    """A WAL position as written by PostgreSQL (``16/B374D848``) as an int, so positions compare."""
+    high, low = text.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def lsn_text(position):
+    return f"{position >> 32:X}/{position & 0xFFFFFFFF:X}"
+
+
+# ------------------------ Session positions ------------------------
+class WritePosition:
+    """The primary's WAL position after a session's last write; kept in its st.session_state."""
+
+    def __init__(self):
+        self.lsn = 0
+        self.written_at = None
+
+    def advance(self, position):
+        self.lsn = max(self.lsn, position)
+        self.written_at = time.time()
+
+
+_local = threading.local()
+
+
+def set_position(position):
+    """Make reads on this thread wait for ``position`` (a WritePosition, or None for no session)."""
+    _local.position = position
+
+
+def current_position():
+    return getattr(_local, "position", None)
+
+
+# ------------------------ Router ------------------------
+class Replica:
+    def __init__(self, address, max_size=POOL_MAX_SIZE):
+        host, _, port = address.rpartition(":")
+        if not port.isdigit():
+            host, port = address, DB_SETTINGS["port"]
+        self.address = address
+        # A full replica pool sends the read to the primary instead of waiting
+        self.pool = ConnectionPool(min_size=0, max_size=max_size, timeout=0,
+                                   **dict(DB_SETTINGS, host=host, port=int(port), connect_timeout=CONNECT_TIMEOUT))
+        self.lag = None
+        self.replay_lsn = 0
+        self.checked_at = float("-inf")
+        self.error = None
+
+    def check(self, conn):
+        """Read the replica's lag and replay position on ``conn``, one of its own."""
+        with conn.cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            in_recovery, replayed, lag = cursor.fetchone()
+        conn.rollback()
+        self.checked_at = time.monotonic()
+        self.error = None if in_recovery else "not in recovery"
+        self.replay_lsn = lsn(replayed) if replayed else 0
+        self.lag = float(lag) if lag is not None else None
+
+    def failed(self, error):
+        self.checked_at = time.monotonic()
+        self.error = str(error).strip() or type(error).__name__
+
+
+class ReadRouter:
+    """Picks the connection a read runs on: a replica that is caught up enough, else the primary."""
+
+    def __init__(self, addresses, primary=None, max_lag=REPLICA_MAX_LAG, check_every=REPLICA_CHECK):
+        self.replicas = [Replica(address) for address in addresses]
+        self.primary = primary or get_pool()
+        self.max_lag = max_lag
+        self.check_every = check_every
+        self._lock = threading.Lock()
+        self._next = 0
+        self._written = {}   # table -> highest WAL position of a write to it known here; None: any table
+        self._metrics = {"replica_reads": 0, "primary_reads": 0, "behind": 0, "lagging": 0, "unavailable": 0}
+
+    def note_write(self, position, tables=(None,)):
+        """Reads of ``tables`` (default: all of them) wait for replicas to replay up to ``position``."""
+        with self._lock:
+            for table in tables:
+                self._written[table] = max(self._written.get(table, 0), position)
+
+    def required(self, tables=None):
+        """Replay position a replica needs to serve a read of ``tables`` (None: any) for this thread's session."""
+        session = current_position()
+        with self._lock:
+            if tables is None:
+                known = max(self._written.values(), default=0)
+            else:
+                known = max(self._written.get(table, 0) for table in (None, *tables))
+        return max(known, session.lsn if session is not None else 0)
+
+    def _usable(self, replica, needed):
+        """Whether ``replica``, as last checked, may serve a read that needs position ``needed``."""
+        if replica.error is not None:
+            return False
+        if replica.lag is None or replica.lag > self.max_lag:
+            self._count("lagging")
+            return False
+        if replica.replay_lsn < needed:
+            self._count("behind")
+            return False
+        return True
+
+    def _count(self, metric):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def _replica_connection(self, needed):
+        with self._lock:
+            start = self._next
+            self._next += 1
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            stale = time.monotonic() - replica.checked_at > (REPLICA_RETRY if replica.error else self.check_every)
+            # Between checks a replica known to be unusable is skipped without asking it again, but one
+            # that is merely behind a session's write is asked: it is usually a few milliseconds away
+            if not stale and replica.error is not None:
+                self._count("unavailable")
+                continue
+            if not stale and not self._usable(replica, 0):
+                continue
+            try:
+                conn = replica.pool.getconn()
+            except PoolTimeout:
+                self._count("unavailable")
+                continue
+            except psycopg2.Error as e:
+                replica.failed(e)
+                self._count("unavailable")
+                continue
+            if stale or replica.replay_lsn < needed:
+                try:
+                    replica.check(conn)
+                except psycopg2.Error as e:
+                    replica.pool.putconn(conn, broken=True)
+                    replica.failed(e)
+                    self._count("unavailable")
+                    continue
+            if self._usable(replica, needed):
+                return replica, conn
+            replica.pool.putconn(conn)
+        return None, None
+
+    @contextmanager
+    def connection(self, tables=None):
+        """Check out a connection for a read of ``tables`` (None: any table) for a ``with`` block."""
+        replica, conn = self._replica_connection(self.required(tables))
+        pool = replica.pool if replica is not None else self.primary
+        if conn is None:
+            conn = pool.getconn()
+        self._count("replica_reads" if replica is not None else "primary_reads")
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            pool.putconn(conn, broken=broken)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["replicas"] = [{"address": replica.address, "lag": replica.lag, "error": replica.error,
+                              "replay_lsn": lsn_text(replica.replay_lsn), "in_use": replica.pool.stats()["in_use"]}
+                             for replica in self.replicas]
+        return stats
+
+
+# ------------------------ Process-wide router ------------------------
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """The router shared by every session in this process, or None without FOOD_WASTE_DB_REPLICAS."""
+    global _router
+    if _router is None and REPLICAS:
+        with _router_lock:
+            if _router is None:
+                _router = ReadRouter(REPLICAS)
+    return _router
+
+
+def read_connection(tables=None):
+    """Context manager for a read of ``tables``: a caught-up replica's connection or a primary one."""
+    router = get_router()
+    return router.connection(tables) if router is not None else connection()
+
+
+@contextmanager
+def write_connection(tables=()):
+    """A primary connection for writes; once the block committed, the session's reads see them.
+
+    Other sessions' reads of ``tables``, the tables the block wrote, also wait for the
+    write; reads of any other table don't.
+    """
+    with connection() as conn:
+        yield conn
+        router = get_router()
+        if router is not None and conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_current_wal_insert_lsn()::text")
+                position = lsn(cursor.fetchone()[0])
+            conn.rollback()
+            if tables:
+                router.note_write(position, tables)
+            session = current_position()
+            if session is not None:
+                session.advance(position)
+
+
+def router_stats():
+    router = get_router()
+    return router.stats() if router is not None else None
+
+
+# ------------------------ CLI ------------------------
+def _catch_up(router, position, timeout):
+    """Seconds until each replica has replayed ``position``, or None if it didn't within ``timeout``."""
+    started = time.perf_counter()
+    caught_up = {}
+    while len(caught_up) < len(router.replicas) and time.perf_counter() - started < timeout:
+        for replica in router.replicas:
+            if replica.address in caught_up:
+                continue
+            with replica.pool.connection() as conn:
+                replica.check(conn)
+            if replica.replay_lsn >= position:
+                caught_up[replica.address] = time.perf_counter() - started
+        time.sleep(0.001)
+    return {replica.address: caught_up.get(replica.address) for replica in router.replicas}
+
+
+def _served_by(conn):
+    on_primary = conn.info.host == DB_SETTINGS["host"] and conn.info.port == DB_SETTINGS["port"]
+    return "primary" if on_primary else "replica"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read replicas: lag, and how reads are routed after a write.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    check_parser = sub.add_parser("check")
+    check_parser.add_argument("--writes", type=int, default=5)
+    check_parser.add_argument("--timeout", type=float, default=10, help="seconds to wait for a replica")
+    args = parser.parse_args()
+
+    router = get_router()
+    if router is None:
+        raise SystemExit("No replicas configured; set FOOD_WASTE_DB_REPLICAS (e.g. localhost:5433)")
+    if args.command == "status":
+        for replica in router.replicas:
+            try:
+                with replica.pool.connection() as conn:
+                    replica.check(conn)
+            except psycopg2.Error as e:
+                replica.failed(e)
+            state = replica.error or (f"lag {replica.lag:.3f}s" if replica.lag is not None else "lag unknown")
+            print(f"{replica.address}: {state}, replayed up to {lsn_text(replica.replay_lsn)}")
+        return
+
+    set_position(WritePosition())
+    for i in range(args.writes):
+        # A WAL record committed like any write, without touching a table
+        with write_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_logical_emit_message(true, 'replicas.py', 'check')")
+            conn.commit()
+        position = current_position().lsn
+        with router.connection() as conn:
+            served_by = _served_by(conn)
+        delays = _catch_up(router, position, args.timeout)
+        print(f"write {i + 1} at {lsn_text(position)}: read right after it went to the {served_by}; "
+              + ", ".join(f"{address} replayed it after {seconds * 1000:.1f} ms" if seconds is not None
+                          else f"{address} NOT within {args.timeout:g}s" for address, seconds in delays.items()))
+        with router.connection() as conn:
+            served_by = _served_by(conn)
+        print(f"  read after the replicas caught up went to the {served_by}")
+    stats = router.stats()
+    print(f"Reads: {stats['replica_reads']} on replicas, {stats['primary_reads']} on the primary "
+          f"({stats['behind']} times a replica was behind the session's write)")
+
+
+if __name__ == "__main__":
+    main()
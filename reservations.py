@@ -0,0 +1,201 @@
+"""Claim reservations: receivers take part of a listing's quantity atomically.
+
+``food_listings.remaining_quantity`` (migration 9) is the quantity nobody has
+reserved yet. ``reserve`` decrements it with one conditional
+``UPDATE ... RETURNING`` and inserts the Pending claim in the same statement.
+Concurrent reservations of one listing queue on its row lock, and each
+re-checks the remaining quantity once it has the row, so a listing is never
+over-allocated. ``reserve_any`` takes the first of several listings that no
+other reservation has locked (``FOR UPDATE SKIP LOCKED``), for receivers who
+don't mind which one they get. The claim is added to the analytics summaries in
+a short transaction after the reservation commits.
+
+A claim moves from Pending to Completed or to Cancelled, once. Cancelling gives
+its quantity back to the listing. Claims made before migration 9 have no
+quantity and count as taking the whole listing.
+
+Usage:
+    python reservations.py reserve FOOD_ID RECEIVER_ID QUANTITY
+    python reservations.py complete CLAIM_ID
+    python reservations.py cancel CLAIM_ID
+"""
+import argparse
+
+from db import connection
+import summaries
+
+# Listings that can still be reserved
+OPEN_LISTING = "expired_at IS NULL AND expiry_date >= CURRENT_DATE"
+
+RESERVE_SQL = f"""
+    WITH taken AS (
+        UPDATE food_listings SET remaining_quantity = remaining_quantity - %(quantity)s
+        WHERE food_id = %(food_id)s AND remaining_quantity >= %(quantity)s AND {OPEN_LISTING}
+        RETURNING food_id, remaining_quantity
+    )
+    INSERT INTO claims (food_id, receiver_id, status, timestamp, quantity)
+    SELECT food_id, %(receiver_id)s, 'Pending', COALESCE(%(claimed_at)s, LOCALTIMESTAMP), %(quantity)s
+    FROM taken
+    RETURNING claim_id, food_id, (SELECT remaining_quantity FROM taken)
+"""
+
+# Same, but from the soonest-expiring listing among several that isn't locked by another reservation
+RESERVE_ANY_SQL = f"""
+    WITH candidate AS (
+        SELECT food_id FROM food_listings
+        WHERE food_id = ANY(%(food_ids)s) AND remaining_quantity >= %(quantity)s AND {OPEN_LISTING}
+        ORDER BY expiry_date, food_id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    ), taken AS (
+        UPDATE food_listings f SET remaining_quantity = f.remaining_quantity - %(quantity)s
+        FROM candidate
+        WHERE f.food_id = candidate.food_id
+        RETURNING f.food_id, f.remaining_quantity
+    )
+    INSERT INTO claims (food_id, receiver_id, status, timestamp, quantity)
+    SELECT food_id, %(receiver_id)s, 'Pending', COALESCE(%(claimed_at)s, LOCALTIMESTAMP), %(quantity)s
+    FROM taken
+    RETURNING claim_id, food_id, (SELECT remaining_quantity FROM taken)
+"""
+
+# Remaining quantity from scratch: the listing's quantity minus its Pending and Completed claims
+RECOUNT_SQL = """
+    UPDATE food_listings f SET remaining_quantity = GREATEST(f.quantity - COALESCE((
+        SELECT SUM(COALESCE(c.quantity, f.quantity)) FROM claims c
+        WHERE c.food_id = f.food_id AND c.status IN ('Pending', 'Completed')), 0), 0)
+    WHERE f.food_id = ANY(%s)
+    RETURNING f.remaining_quantity
+"""
+
+
+class ReservationError(Exception):
+    """A reservation or claim transition that could not be made; nothing was written."""
+
+
+class InsufficientQuantity(ReservationError):
+    pass
+
+
+class InvalidTransition(ReservationError):
+    pass
+
+
+def _reserved(conn, row, quantity):
+    """Commit the reservation in ``row``, then count its claim in the summaries; returns the claim."""
+    claim_id, food_id, remaining = row
+    conn.commit()
+    # In a short transaction of its own: holding the food type's summary row until the reservation
+    # commits would queue reservations of different listings behind each other
+    with conn.cursor() as cursor:
+        summaries.pending_claims_added(cursor, [food_id])
+    conn.commit()
+    return {"claim_id": claim_id, "food_id": food_id, "quantity": quantity, "remaining_quantity": remaining}
+
+
+def reserve(conn, food_id, receiver_id, quantity, claimed_at=None):
+    """Reserve ``quantity`` units of a listing as a Pending claim; returns the claim as a dict.
+
+    Raises InsufficientQuantity when the listing doesn't exist, has expired or has fewer units left.
+    """
+    if quantity <= 0:
+        raise ValueError("quantity must be above 0")
+    with conn.cursor() as cursor:
+        cursor.execute(RESERVE_SQL, {"food_id": food_id, "receiver_id": receiver_id, "quantity": quantity,
+                                     "claimed_at": claimed_at})
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(f"SELECT remaining_quantity, {OPEN_LISTING} FROM food_listings WHERE food_id = %s",
+                           (food_id,))
+            listing = cursor.fetchone()
+            conn.rollback()
+            if listing is None:
+                raise InsufficientQuantity(f"Food_ID {food_id} does not exist")
+            if not listing[1]:
+                raise InsufficientQuantity(f"Food_ID {food_id} has expired")
+            raise InsufficientQuantity(f"Food_ID {food_id} has only {listing[0]} left, {quantity} requested")
+    return _reserved(conn, row, quantity)
+
+
+def reserve_any(conn, food_ids, receiver_id, quantity, claimed_at=None):
+    """Reserve ``quantity`` units of whichever of ``food_ids`` expires first and is not busy.
+
+    Listings locked by concurrent reservations are skipped rather than waited for, so
+    InsufficientQuantity may also mean they were all busy; retrying is safe.
+    """
+    if quantity <= 0:
+        raise ValueError("quantity must be above 0")
+    with conn.cursor() as cursor:
+        cursor.execute(RESERVE_ANY_SQL, {"food_ids": list(food_ids), "receiver_id": receiver_id,
+                                         "quantity": quantity, "claimed_at": claimed_at})
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            raise InsufficientQuantity(f"No listing with {quantity} left is free right now")
+    return _reserved(conn, row, quantity)
+
+
+def _transition(conn, claim_id, status):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT food_id FROM claims WHERE claim_id = %s", (claim_id,))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            raise ReservationError(f"Claim {claim_id} does not exist")
+        food_id = row[0]
+        # The listing before the claim, in the order reserve() locks them
+        before = summaries.lock_listing(cursor, food_id)
+        cursor.execute("UPDATE claims SET status = %s WHERE claim_id = %s AND status = 'Pending' RETURNING quantity",
+                       (status, claim_id))
+        if cursor.fetchone() is None:
+            cursor.execute("SELECT status FROM claims WHERE claim_id = %s", (claim_id,))
+            current = cursor.fetchone()[0]
+            conn.rollback()
+            raise InvalidTransition(f"Claim {claim_id} is {current}; only Pending claims can become {status}")
+        remaining = before["remaining_quantity"]
+        if status == "Cancelled":
+            cursor.execute(RECOUNT_SQL, ([food_id],))
+            remaining = cursor.fetchone()[0]
+        summaries.claims_changed(cursor, food_id, before)
+    conn.commit()
+    return {"claim_id": claim_id, "food_id": food_id, "status": status, "remaining_quantity": remaining}
+
+
+def complete(conn, claim_id):
+    """Pending -> Completed: the receiver picked the food up."""
+    return _transition(conn, claim_id, "Completed")
+
+
+def cancel(conn, claim_id):
+    """Pending -> Cancelled: the claim's quantity goes back to the listing."""
+    return _transition(conn, claim_id, "Cancelled")
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Reserve listing quantities and move claims on.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reserve_parser = sub.add_parser("reserve")
+    reserve_parser.add_argument("food_id", type=int)
+    reserve_parser.add_argument("receiver_id", type=int)
+    reserve_parser.add_argument("quantity", type=int)
+    for command in ("complete", "cancel"):
+        sub.add_parser(command).add_argument("claim_id", type=int)
+    args = parser.parse_args()
+
+    with connection() as conn:
+        try:
+            if args.command == "reserve":
+                claim = reserve(conn, args.food_id, args.receiver_id, args.quantity)
+                print(f"Claim {claim['claim_id']}: {claim['quantity']} of Food_ID {claim['food_id']} reserved "
+                      f"({claim['remaining_quantity']} left)")
+            else:
+                claim = complete(conn, args.claim_id) if args.command == "complete" else cancel(conn, args.claim_id)
+                print(f"Claim {claim['claim_id']} is {claim['status']} "
+                      f"(Food_ID {claim['food_id']}: {claim['remaining_quantity']} left)")
+        except ReservationError as e:
+            raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Base table definitions shared by the loaders and maintenance tools.
+
+The DDL is the one used in ``SQL queries.ipynb``; tables are listed in load order.
+``categories`` are the low-cardinality text columns that table_frames.py keeps as
+categoricals: with a fixed vocabulary, or None for the values found in the data.
+``integers`` are the INT columns, including those later migrations add;
+``timestamps`` the TIMESTAMP columns later migrations add, which the CSVs don't
+have (``dates`` are the CSV's date columns with their format).
+"""
+
+PROVIDER_TYPES = ["Restaurant", "Grocery Store", "Supermarket", "Catering Service"]
+RECEIVER_TYPES = ["NGO", "Charity", "Shelter", "Individual"]
+FOOD_TYPES = ["Vegetarian", "Non-Vegetarian", "Vegan"]
+MEAL_TYPES = ["Breakfast", "Lunch", "Dinner", "Snacks"]
+CLAIM_STATUSES = ["Pending", "Completed", "Cancelled"]
+
+TABLES = {
+    "providers": {
+        "csv": "providers_data.csv",
+        "columns": ["Provider_ID", "Name", "Type", "Address", "City", "Contact"],
+        "primary_key": "Provider_ID",
+        "dates": {},
+        "categories": {"Type": PROVIDER_TYPES, "City": None},
+        "integers": ["Provider_ID"],
+        "timestamps": [],
+        "ddl": """CREATE TABLE IF NOT EXISTS providers(Provider_ID INT primary key,Name TEXT,Type TEXT,Address TEXT,City TEXT,Contact TEXT);""",
+    },
+    "receivers": {
+        "csv": "receivers_data.csv",
+        "columns": ["Receiver_ID", "Name", "Type", "City", "Contact"],
+        "primary_key": "Receiver_ID",
+        "dates": {},
+        "categories": {"Type": RECEIVER_TYPES, "City": None},
+        "integers": ["Receiver_ID"],
+        "timestamps": [],
+        "ddl": """CREATE TABLE IF NOT EXISTS receivers(Receiver_ID INT primary key,Name TEXT,Type TEXT,City TEXT,Contact TEXT);""",
+    },
+    "food_listings": {
+        "csv": "food_listings_data.csv",
+        "columns": ["Food_ID", "Food_Name", "Quantity", "Expiry_Date", "Provider_ID", "Provider_Type",
+                    "Location", "Food_Type", "Meal_Type"],
+        "primary_key": "Food_ID",
+        "dates": {"Expiry_Date": "%m/%d/%Y"},
+        "categories": {"Food_Name": None, "Provider_Type": PROVIDER_TYPES, "Location": None,
+                       "Food_Type": FOOD_TYPES, "Meal_Type": MEAL_TYPES},
+        "integers": ["Food_ID", "Quantity", "Provider_ID", "Remaining_Quantity", "Row_Version"],
+        "timestamps": ["Expired_At", "Listed_At"],
+        "ddl": """CREATE TABLE IF NOT EXISTS food_listings(Food_ID INT primary key,Food_Name TEXT,Quantity INT,Expiry_Date DATE,Provider_ID INT,Provider_Type TEXT,Location TEXT,Food_Type TEXT,Meal_Type TEXT);""",
+    },
+    "claims": {
+        "csv": "claims_data.csv",
+        "columns": ["Claim_ID", "Food_ID", "Receiver_ID", "Status", "Timestamp"],
+        "primary_key": "Claim_ID",
+        "dates": {"Timestamp": "%m/%d/%Y %H:%M"},
+        "categories": {"Status": CLAIM_STATUSES},
+        "integers": ["Claim_ID", "Food_ID", "Receiver_ID", "Quantity"],
+        "timestamps": [],
+        "ddl": """CREATE TABLE IF NOT EXISTS claims(Claim_ID INT primary key,Food_ID INT,Receiver_ID INT,Status TEXT,Timestamp TIMESTAMP);""",
+    },
+}
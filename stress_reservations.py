@@ -0,0 +1,234 @@
+"""Concurrency stress test for claim reservations (see reservations.py).
+
+Creates a few "hot" listings, then has many threads reserve small quantities of
+them at once, each over its own connection, completing or cancelling some of
+the claims as they go, until every unit is taken or time runs out. Afterwards
+it checks that no listing gave out more than its quantity and that every
+listing's remaining_quantity matches its claims. It reports claims/sec and
+percentiles of the row-lock wait, i.e. the time spent in the reserving UPDATE,
+which only waits for the listing's row lock. The listings and their claims are
+then removed again, and the analytics summaries are checked as well.
+
+Exits non-zero when any check fails.
+
+Usage:
+    python stress_reservations.py [--threads 32] [--listings 4] [--quantity 500]
+                                  [--duration 30] [--mode exact|any] [--keep]
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import psycopg2
+import psycopg2.extensions
+
+from db import DB_SETTINGS, connection
+import reservations
+import summaries
+
+MAX_UNITS = 5        # a reservation takes 1..MAX_UNITS units
+CANCEL_SHARE = 0.1   # share of reservations cancelled right away (their units go back)
+COMPLETE_SHARE = 0.3
+BACKOFF = 0.005      # at most this many seconds' pause after a refused reservation
+
+
+class TimingCursor(psycopg2.extensions.cursor):
+    """Records how long the reserving statements of reservations.py take."""
+    waits = None  # list shared by the worker's cursors
+
+    def execute(self, query, vars=None):
+        if query is not reservations.RESERVE_SQL and query is not reservations.RESERVE_ANY_SQL:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self.waits.append(time.perf_counter() - started)
+
+
+# ------------------------ Setup / teardown ------------------------
+def create_listings(conn, count, quantity):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT provider_id, type, city FROM providers ORDER BY provider_id LIMIT 1")
+        provider_id, provider_type, city = cursor.fetchone()
+        food_ids = []
+        for i in range(count):
+            cursor.execute("""
+                INSERT INTO food_listings (food_name, quantity, expiry_date, provider_id, provider_type,
+                                           location, food_type, meal_type)
+                VALUES (%s, %s, %s, %s, %s, %s, 'Vegetarian', 'Lunch')
+                RETURNING *
+            """, (f"Stress test {i + 1}", quantity, date.today() + timedelta(days=7), provider_id,
+                  provider_type, city))
+            listing = summaries.returned_listing(cursor)
+            summaries.listing_added(cursor, listing)
+            food_ids.append(listing["food_id"])
+    conn.commit()
+    return food_ids
+
+
+def remove_listings(conn, food_ids):
+    with conn.cursor() as cursor:
+        for food_id in food_ids:
+            before = summaries.lock_listing(cursor, food_id)
+            cursor.execute("DELETE FROM claims WHERE food_id = %s", (food_id,))
+            cursor.execute("DELETE FROM food_listings WHERE food_id = %s", (food_id,))
+            summaries.listing_removed(cursor, before)
+    conn.commit()
+
+
+# ------------------------ Workers ------------------------
+class Stress:
+    def __init__(self, food_ids, receiver_ids, mode, deadline):
+        self.food_ids = food_ids
+        self.receiver_ids = receiver_ids
+        self.mode = mode
+        self.deadline = deadline
+        self.sold_out = threading.Event()
+        self.lock = threading.Lock()
+        self.waits = []
+        self.counts = {"reserved": 0, "units": 0, "completed": 0, "cancelled": 0, "refused": 0, "errors": 0}
+
+    def _sold_out(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COALESCE(SUM(remaining_quantity), 0) FROM food_listings WHERE food_id = ANY(%s)",
+                           (self.food_ids,))
+            left = cursor.fetchone()[0]
+        conn.rollback()
+        return left == 0
+
+    def worker(self, seed):
+        rng = random.Random(seed)
+        waits = []
+        counts = dict.fromkeys(self.counts, 0)
+        conn = psycopg2.connect(**DB_SETTINGS, cursor_factory=type("Cursor", (TimingCursor,), {"waits": waits}))
+        try:
+            while time.monotonic() < self.deadline and not self.sold_out.is_set():
+                quantity = rng.randint(1, MAX_UNITS)
+                receiver_id = rng.choice(self.receiver_ids)
+                try:
+                    if self.mode == "any":
+                        claim = reservations.reserve_any(conn, self.food_ids, receiver_id, quantity)
+                    else:
+                        claim = reservations.reserve(conn, rng.choice(self.food_ids), receiver_id, quantity)
+                except reservations.InsufficientQuantity:
+                    counts["refused"] += 1
+                    if self._sold_out(conn):
+                        self.sold_out.set()
+                    # reserve_any also refuses when every listing is busy; don't spin on them
+                    time.sleep(rng.uniform(0, BACKOFF))
+                    continue
+                except psycopg2.Error:
+                    conn.rollback()
+                    counts["errors"] += 1
+                    continue
+                counts["reserved"] += 1
+                counts["units"] += quantity
+                roll = rng.random()
+                if roll < CANCEL_SHARE:
+                    reservations.cancel(conn, claim["claim_id"])
+                    counts["cancelled"] += 1
+                    counts["units"] -= quantity
+                elif roll < CANCEL_SHARE + COMPLETE_SHARE:
+                    reservations.complete(conn, claim["claim_id"])
+                    counts["completed"] += 1
+        finally:
+            conn.close()
+            with self.lock:
+                self.waits.extend(waits)
+                for key, value in counts.items():
+                    self.counts[key] += value
+
+
+# ------------------------ Checks ------------------------
+def check_allocation(conn, food_ids, quantity, counts):
+    """Human-readable problems found; empty when every listing adds up."""
+    problems = []
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT f.food_id, f.quantity, f.remaining_quantity,
+                   COALESCE(SUM(c.quantity) FILTER (WHERE c.status IN ('Pending', 'Completed')), 0),
+                   COUNT(c.claim_id)
+            FROM food_listings f
+            LEFT JOIN claims c ON c.food_id = f.food_id
+            WHERE f.food_id = ANY(%s)
+            GROUP BY f.food_id, f.quantity, f.remaining_quantity
+        """, (food_ids,))
+        rows = cursor.fetchall()
+        differences = {name: n for name, n in summaries.check(conn).items() if n}
+    conn.rollback()
+    allocated_total = claims_total = 0
+    for food_id, listed, remaining, allocated, claims in rows:
+        allocated_total += allocated
+        claims_total += claims
+        if listed != quantity:
+            problems.append(f"Food_ID {food_id}: quantity changed to {listed}")
+        if allocated > listed:
+            problems.append(f"Food_ID {food_id}: OVER-ALLOCATED, {allocated} of {listed} reserved")
+        if remaining != listed - allocated:
+            problems.append(f"Food_ID {food_id}: remaining_quantity {remaining}, but {listed - allocated} unreserved")
+    if allocated_total != counts["units"]:
+        problems.append(f"{allocated_total} units held by claims, workers kept {counts['units']}")
+    if claims_total != counts["reserved"]:
+        problems.append(f"{claims_total} claims written, workers made {counts['reserved']} reservations")
+    for name, n in differences.items():
+        problems.append(f"{name}: {n} rows differ from a full recompute")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hammer a few listings with concurrent reservations.")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--listings", type=int, default=4, help="hot listings to create")
+    parser.add_argument("--quantity", type=int, default=500, help="units per hot listing")
+    parser.add_argument("--duration", type=float, default=30, help="seconds before giving up")
+    parser.add_argument("--mode", choices=["exact", "any"], default="exact",
+                        help="exact: reserve() a random listing; any: reserve_any() over all of them")
+    parser.add_argument("--keep", action="store_true", help="leave the listings and claims in place")
+    args = parser.parse_args()
+
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT receiver_id FROM receivers ORDER BY receiver_id LIMIT 1000")
+            receiver_ids = [row[0] for row in cursor.fetchall()]
+        conn.rollback()
+        food_ids = create_listings(conn, args.listings, args.quantity)
+    print(f"Created Food_IDs {food_ids[0]}..{food_ids[-1]} with {args.quantity} units each; "
+          f"{args.threads} threads reserving 1-{MAX_UNITS} units ({args.mode})")
+
+    stress = Stress(food_ids, receiver_ids, args.mode, time.monotonic() + args.duration)
+    threads = [threading.Thread(target=stress.worker, args=(seed,)) for seed in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    counts = stress.counts
+    print(f"{counts['reserved']:,} reservations in {elapsed:.1f}s ({counts['reserved'] / elapsed:,.0f} claims/s), "
+          f"{counts['refused']:,} refused, {counts['errors']:,} errors; "
+          f"{counts['completed']:,} completed, {counts['cancelled']:,} cancelled")
+    if stress.waits:
+        p50, p95, p99 = np.quantile(stress.waits, (0.5, 0.95, 0.99)) * 1000
+        print(f"Row lock wait (reserving UPDATE): p50 {p50:.2f} ms  p95 {p95:.2f} ms  p99 {p99:.2f} ms  "
+              f"max {max(stress.waits) * 1000:.2f} ms")
+
+    with connection() as conn:
+        problems = check_allocation(conn, food_ids, args.quantity, counts)
+        if not args.keep:
+            remove_listings(conn, food_ids)
+    for problem in problems:
+        print(f"FAIL  {problem}")
+    if not stress.sold_out.is_set():
+        print(f"Note: units were still left after {args.duration:g}s")
+    print("OK    no listing over-allocated" if not problems else f"{len(problems)} problem(s)")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Pre-aggregated analytics summaries over food_listings and claims.
+
+The analysis pages read these small tables (one row per group) instead of
+scanning and grouping the base tables on every request. The CRUD page keeps
+them current incrementally: every listing write applies a +1/-1 delta for the
+affected listing inside the same transaction.
+
+``listing_claim_state`` is the shared per-listing view of claims (one row per
+claimed Food_ID) that every unclaimed/claim-rate query joins against, so claims
+are aggregated once instead of fanning out listing rows.
+
+Usage:
+    python summaries.py rebuild   # (re)create and fully recompute every summary
+    python summaries.py check     # compare every summary against a full recompute
+"""
+import sys
+
+from psycopg2.extras import execute_values
+
+from db import connection
+
+# ------------------------ Definitions ------------------------
+# One row per Food_ID that has claims; a listing without a row has no claims at all.
+LISTING_CLAIM_STATE_DDL = """
+    CREATE OR REPLACE VIEW listing_claim_state AS
+    SELECT food_id,
+           COUNT(*) AS claim_count,
+           COUNT(*) FILTER (WHERE status = 'Completed') AS completed_count,
+           BOOL_OR(status = 'Completed') AS completed
+    FROM claims
+    GROUP BY food_id
+"""
+
+# name -> (DDL, key columns, full recompute query returning the table's columns in order)
+# A listing is "unclaimed" while it has no Completed claim.
+SUMMARIES = {
+    "summary_provider_type": (
+        """CREATE TABLE IF NOT EXISTS summary_provider_type(
+            provider_type TEXT PRIMARY KEY,
+            listing_count BIGINT NOT NULL,
+            total_quantity BIGINT NOT NULL)""",
+        ("provider_type",),
+        """SELECT COALESCE(provider_type, ''), COUNT(*), COALESCE(SUM(quantity), 0)
+           FROM food_listings
+           GROUP BY 1""",
+    ),
+    "summary_food_type": (
+        """CREATE TABLE IF NOT EXISTS summary_food_type(
+            food_type TEXT PRIMARY KEY,
+            listing_count BIGINT NOT NULL,
+            claim_count BIGINT NOT NULL)""",
+        ("food_type",),
+        """SELECT COALESCE(f.food_type, ''), COUNT(*), COALESCE(SUM(s.claim_count), 0)
+           FROM food_listings f
+           LEFT JOIN listing_claim_state s ON s.food_id = f.food_id
+           GROUP BY 1""",
+    ),
+    "summary_food_name": (
+        """CREATE TABLE IF NOT EXISTS summary_food_name(
+            food_name TEXT PRIMARY KEY,
+            listing_count BIGINT NOT NULL,
+            claim_count BIGINT NOT NULL)""",
+        ("food_name",),
+        """SELECT COALESCE(f.food_name, ''), COUNT(*), COALESCE(SUM(s.claim_count), 0)
+           FROM food_listings f
+           LEFT JOIN listing_claim_state s ON s.food_id = f.food_id
+           GROUP BY 1""",
+    ),
+    "summary_unclaimed": (
+        """CREATE TABLE IF NOT EXISTS summary_unclaimed(
+            provider_id INT NOT NULL,
+            location TEXT NOT NULL,
+            meal_type TEXT NOT NULL,
+            listing_count BIGINT NOT NULL,
+            total_quantity BIGINT NOT NULL,
+            PRIMARY KEY (provider_id, location, meal_type))""",
+        ("provider_id", "location", "meal_type"),
+        """SELECT COALESCE(f.provider_id, 0), COALESCE(f.location, ''), COALESCE(f.meal_type, ''),
+                  COUNT(*), COALESCE(SUM(f.quantity), 0)
+           FROM food_listings f
+           LEFT JOIN listing_claim_state s ON s.food_id = f.food_id
+           WHERE s.completed IS NOT TRUE
+           GROUP BY 1, 2, 3""",
+    ),
+}
+
+# Base tables each derived relation reads, used for cache invalidation.
+SUMMARY_SOURCES = {
+    "listing_claim_state": ("claims",),
+    "summary_provider_type": ("food_listings",),
+    "summary_food_type": ("food_listings", "claims"),
+    "summary_food_name": ("food_listings", "claims"),
+    "summary_unclaimed": ("food_listings", "claims"),
+}
+
+
+# ------------------------ Incremental maintenance ------------------------
+def _upsert(cursor, table, keys, deltas):
+    """Add ``deltas`` to the group row identified by ``keys``; drop the row once it is empty."""
+    key_cols = list(keys)
+    delta_cols = list(deltas)
+    cursor.execute(
+        f"""INSERT INTO {table} ({", ".join(key_cols + delta_cols)})
+            VALUES ({", ".join(["%s"] * (len(key_cols) + len(delta_cols)))})
+            ON CONFLICT ({", ".join(key_cols)}) DO UPDATE SET
+            {", ".join(f"{col} = {table}.{col} + EXCLUDED.{col}" for col in delta_cols)}""",
+        list(keys.values()) + list(deltas.values()))
+    cursor.execute(
+        f"""DELETE FROM {table}
+            WHERE {" AND ".join(f"{col} = %s" for col in key_cols)} AND listing_count <= 0""",
+        list(keys.values()))
+
+
+def _claim_state(cursor, food_id):
+    cursor.execute("""
+        SELECT COUNT(*), COALESCE(BOOL_OR(status = 'Completed'), FALSE)
+        FROM claims WHERE food_id = %s
+    """, (food_id,))
+    claim_count, completed = cursor.fetchone()
+    return {"claim_count": claim_count, "completed": completed}
+
+
+def _listing_deltas(listing, sign):
+    """``(summary, keys, deltas)`` for every summary row one listing contributes to."""
+    quantity = listing["quantity"] or 0
+    claim_count = listing["claim_count"]
+
+    yield ("summary_provider_type", {"provider_type": listing["provider_type"] or ""},
+           {"listing_count": sign, "total_quantity": sign * quantity})
+    yield ("summary_food_type", {"food_type": listing["food_type"] or ""},
+           {"listing_count": sign, "claim_count": sign * claim_count})
+    yield ("summary_food_name", {"food_name": listing["food_name"] or ""},
+           {"listing_count": sign, "claim_count": sign * claim_count})
+    if not listing["completed"]:
+        yield ("summary_unclaimed",
+               {"provider_id": listing["provider_id"] or 0, "location": listing["location"] or "",
+                "meal_type": listing["meal_type"] or ""},
+               {"listing_count": sign, "total_quantity": sign * quantity})
+
+
+def _apply_listing(cursor, listing, sign):
+    for table, keys, deltas in _listing_deltas(listing, sign):
+        _upsert(cursor, table, keys, deltas)
+
+
+def returned_listing(cursor):
+    """The row produced by ``INSERT/UPDATE ... RETURNING *`` on food_listings, as a dict."""
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([desc[0] for desc in cursor.description], row))
+
+
+def lock_listing(cursor, food_id):
+    """Lock a listing before UPDATE/DELETE and capture its current state (including claims)."""
+    cursor.execute("SELECT * FROM food_listings WHERE food_id = %s FOR UPDATE", (food_id,))
+    listing = returned_listing(cursor)
+    if listing is not None:
+        listing.update(_claim_state(cursor, food_id))
+    return listing
+
+
+def lock_listings(cursor, food_ids):
+    """Bulk ``lock_listing``: ``{food_id: state}`` for the listings that exist, locked FOR UPDATE."""
+    cursor.execute("""
+        SELECT f.*, COALESCE(s.claim_count, 0) AS claim_count, COALESCE(s.completed, FALSE) AS completed
+        FROM food_listings f
+        LEFT JOIN listing_claim_state s ON s.food_id = f.food_id
+        WHERE f.food_id = ANY(%s)
+        ORDER BY f.food_id
+        FOR UPDATE OF f
+    """, (list(food_ids),))
+    columns = [desc[0] for desc in cursor.description]
+    return {row[0]: dict(zip(columns, row)) for row in cursor.fetchall()}
+
+
+def listing_added(cursor, new):
+    new = dict(new, **_claim_state(cursor, new["food_id"]))
+    _apply_listing(cursor, new, +1)
+
+
+def listing_changed(cursor, old, new):
+    new = dict(new, claim_count=old["claim_count"], completed=old["completed"])
+    _apply_listing(cursor, old, -1)
+    _apply_listing(cursor, new, +1)
+
+
+def listing_removed(cursor, old):
+    _apply_listing(cursor, old, -1)
+
+
+def claims_changed(cursor, food_id, before):
+    """Re-apply a listing after its claims changed; ``before`` comes from ``lock_listing``."""
+    after = dict(before, **_claim_state(cursor, food_id))
+    _apply_listing(cursor, before, -1)
+    _apply_listing(cursor, after, +1)
+
+
+def listings_changed_bulk(cursor, removed=(), added=()):
+    """Bulk form of listing_added/changed/removed: one upsert per summary for a whole batch.
+
+    ``removed`` are old states from ``lock_listings``; ``added`` are new states with
+    their claim state (``claim_count``/``completed``) filled in.
+    """
+    grouped = {}  # summary -> {key values: (key columns, summed deltas)}
+    for listings, sign in ((removed, -1), (added, +1)):
+        for listing in listings:
+            for table, keys, deltas in _listing_deltas(listing, sign):
+                _, totals = grouped.setdefault(table, {}).setdefault(
+                    tuple(keys.values()), (list(keys), dict.fromkeys(deltas, 0)))
+                for col, value in deltas.items():
+                    totals[col] += value
+
+    for table, groups in grouped.items():
+        key_cols, totals = next(iter(groups.values()))
+        delta_cols = list(totals)
+        execute_values(cursor, f"""
+            INSERT INTO {table} ({", ".join(key_cols + delta_cols)}) VALUES %s
+            ON CONFLICT ({", ".join(key_cols)}) DO UPDATE SET
+            {", ".join(f"{col} = {table}.{col} + EXCLUDED.{col}" for col in delta_cols)}
+        """, [key + tuple(totals.values()) for key, (_, totals) in groups.items()])
+        cursor.execute(f"DELETE FROM {table} WHERE listing_count <= 0")
+
+
+def pending_claims_added(cursor, food_ids):
+    """Bulk version of ``claims_changed`` for newly inserted Pending claims (one entry per claim).
+
+    A Pending claim only adds to claim counts; it never changes whether a listing is unclaimed.
+    """
+    for name, column in (("summary_food_type", "food_type"), ("summary_food_name", "food_name")):
+        cursor.execute(f"""
+            INSERT INTO {name} ({column}, listing_count, claim_count)
+            SELECT COALESCE(f.{column}, ''), 0, COUNT(*)
+            FROM unnest(%s::int[]) AS c(food_id)
+            JOIN food_listings f ON f.food_id = c.food_id
+            GROUP BY 1
+            ON CONFLICT ({column}) DO UPDATE SET claim_count = {name}.claim_count + EXCLUDED.claim_count
+        """, (list(food_ids),))
+
+
+# ------------------------ Rebuild / Consistency check ------------------------
+def create_summaries(cursor):
+    cursor.execute(LISTING_CLAIM_STATE_DDL)
+    for ddl, _, _ in SUMMARIES.values():
+        cursor.execute(ddl)
+
+
+def rebuild(conn):
+    """Recompute every summary from scratch in one transaction."""
+    with conn.cursor() as cursor:
+        create_summaries(cursor)
+        for name, (_, _, recompute) in SUMMARIES.items():
+            cursor.execute(f"LOCK TABLE {name} IN EXCLUSIVE MODE")
+            cursor.execute(f"TRUNCATE {name}")
+            cursor.execute(f"INSERT INTO {name} {recompute}")
+    conn.commit()
+
+
+def check(conn):
+    """Return ``{summary: number of rows differing from a full recompute}``."""
+    differences = {}
+    with conn.cursor() as cursor:
+        for name, (_, _, recompute) in SUMMARIES.items():
+            cursor.execute(f"""
+                SELECT COUNT(*) FROM (
+                    (SELECT * FROM {name} EXCEPT ALL ({recompute}))
+                    UNION ALL
+                    (({recompute}) EXCEPT ALL SELECT * FROM {name})
+                ) diff
+            """)
+            differences[name] = cursor.fetchone()[0]
+    conn.rollback()
+    return differences
+
+
+_ensured = False
+
+
+def ensure_summaries():
+    """Create the analytics relations once per process and populate summaries never built before."""
+    global _ensured
+    if _ensured:
+        return
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('summary_provider_type') IS NOT NULL")
+            exists = cursor.fetchone()[0]
+            create_summaries(cursor)
+        conn.commit()
+        if not exists:
+            rebuild(conn)
+    _ensured = True
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "rebuild":
+        with connection() as conn:
+            rebuild(conn)
+        print("Summaries rebuilt.")
+    elif command == "check":
+        with connection() as conn:
+            differences = check(conn)
+        for name, count in differences.items():
+            print(f"{name}: {'OK' if count == 0 else f'{count} rows differ'}")
+        sys.exit(1 if any(differences.values()) else 0)
+    else:
+        print(__doc__)
+        sys.exit(2)
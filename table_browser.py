@@ -0,0 +1,138 @@
+"""Server-side filtering and keyset pagination for the View Tables page.
+
+Filters are turned into a parameterized ``WHERE`` clause so only the visible page
+of rows ever leaves PostgreSQL; slider bounds and filter choices come from small
+aggregate queries instead of a full ``SELECT *``. Pages come back with the compact
+dtypes of table_frames.py.
+"""
+import pandas as pd
+from psycopg2 import sql
+
+import perf
+from table_frames import typed
+
+# Tables that may be browsed, with the primary key used for stable ordering.
+BROWSABLE_TABLES = {
+    "providers": "provider_id",
+    "receivers": "receiver_id",
+    "food_listings": "food_id",
+    "claims": "claim_id",
+}
+
+NUMERIC_TYPES = {"smallint", "integer", "bigint", "numeric", "real", "double precision"}
+DATE_TYPES = {"date", "timestamp without time zone", "timestamp with time zone"}
+
+# Above this many distinct values a column is filtered by text search instead of a multiselect.
+MAX_DISTINCT_VALUES = 200
+
+
+def _check_table(table):
+    if table not in BROWSABLE_TABLES:
+        raise ValueError(f"Unknown table: {table}")
+
+
+def table_columns(conn, table):
+    """Return ``[(column_name, kind), ...]`` where kind is 'numeric', 'date' or 'categorical'."""
+    _check_table(table)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = %s
+            ORDER BY ordinal_position
+        """, (table,))
+        rows = cursor.fetchall()
+
+    columns = []
+    for name, data_type in rows:
+        if data_type in NUMERIC_TYPES:
+            kind = "numeric"
+        elif data_type in DATE_TYPES:
+            kind = "date"
+        else:
+            kind = "categorical"
+        columns.append((name, kind))
+    return columns
+
+
+def column_bounds(conn, table, column):
+    """MIN/MAX of a numeric or date column."""
+    _check_table(table)
+    query = sql.SQL("SELECT MIN({col}), MAX({col}) FROM {table}").format(
+        col=sql.Identifier(column), table=sql.Identifier(table))
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        return cursor.fetchone()
+
+
+def distinct_values(conn, table, column, limit=MAX_DISTINCT_VALUES):
+    """Distinct values of a column, or ``None`` when there are more than ``limit``."""
+    _check_table(table)
+    query = sql.SQL("SELECT DISTINCT {col} FROM {table} WHERE {col} IS NOT NULL ORDER BY {col} LIMIT %s").format(
+        col=sql.Identifier(column), table=sql.Identifier(table))
+    with conn.cursor() as cursor:
+        cursor.execute(query, (limit + 1,))
+        values = [row[0] for row in cursor.fetchall()]
+    return None if len(values) > limit else values
+
+
+def build_where(filters):
+    """Turn filter tuples into a ``(sql.Composable, params)`` WHERE clause.
+
+    Supported filters:
+        ("range", column, low, high)       -> column BETWEEN low AND high
+        ("date_range", column, day, day)   -> whole days, also for timestamp columns
+        ("in", column, values)             -> column = ANY(values)
+        ("contains", column, text)         -> column::text ILIKE '%text%'
+    """
+    clauses, params = [], []
+    for kind, column, *args in filters:
+        col = sql.Identifier(column)
+        if kind == "range":
+            clauses.append(sql.SQL("{} BETWEEN %s AND %s").format(col))
+            params.extend(args)
+        elif kind == "date_range":
+            clauses.append(sql.SQL("{col} >= %s AND {col} < %s::date + 1").format(col=col))
+            params.extend(args)
+        elif kind == "in":
+            clauses.append(sql.SQL("{} = ANY(%s)").format(col))
+            params.append(list(args[0]))
+        elif kind == "contains":
+            clauses.append(sql.SQL("{}::text ILIKE %s").format(col))
+            params.append(f"%{args[0]}%")
+        else:
+            raise ValueError(f"Unknown filter kind: {kind}")
+
+    if not clauses:
+        return sql.SQL("TRUE"), params
+    return sql.SQL(" AND ").join(clauses), params
+
+
+def count_rows(conn, table, filters):
+    _check_table(table)
+    where, params = build_where(filters)
+    query = sql.SQL("SELECT COUNT(*) FROM {table} WHERE {where}").format(
+        table=sql.Identifier(table), where=where)
+    with conn.cursor() as cursor, perf.timer("count"):
+        cursor.execute(query, params)
+        return cursor.fetchone()[0]
+
+
+def fetch_page(conn, table, filters, page_size, after_key=None):
+    """Fetch one page ordered by primary key, starting after ``after_key`` (keyset pagination)."""
+    _check_table(table)
+    key = BROWSABLE_TABLES[table]
+    where, params = build_where(filters)
+    if after_key is not None:
+        where = sql.SQL("{} AND {} > %s").format(where, sql.Identifier(key))
+        params = params + [after_key]
+    query = sql.SQL("SELECT * FROM {table} WHERE {where} ORDER BY {key} LIMIT %s").format(
+        table=sql.Identifier(table), where=where, key=sql.Identifier(key))
+
+    with conn.cursor() as cursor:
+        with perf.timer("execute"):
+            cursor.execute(query, params + [page_size])
+            rows = cursor.fetchall()
+        with perf.timer("frame"):
+            columns = [desc[0] for desc in cursor.description]
+            return typed(pd.DataFrame(rows, columns=columns), table)
@@ -0,0 +1,224 @@
+"""Compact, typed DataFrames of the four base tables.
+
+Read as they are, the tables keep every text column as strings (one Python object
+per cell before pandas 3), IDs and quantities as int64, and dates as strings from
+the CSVs or ``datetime.date`` objects from PostgreSQL. ``typed`` converts a frame
+of one of the tables, with the database's lower-case columns or the CSV's:
+
+* the ``categories`` of schema.py become categoricals: with their fixed vocabulary
+  (types, Food_Type, Meal_Type, Status) or the values present (cities, food names);
+  categories are sorted, so sorting and comparisons order them as the strings did,
+* the INT columns become int32, or nullable Int32 when they hold NULLs,
+* date and timestamp columns, including those migrations added, become
+  datetime64, parsed once here.
+
+The View Tables pages, ``load_csv`` and ``load_table`` return typed frames; see
+``python table_frames.py bench`` for what the dtypes save.
+
+Usage:
+    python table_frames.py memory [table ...]
+    python table_frames.py bench [--rows 10000000]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from db import connection
+from schema import TABLES
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOAD_CHUNK_ROWS = 100_000   # rows typed at a time while loading, bounds the untyped copy
+
+
+# ------------------------ Typing ------------------------
+def _columns(df, names):
+    """``{name: column of df}`` for the schema ``names`` present in ``df``, whatever their case."""
+    present = {column.lower(): column for column in df.columns}
+    return {name: present[name.lower()] for name in names if name.lower() in present}
+
+
+def typed(df, table):
+    """``df``, rows of ``table``, with the compact dtypes described above; ``df`` itself is left as it is."""
+    spec = TABLES[table]
+    df = df.copy(deep=False)
+    for name, column in _columns(df, spec["categories"]).items():
+        values = df[column]
+        present = values.cat.categories if isinstance(values.dtype, pd.CategoricalDtype) else values.dropna().unique()
+        categories = sorted(set(spec["categories"][name] or ()).union(present))
+        df[column] = values.astype(pd.CategoricalDtype(categories))
+    for column in _columns(df, spec["integers"]).values():
+        values = df[column]
+        if pd.api.types.is_integer_dtype(values.dtype) and not values.hasnans:
+            df[column] = values.astype("int32")
+        else:
+            df[column] = pd.to_numeric(values).astype("Int32")
+    for name, column in _columns(df, spec["dates"]).items():
+        values = df[column]
+        if not pd.api.types.is_datetime64_any_dtype(values.dtype):
+            if pd.api.types.infer_dtype(values, skipna=True) == "string":
+                # Strings in the CSV's format. Each distinct one is parsed once: dates and
+                # timestamps to the minute repeat a lot, and strptime is the slow part
+                codes, uniques = pd.factorize(values)
+                parsed = pd.to_datetime(uniques, format=spec["dates"][name])
+                df[column] = pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=df.index)
+            else:
+                # date / datetime objects from PostgreSQL
+                df[column] = pd.to_datetime(values)
+    for column in _columns(df, spec["timestamps"]).values():
+        if not pd.api.types.is_datetime64_any_dtype(df[column].dtype):
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def date_only(df, table):
+    """Columns of ``df`` that hold DATEs (as midnight datetime64) rather than timestamps."""
+    dates = TABLES[table]["dates"]
+    return [column for name, column in _columns(df, dates).items() if "%H" not in dates[name]]
+
+
+def _concat(frames):
+    """Typed chunks of one table as one frame; categoricals get the union of their categories."""
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[column] = pd.Series(union_categoricals(parts, sort_categories=True), name=column)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+# ------------------------ Loading ------------------------
+def load_csv(table, directory=SOURCE_DIR):
+    """A table's ``*_data.csv`` as a typed frame; categorical columns never exist as strings."""
+    spec = TABLES[table]
+    df = pd.read_csv(os.path.join(directory, spec["csv"]), dtype={name: "category" for name in spec["categories"]})
+    return typed(df, table)
+
+
+def load_table(table, chunk_rows=LOAD_CHUNK_ROWS):
+    """A whole table from PostgreSQL as a typed frame, typed chunk by chunk as the rows arrive."""
+    key = TABLES[table]["primary_key"].lower()
+    chunks = []
+    with connection() as conn:
+        with conn.cursor(name=f"load_{table}") as cursor:
+            cursor.itersize = chunk_rows
+            cursor.execute(f"SELECT * FROM {table} ORDER BY {key}")
+            rows = cursor.fetchmany(chunk_rows)
+            # A named cursor only describes its columns once the first FETCH ran
+            columns = [desc[0] for desc in cursor.description]
+            # The first chunk is kept even when empty, so an empty table still has its columns
+            chunks.append(typed(pd.DataFrame(rows, columns=columns), table))
+            while len(rows) == chunk_rows:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                chunks.append(typed(pd.DataFrame(rows, columns=columns), table))
+        conn.rollback()
+    return _concat(chunks)
+
+
+# ------------------------ Benchmark ------------------------
+def _megabytes(df):
+    return df.memory_usage(index=True, deep=True).sum() / 1024 / 1024
+
+
+def _best_ms(operation, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def _scaled(table, rows, rng):
+    """``rows`` rows sampled from a shipped CSV as ``{variant: frame}``, with unique IDs.
+
+    "object": text as Python strings, as pandas before 3 reads it; "str": pandas' string
+    dtype; "typed": ``typed``. Dates stay unparsed in the first two, as read_csv leaves them.
+    """
+    source = pd.read_csv(os.path.join(SOURCE_DIR, TABLES[table]["csv"]))
+    picks = rng.integers(0, len(source), rows)
+    key = TABLES[table]["primary_key"]
+    variants = {}
+    for variant, frame in (("object", source.astype({c: object for c in source.select_dtypes("string")})),
+                           ("str", source)):
+        variants[variant] = frame.iloc[picks].reset_index(drop=True).assign(**{key: np.arange(1, rows + 1)})
+    started = time.perf_counter()
+    variants["typed"] = typed(variants["str"], table)
+    return variants, time.perf_counter() - started
+
+
+def _since(df, column, table, day="2025-03-15"):
+    # Unparsed dates are parsed on every filter; typed ones were parsed once
+    values = df[column]
+    if not pd.api.types.is_datetime64_any_dtype(values.dtype):
+        values = pd.to_datetime(values, format=TABLES[table]["dates"][column])
+    return df[values >= pd.Timestamp(day)]
+
+
+def bench(rows):
+    """Memory and filter timings of ``rows`` listings and ``rows`` claims in each representation."""
+    rng = np.random.default_rng(42)
+    food_ids = rng.integers(1, rows + 1, 1000)
+    operations = {
+        "food_listings": {
+            "Meal_Type.isin([Lunch, Dinner])": lambda df: df[df["Meal_Type"].isin(["Lunch", "Dinner"])],
+            "Location.isin(20 cities)": lambda df: df[df["Location"].isin(df["Location"].iloc[:20].tolist())],
+            "Food_Type == 'Vegan'": lambda df: df[df["Food_Type"] == "Vegan"],
+            "Quantity by Provider_Type": lambda df: df.groupby("Provider_Type")["Quantity"].sum(),
+            "Expiry_Date >= 2025-03-15": lambda df: _since(df, "Expiry_Date", "food_listings"),
+        },
+        "claims": {
+            "Status == 'Pending'": lambda df: df[df["Status"] == "Pending"],
+            "Status.isin([Pending, Completed])": lambda df: df[df["Status"].isin(["Pending", "Completed"])],
+            "Food_ID.isin(1,000 IDs)": lambda df: df[df["Food_ID"].isin(food_ids)],
+            "Claims by Status": lambda df: df.groupby("Status").size(),
+            "Timestamp >= 2025-03-15": lambda df: _since(df, "Timestamp", "claims"),
+        },
+    }
+    for table, table_operations in operations.items():
+        variants, typing = _scaled(table, rows, rng)
+        print(f"{table}: {rows:,} rows, typed in {typing:.1f}s")
+        print(f"  {'':36}" + "".join(f"{variant:>10}" for variant in variants))
+        print(f"  {'memory, MB':36}" + "".join(f"{_megabytes(df):10.0f}" for df in variants.values()))
+        for label, operation in table_operations.items():
+            print(f"  {label + ', ms':36}" + "".join(f"{_best_ms(lambda: operation(df)):10.1f}"
+                                                     for df in variants.values()))
+        del variants
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Typed, compact DataFrames of the base tables.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    memory_parser = sub.add_parser("memory", help="load tables from PostgreSQL and compare their memory")
+    memory_parser.add_argument("tables", nargs="*", default=list(TABLES))
+    bench_parser = sub.add_parser("bench", help="memory and filter timings on sampled rows")
+    bench_parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    if args.command == "memory":
+        for table in args.tables:
+            if table not in TABLES:
+                parser.error(f"unknown table {table}; choose from {', '.join(TABLES)}")
+            frame = load_table(table)
+            with connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"SELECT * FROM {table}")
+                plain = pd.DataFrame(cursor.fetchall(), columns=[desc[0] for desc in cursor.description])
+                conn.rollback()
+            print(f"{table}: {len(frame):,} rows, {_megabytes(plain):.1f} MB as read, "
+                  f"{_megabytes(frame):.1f} MB typed")
+    else:
+        bench(args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Daily / hourly time series of claims and waste for the Trends page.
+
+Claims are bucketed by their Timestamp and expired listings by their
+Expiry_Date with ``date_trunc`` in PostgreSQL, one row per (bucket, city,
+provider type), so only the aggregates leave the database. Gap filling, the
+breakdown by city or provider type and the rolling windows are then computed
+in pandas on whole columns at once:
+
+* claims: claims per bucket,
+* completion rate: Completed claims / claims over the rolling window,
+* completion latency: hours from a listing's ``listed_at`` to its Completed claims
+  (``listed_at`` is recorded since migration 8; older listings are left out),
+* lead time: hours left before the end of the Expiry_Date when a claim was made,
+* wasted quantity: quantity of listings past their Expiry_Date without a Completed claim.
+
+A ``SeriesStore`` keeps the bucketed rows for one frequency per process. A
+refresh re-reads only the buckets from the last one it holds (which may have
+been partial) onwards and appends them. It rebuilds from scratch when this
+process wrote to claims or food_listings since (an edit can change any past
+bucket), and every ``TREND_REBUILD`` seconds for writes made elsewhere. While
+the live_updates.py listener is connected it goes by the changes it reports
+instead, from any process: new Pending claims and new listings that haven't
+expired only touch the latest buckets, so they are appended on the next view
+rather than waiting for ``TREND_REFRESH``, and updates of columns the series
+don't read are ignored; any other change rebuilds.
+
+Usage:
+    python timeseries.py show [--freq day|hour] [--by city|provider_type] [--window N]
+"""
+import argparse
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import pandas as pd
+
+from live_updates import get_listener
+from query_cache import get_cache
+from query_runner import run_query
+
+TREND_REFRESH = float(os.environ.get("FOOD_WASTE_TREND_REFRESH", "60"))   # seconds a refreshed store is reused
+TREND_REBUILD = 3600                                                       # seconds between full rebuilds
+TOP_GROUPS = 8                                                             # cities / provider types charted by name
+
+# unit -> (date_trunc field, pandas frequency, default rolling window in buckets)
+FREQUENCIES = {"day": ("day", "D", 7), "hour": ("hour", "h", 24)}
+SOURCES = ("claims", "food_listings")
+# Columns the series are computed from; updates to other columns (remaining_quantity) leave them as they are
+READ_COLUMNS = {"claims": {"food_id", "status", "timestamp"},
+                "food_listings": {"food_id", "quantity", "expiry_date", "location", "provider_type", "listed_at"}}
+CLAIM_COLUMNS = ["claims", "completed", "timed", "latency_hours", "lead_hours"]
+
+CLAIMS_SQL = """
+    SELECT date_trunc(%(field)s, c.timestamp) AS bucket,
+           f.location AS city,
+           f.provider_type,
+           COUNT(*) AS claims,
+           COUNT(*) FILTER (WHERE c.status = 'Completed') AS completed,
+           COUNT(f.listed_at) FILTER (WHERE c.status = 'Completed') AS timed,
+           COALESCE(SUM(EXTRACT(EPOCH FROM c.timestamp - f.listed_at))
+                    FILTER (WHERE c.status = 'Completed'), 0)::float8 / 3600 AS latency_hours,
+           SUM(EXTRACT(EPOCH FROM (f.expiry_date + 1) - c.timestamp))::float8 / 3600 AS lead_hours
+    FROM claims c
+    JOIN food_listings f ON f.food_id = c.food_id
+    WHERE c.timestamp >= %(since)s
+    GROUP BY 1, 2, 3
+"""
+
+# Expiry_Date is a date, so waste is bucketed by day whatever the frequency
+WASTE_SQL = """
+    SELECT f.expiry_date::timestamp AS bucket,
+           f.location AS city,
+           f.provider_type,
+           COUNT(*) AS listings,
+           SUM(f.quantity)::BIGINT AS quantity
+    FROM food_listings f
+    WHERE f.expiry_date < CURRENT_DATE
+      AND f.expiry_date >= %(since)s
+      AND NOT EXISTS (SELECT 1 FROM claims c WHERE c.food_id = f.food_id AND c.status = 'Completed')
+    GROUP BY 1, 2, 3
+"""
+
+
+# ------------------------ Bucketed rows ------------------------
+class SeriesStore:
+    def __init__(self, unit):
+        self.unit = unit
+        self.field = FREQUENCIES[unit][0]
+        self._lock = threading.Lock()
+        self.claims = None
+        self.waste = None
+        self._generation = None
+        self._rebuild = False  # set by a reported change that an append would miss
+        self._built_at = self._refreshed_at = 0.0
+        self.last_refresh = None  # {"mode": "full" / "append", "rows": rows read, "ms": ...}
+
+    def changed(self, change):
+        """Live update handler: note a change to claims or food_listings from any process."""
+        if change["table"] not in SOURCES:
+            return
+        if change["op"] == "U" and not READ_COLUMNS[change["table"]].intersection(change.get("columns", READ_COLUMNS)):
+            return
+        if change["op"] != "I" or "rows" not in change:
+            self._rebuild = True
+        elif change["table"] == "claims":
+            # A Completed claim takes its listing out of past waste buckets
+            self._rebuild = self._rebuild or any(row["status"] == "Completed" for row in change["rows"])
+        else:
+            today = date.today().isoformat()
+            self._rebuild = self._rebuild or any((row["expiry_date"] or today) < today for row in change["rows"])
+        self._refreshed_at = 0.0
+
+    def _read(self, sql, since):
+        df = run_query(sql, params={"field": self.field, "since": since})
+        df["bucket"] = pd.to_datetime(df["bucket"])
+        return df
+
+    def _append(self, held, sql):
+        """``held`` with its last bucket onwards replaced by a fresh read."""
+        since = held["bucket"].max() if len(held) else datetime.min
+        new = self._read(sql, since)
+        return pd.concat([held[held["bucket"] < since], new], ignore_index=True), len(new)
+
+    def refresh(self, force=False):
+        """Bring the store up to date (at most every TREND_REFRESH seconds unless ``force``); returns self."""
+        live = get_listener().connected
+        generation = get_cache().generation(SOURCES)
+        with self._lock:
+            now = time.monotonic()
+            stale = self._rebuild if live else generation != self._generation
+            full = self.claims is None or stale or now - self._built_at > TREND_REBUILD
+            if not full and not force and now - self._refreshed_at < TREND_REFRESH:
+                return self
+            started = time.perf_counter()
+            if full:
+                self._rebuild = False  # before reading, so a change reported meanwhile isn't lost
+                self.claims = self._read(CLAIMS_SQL, datetime.min)
+                self.waste = self._read(WASTE_SQL, datetime.min)
+                rows = len(self.claims) + len(self.waste)
+                self._generation, self._built_at = generation, now
+            else:
+                self.claims, claim_rows = self._append(self.claims, CLAIMS_SQL)
+                self.waste, waste_rows = self._append(self.waste, WASTE_SQL)
+                rows = claim_rows + waste_rows
+            self._refreshed_at = now
+            self.last_refresh = {"mode": "full" if full else "append", "rows": rows,
+                                 "ms": (time.perf_counter() - started) * 1000}
+        return self
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(unit="day"):
+    with _stores_lock:
+        if unit not in _stores:
+            _stores[unit] = SeriesStore(unit)
+            get_listener().on_change(_stores[unit].changed)
+    return _stores[unit]
+
+
+# ------------------------ Series ------------------------
+def _grouped(frame, by, weight, top=TOP_GROUPS):
+    """``frame`` with a ``group`` column: the ``top`` values of ``by`` by total ``weight``, the rest "Other"."""
+    if by is None:
+        return frame.assign(group="All")
+    leaders = frame.groupby(by)[weight].sum().nlargest(top).index
+    return frame.assign(group=frame[by].where(frame[by].isin(leaders), "Other"))
+
+
+def _grid(frame, columns, freq):
+    """``columns`` summed per bucket and group, with a row for every bucket in range (0 when empty)."""
+    table = frame.pivot_table(index="bucket", columns="group", values=columns, aggfunc="sum", fill_value=0)
+    buckets = pd.date_range(frame["bucket"].min(), frame["bucket"].max(), freq=freq)
+    return table.reindex(buckets, fill_value=0)
+
+
+def trends(store, by=None, window=None, top=TOP_GROUPS):
+    """Chartable series from ``store``: ``{name: DataFrame indexed by bucket, one column per group}``.
+
+    ``by`` is None (one "All" column), ``"city"`` or ``"provider_type"``; ``window`` is the rolling
+    window in buckets (7 days / 24 hours by default).
+    """
+    _, freq, default_window = FREQUENCIES[store.unit]
+    window = window or default_window
+    series = {}
+    claims = store.claims
+    if claims is not None and len(claims):
+        table = _grid(_grouped(claims, by, "claims", top), CLAIM_COLUMNS, freq)
+        rolling = table.rolling(window, min_periods=1).sum()
+        series["claims"] = table["claims"]
+        series["completion_rate"] = (rolling["completed"] / rolling["claims"]).where(rolling["claims"] > 0)
+        series["latency_hours"] = (rolling["latency_hours"] / rolling["timed"]).where(rolling["timed"] > 0)
+        series["lead_hours"] = (rolling["lead_hours"] / rolling["claims"]).where(rolling["claims"] > 0)
+    waste = store.waste
+    if waste is not None and len(waste):
+        series["wasted_quantity"] = _grid(_grouped(waste, by, "quantity", top), ["quantity"], "D")["quantity"]
+    return series
+
+
+# ------------------------ CLI ------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Claims throughput and waste trends.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show_parser = sub.add_parser("show")
+    show_parser.add_argument("--freq", choices=list(FREQUENCIES), default="day")
+    show_parser.add_argument("--by", choices=["city", "provider_type"], default=None)
+    show_parser.add_argument("--window", type=int, default=None, help="rolling window in buckets")
+    args = parser.parse_args()
+
+    store = get_store(args.freq).refresh()
+    print(f"Read {store.last_refresh['rows']:,} bucket rows in {store.last_refresh['ms']:.0f} ms")
+    for name, df in trends(store, by=args.by, window=args.window).items():
+        print(f"\n{name}:\n{df.tail(10).round(2).to_string()}")
+    store.refresh(force=True)
+    print(f"\nIncremental refresh: {store.last_refresh['rows']:,} rows in {store.last_refresh['ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()